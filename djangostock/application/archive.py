@@ -0,0 +1,167 @@
+"""
+Cold storage for old bars. With TIME_SERIES_ARCHIVE_AFTER_DAYS set, ``compact`` moves the bars of a stock
+older than that out of StockTimeSeries into the stock's ArchivedTimeSeries: a zstd-compressed Parquet block
+per year, a fraction of the size of the rows and their indexes, each decoded in one piece for long-range
+reads. A stock's latest bar always stays in StockTimeSeries, where the readers of the latest bars look.
+
+``history`` reads bars from both tiers and is what anything reading more than the latest bars should use.
+"""
+import datetime
+import io
+from collections import defaultdict
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from djangostock.application.models import ArchivedTimeSeries, StockTimeSeries
+
+COLUMNS = ["recorded_date", "open", "high", "low", "close", "volume"]
+SCHEMA = pa.schema(
+    [
+        ("recorded_date", pa.date32()),
+        ("open", pa.float64()),
+        ("high", pa.float64()),
+        ("low", pa.float64()),
+        ("close", pa.float64()),
+        ("volume", pa.int32()),
+    ]
+)
+# Dates and volumes are stored as deltas, prices with their bytes split by significance, both compress better
+ENCODINGS = {
+    "recorded_date": "DELTA_BINARY_PACKED",
+    "open": "BYTE_STREAM_SPLIT",
+    "high": "BYTE_STREAM_SPLIT",
+    "low": "BYTE_STREAM_SPLIT",
+    "close": "BYTE_STREAM_SPLIT",
+    "volume": "DELTA_BINARY_PACKED",
+}
+
+INTERVALS = ["1day", "1week", "1month"]
+
+
+def archive_horizon(today=None):
+    """Bars before this date belong in the archive, or None when archiving is off."""
+    if not settings.TIME_SERIES_ARCHIVE_AFTER_DAYS:
+        return None
+    return (today or datetime.date.today()) - datetime.timedelta(days=settings.TIME_SERIES_ARCHIVE_AFTER_DAYS)
+
+
+def encode(bars):
+    """Parquet block of ``bars``, dicts with the COLUMNS in date order."""
+    table = pa.Table.from_pylist(bars, schema=SCHEMA)
+    buffer = io.BytesIO()
+    pq.write_table(
+        table,
+        buffer,
+        compression="zstd",
+        use_dictionary=False,
+        column_encoding=ENCODINGS,
+        write_statistics=False,
+    )
+    return buffer.getvalue()
+
+
+def decode(data, start=None, end=None):
+    """The bars of a Parquet block from ``start`` to ``end`` included, as dicts with the COLUMNS."""
+    table = pq.read_table(io.BytesIO(data))
+    if start:
+        table = table.filter(pc.greater_equal(table["recorded_date"], pa.scalar(start, pa.date32())))
+    if end:
+        table = table.filter(pc.less_equal(table["recorded_date"], pa.scalar(end, pa.date32())))
+    return table.to_pylist()
+
+
+def compact(stock, before):
+    """
+    Move the bars of ``stock`` before ``before`` into its archive blocks, but its latest bar. Only the blocks
+    of the years the moved bars fall in are rewritten: a daily run rewrites the block of the horizon's year,
+    and earlier years stay sealed unless a backfill adds bars to them. A bar also in a block, e.g. from such
+    a backfill, replaces the archived one. Returns how many bars were moved.
+    """
+    with transaction.atomic():
+        live = StockTimeSeries.objects.filter(stock=stock)
+        latest = live.aggregate(latest=Max("recorded_date"))["latest"]
+        if latest is None:
+            return 0
+        # Stock.latest_time_series and fast_serializers.latest_bars read from last_update_date on
+        keep_from = min(latest, stock.last_update_date or latest)
+        live = live.filter(recorded_date__lt=min(before, keep_from))
+        moved = list(live.order_by("recorded_date").values(*COLUMNS))
+        if not moved:
+            return 0
+
+        by_year = defaultdict(list)
+        for bar in moved:
+            by_year[bar["recorded_date"].year].append(bar)
+        blocks = ArchivedTimeSeries.objects.select_for_update().filter(stock=stock, year__in=list(by_year))
+        archived = {block.year: block for block in blocks}
+        for year, year_bars in by_year.items():
+            bars = {bar["recorded_date"]: bar for bar in (decode(archived[year].data) if year in archived else [])}
+            bars.update((bar["recorded_date"], bar) for bar in year_bars)
+            bars = [bars[day] for day in sorted(bars)]
+            ArchivedTimeSeries.objects.update_or_create(
+                stock=stock,
+                year=year,
+                defaults={
+                    "start_date": bars[0]["recorded_date"],
+                    "end_date": bars[-1]["recorded_date"],
+                    "rows": len(bars),
+                    "data": encode(bars),
+                },
+            )
+        live.delete()
+    return len(moved)
+
+
+def history(stock, start=None, end=None):
+    """The bars of ``stock`` from ``start`` to ``end`` included (all by default), oldest first, from both tiers."""
+    bars = {}
+    archives = ArchivedTimeSeries.objects.filter(stock=stock)
+    if start:
+        archives = archives.filter(end_date__gte=start)
+    if end:
+        archives = archives.filter(start_date__lte=end)
+    for archive in archives:
+        bars.update((bar["recorded_date"], bar) for bar in decode(archive.data, start, end))
+
+    live = StockTimeSeries.objects.filter(stock=stock)
+    if start:
+        live = live.filter(recorded_date__gte=start)
+    if end:
+        live = live.filter(recorded_date__lte=end)
+    # Until the next compaction, a bar stored after the last one can also be in the archive
+    bars.update((bar["recorded_date"], bar) for bar in live.values(*COLUMNS))
+    return [bars[day] for day in sorted(bars)]
+
+
+def _period(day, interval):
+    if interval == "1week":
+        return day - datetime.timedelta(days=day.weekday())
+    if interval == "1month":
+        return day.replace(day=1)
+    return day
+
+
+def resample(bars, interval):
+    """
+    OHLCV bars of ``interval`` (see INTERVALS) out of daily ``bars`` in date order, each dated by the first
+    day of its week or month.
+    """
+    if interval == "1day":
+        return bars
+    periods = {}
+    for bar in bars:
+        period = _period(bar["recorded_date"], interval)
+        if period not in periods:
+            periods[period] = dict(bar, recorded_date=period)
+            continue
+        merged = periods[period]
+        merged["high"] = max(merged["high"], bar["high"])
+        merged["low"] = min(merged["low"], bar["low"])
+        merged["close"] = bar["close"]
+        merged["volume"] += bar["volume"]
+    return list(periods.values())
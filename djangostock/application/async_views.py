@@ -0,0 +1,189 @@
+"""
+Async variants of the hot endpoints, for ASGI servers: StockPrices, Home, StockFollow and StockHistory. They
+answer the same requests with the same responses; ASYNC_VIEWS routes their URLs here.
+
+DRF 3.14 only dispatches sync handlers, so AsyncAPIView runs authentication, permissions and throttling in
+one trip to a thread and awaits the handler. Single queries go through Django's async ORM. Helpers shared
+with the sync views, the session, templates and the write paths run with sync_to_async. In Django 4.2 the
+async ORM also runs its queries in the request's thread.
+"""
+import asyncio
+import datetime
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.shortcuts import render
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import archive, fast_serializers, versions
+from .models import Follow, Stock
+from .routers import replica_reads
+from .serializers import FollowSerializer, StockHistoryQuerySerializer
+from .views import StockPricePagination, stocks_by_latest_volume
+
+
+def cache_control(**kwargs):
+    """django.views.decorators.cache.cache_control, for async views."""
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapped(request, *args, **kw):
+            response = await view(request, *args, **kw)
+            patch_cache_control(response, **kwargs)
+            return response
+
+        return wrapped
+
+    return decorator
+
+
+def _validators(request, etag_func, last_modified_func, args, kwargs):
+    etag = etag_func(request, *args, **kwargs)
+    last_modified = last_modified_func(request, *args, **kwargs)
+    if last_modified and not timezone.is_aware(last_modified):
+        last_modified = timezone.make_aware(last_modified, datetime.timezone.utc)
+    return (
+        quote_etag(etag) if etag is not None else None,
+        int(last_modified.timestamp()) if last_modified else None,
+    )
+
+
+def condition(etag_func, last_modified_func):
+    """django.views.decorators.http.condition, for async views. The validators are computed in a thread."""
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            etag, last_modified = await sync_to_async(_validators)(
+                request, etag_func, last_modified_func, args, kwargs
+            )
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if request.method in ("GET", "HEAD"):
+                if last_modified and not response.has_header("Last-Modified"):
+                    response.headers["Last-Modified"] = http_date(last_modified)
+                if etag:
+                    response.headers.setdefault("ETag", etag)
+            return response
+
+        return wrapped
+
+    return decorator
+
+
+class AsyncAPIView(APIView):
+    """APIView with ``async def`` handlers."""
+
+    # Django 4.2's method_decorator hides that a handler is a coroutine function
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # Authentication looks the user up
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            # OPTIONS stays sync
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncStockPricePagination(StockPricePagination):
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset, with the count and the rows of the page queried through the async ORM."""
+        # Paginating the indexes validates the page number and sets up the links, without a query
+        indexes = self.paginate_queryset(range(await queryset.acount()), request, view)
+        if not indexes:
+            return indexes
+        first, stop = indexes[0], indexes[-1] + 1
+        return [row async for row in queryset[first:stop]]
+
+
+class AsyncStockPrices(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
+
+    @method_decorator(cache_control(private=True, no_cache=True))
+    @method_decorator(condition(etag_func=versions.prices_etag, last_modified_func=versions.prices_last_modified))
+    @method_decorator(replica_reads)
+    async def get(self, request, format=None):
+        stocks = stocks_by_latest_volume(Stock.objects.filter(last_update_date__isnull=False))
+        paginator = AsyncStockPricePagination()
+        page = await paginator.apaginate_queryset(stocks, request, self)
+        if page is not None:
+            return paginator.get_paginated_response(await sync_to_async(fast_serializers.stocks)(page))
+        return Response(await sync_to_async(fast_serializers.stocks)([row async for row in stocks]))
+
+
+class AsyncStockFollow(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
+
+    async def post(self, request, format=None):
+        data = request.data
+        data["user"] = request.user.pk
+        serializer = FollowSerializer(data=data)
+        if not await sync_to_async(serializer.is_valid)():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        await sync_to_async(serializer.save)()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    async def delete(self, request, format=None):
+        if not await sync_to_async(Follow.objects.unfollow)(request.user, [request.data["stock"]]):
+            return Response({"error": "Not following."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class AsyncStockHistory(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
+
+    @method_decorator(replica_reads)
+    async def get(self, request, format=None):
+        query = StockHistoryQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            stock = await Stock.objects.aget(symbol=query.validated_data["symbol"])
+        except Stock.DoesNotExist:
+            raise Http404
+        bars = await sync_to_async(archive.history)(
+            stock, query.validated_data.get("start"), query.validated_data.get("end")
+        )
+        return Response(fast_serializers.bars(archive.resample(bars, query.validated_data["interval"])))
+
+
+class AsyncHome(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
+
+    @method_decorator(cache_control(private=True, no_cache=True))
+    @method_decorator(condition(etag_func=versions.home_etag, last_modified_func=versions.home_last_modified))
+    @method_decorator(replica_reads)
+    async def get(self, request):
+        rows = [row async for row in request.user.follows.values(*fast_serializers.STOCK_VALUES)]
+        return await sync_to_async(self.render_home)(request, rows)
+
+    def render_home(self, request, rows):
+        # The session and the template context processors are sync
+        request.session["ws_user"] = request.user.id
+        return render(request, "home.html", {"stocks": fast_serializers.stocks(rows)})
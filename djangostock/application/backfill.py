@@ -0,0 +1,99 @@
+"""
+Historical backfill for ``manage.py backfill``. Each stock's history is cut into date windows. A window is
+fetched in one request, stored in one transaction and checkpointed as a BackfillWindow, so an interrupted
+backfill resumes where it stopped and windows can be spread over several processes.
+"""
+import datetime
+
+from celery.utils import uuid
+from django.conf import settings
+from django.db import transaction
+
+from djangostock.application import twelvedata
+from djangostock.application.ingest import parse_bars, store_bars
+from djangostock.application.locks import get_lock_backend, symbol_lock_key
+from djangostock.application.metrics import BARS_WRITTEN
+from djangostock.application.models import BackfillWindow, Stock, StockTimeSeries
+
+# TwelveData's largest outputsize, more than the trading days of any window
+MAX_OUTPUTSIZE = 5000
+
+# Outcomes of backfill_window
+DONE = "done"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+
+def years_before(day, years):
+    """The same date ``years`` years before ``day``; February 29 becomes the 28th in a common year."""
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        return day.replace(year=day.year - years, day=28)
+
+
+def windows(start, end, days):
+    """Consecutive windows of ``days`` days covering ``start`` to ``end``, as (start, end) with both ends included."""
+    while start <= end:
+        window_end = min(start + datetime.timedelta(days=days - 1), end)
+        yield start, window_end
+        start = window_end + datetime.timedelta(days=1)
+
+
+def pending_windows(symbols, start, end, days):
+    """
+    (symbol, start, end) of every window of ``symbols`` without a checkpoint. Windows of one symbol are
+    spread apart so that parallel workers rarely contend for the same symbol's lock.
+    """
+    done = set(
+        BackfillWindow.objects.filter(stock__symbol__in=symbols, start_date__gte=start, end_date__lte=end).values_list(
+            "stock__symbol", "start_date", "end_date"
+        )
+    )
+    return [
+        (symbol, window_start, window_end)
+        for window_start, window_end in windows(start, end, days)
+        for symbol in symbols
+        if (symbol, window_start, window_end) not in done
+    ]
+
+
+def backfill_window(symbol, start, end):
+    """Fetch and store the bars of ``symbol`` from ``start`` to ``end``. Returns (outcome, rows stored)."""
+    token = uuid()
+    key = symbol_lock_key(symbol)
+    lock = get_lock_backend()
+    if not lock.acquire(key, token, settings.UPDATE_TIME_SERIES_LOCK_TTL):
+        return SKIPPED, 0  # Being refreshed right now; the next backfill run picks the window up
+    try:
+        query_params = {
+            "symbol": symbol,
+            "apikey": settings.API_KEY_TWELVEDATA,
+            "interval": "1day",
+            "start_date": start.isoformat(),
+            "end_date": end.isoformat(),
+            "outputsize": MAX_OUTPUTSIZE,
+        }
+        try:
+            r = twelvedata.get("time_series", query_params)
+            body = r.json()
+        except (twelvedata.UpstreamUnavailable, ValueError):
+            return FAILED, 0
+        if r.status_code == 200 and body.get("status") == "ok":
+            values = body["values"]
+        elif r.status_code == 200 and body.get("code") == 400:
+            values = []  # No bars in the window, e.g. before the listing date
+        else:
+            return FAILED, 0
+
+        with transaction.atomic():
+            stock = Stock.objects.select_for_update().get(symbol=symbol)
+            rows = [row for row in parse_bars(stock, values) if start <= row.recorded_date <= end]
+            # The window is stored whole, replacing whatever a refresh or an interrupted run stored in it
+            StockTimeSeries.objects.filter(stock=stock, recorded_date__range=(start, end)).delete()
+            store_bars(rows)
+            BARS_WRITTEN.labels("backfill").inc(len(rows))
+            BackfillWindow.objects.create(stock=stock, start_date=start, end_date=end, rows=len(rows))
+        return DONE, len(rows)
+    finally:
+        lock.release(key, token)
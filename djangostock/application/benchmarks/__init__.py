@@ -0,0 +1,151 @@
+"""
+Timings of the core paths (prices listing, Home, ingestion, fan-out, serialization) on a synthetic
+universe seeded with the test factories. ``manage.py benchmark`` runs them on a throwaway database and
+emits JSON, so runs on different commits can be compared.
+
+A benchmark is a function registered with ``@benchmark(name)``: it takes the Universe and returns the
+callable to time, having done its own setup.
+"""
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+class Universe:
+    """The seeded stocks and followers; ``users[0]`` follows ``follows`` stocks."""
+
+    def __init__(self, stocks, users, bars, follows):
+        self.stocks = stocks
+        self.users = users
+        self.bars = bars
+        self.follows = follows
+
+    @classmethod
+    def seed(cls, stocks, bars, followers, follows):
+        # The factories look up currencies and countries on import, so only once the database is there
+        from ..tests.factories import seed_universe, setup_test_environment
+
+        setup_test_environment()
+        saved, users = seed_universe(stocks, bars=bars, followers=max(followers, 1), follows=follows)
+        return cls(saved, users, bars, min(follows, stocks))
+
+    def client(self, user=None):
+        """A test client authenticated as ``user``, the first follower by default."""
+        # Imported here, the package is also imported before Django is set up, see benchmarks.asgi
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        return Client(headers={"Authorization": f"Bearer {AccessToken.for_user(user or self.users[0])}"})
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def raise_open_files_limit(wanted):
+    """Raise this process's limit of open files to ``wanted``; the servers it starts inherit it."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        if hard != resource.RLIM_INFINITY and hard < wanted:
+            raise CommandError(f"The run needs {wanted} file descriptors, {hard} allowed.")
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+
+def wait_for_port(host, port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+@contextmanager
+def serve(port, timeout, env=None):
+    """
+    Serve benchmarks.asgi from a Daphne process on ``port`` for the block, with the current settings
+    and the ``env`` variables. Yields the process.
+    """
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "djangostock.server",
+            "djangostock.application.benchmarks.asgi:application",
+            "-b",
+            "127.0.0.1",
+            "-p",
+            str(port),
+            "-v",
+            "0",
+        ],
+        env={**os.environ, "DJANGO_SETTINGS_MODULE": settings.SETTINGS_MODULE, **(env or {})},
+    )
+    try:
+        if not wait_for_port("127.0.0.1", port, timeout):
+            raise CommandError(f"The server did not listen on port {port}.")
+        yield server
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def percentile(ordered, q):
+    """The ``q`` (0 to 1) percentile of the sorted, non-empty ``ordered``."""
+    return ordered[round(q * (len(ordered) - 1))]
+
+
+def measure(function, repeat):
+    """Times of ``function`` over ``repeat`` runs, in milliseconds, and the queries of one run."""
+    function()  # Warms the reference caches, sessions and connections up
+    with CaptureQueriesContext(connection) as queries:
+        function()
+    # Read now: every request clears the query log this reads from
+    query_count = len(queries)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "repeat": repeat,
+        "queries": query_count,
+        "min_ms": round(timings[0], 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(percentile(timings, 0.95), 3),
+        "max_ms": round(timings[-1], 3),
+    }
+
+
+def run(universe, names=None, repeat=20):
+    """{name: measure() results} of the benchmarks in ``names``, all by default."""
+    from . import paths  # noqa: F401, registers the benchmarks
+
+    return {name: measure(BENCHMARKS[name](universe), repeat) for name in names or BENCHMARKS}
@@ -0,0 +1,45 @@
+"""
+The site plus ``POST /loadtest/update/?stock=<pk>``, which ingests and fans out the next bar of a stock, for
+``manage.py benchmark_websockets`` to serve and trigger updates with. Not for deployment: the endpoint has
+no authentication.
+
+LOADTEST_DB_LATENCY_MS adds that many milliseconds to every query, a stand-in for the round trip to a
+database on another host, for ``manage.py benchmark_concurrency``.
+"""
+import os
+import time
+from urllib.parse import parse_qs
+
+from django.db.backends.signals import connection_created
+
+from asgiref.sync import sync_to_async
+
+from djangostock.asgi import application as site  # Sets Django up, before the models are imported
+
+from .websockets import UPDATE_PATH, push_update
+
+DB_LATENCY = float(os.environ.get("LOADTEST_DB_LATENCY_MS", 0)) / 1000
+
+
+def delay(execute, sql, params, many, context):
+    time.sleep(DB_LATENCY)
+    return execute(sql, params, many, context)
+
+
+def add_db_latency(connection, **kwargs):
+    # First, so the wrappers that execute_wrapper() pushes and pops stay last
+    connection.execute_wrappers.insert(0, delay)
+
+
+if DB_LATENCY:
+    connection_created.connect(add_db_latency)
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "http" and scope["path"] == UPDATE_PATH:
+        stock_id = int(parse_qs(scope["query_string"].decode())["stock"][0])
+        await sync_to_async(push_update)(stock_id)
+        await send({"type": "http.response.start", "status": 204, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+        return
+    await site(scope, receive, send)
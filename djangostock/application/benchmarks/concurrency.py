@@ -0,0 +1,106 @@
+"""
+Concurrency benchmark of the API, run by ``manage.py benchmark_concurrency``: clients, each a user following
+the load test stock, call the endpoints back to back for a while against a Daphne process serving
+benchmarks.asgi. The command runs it against a server with the sync views and one with their async
+variants (ASYNC_VIEWS), and reports the throughput, the latency and the server's threads and memory of each.
+
+A client waits for each response before its next request, so the clients are the requests in flight. The
+follow endpoint writes, run it on a database that takes concurrent writes: SQLite answers "database is
+locked" to most of them.
+"""
+import asyncio
+import time
+
+import httpx
+
+from . import percentile
+from .websockets import SYMBOL, cpu_seconds, rss, threads
+
+FOLLOW_PATH = "/stock/follow/"
+GET_PATHS = {
+    "prices": "/stock/prices/",
+    "home": "/home/",
+    "history": f"/stock/history/?symbol={SYMBOL}",
+}
+ENDPOINTS = [*GET_PATHS, "follow"]
+# Seconds between two reads of the server's thread count
+SAMPLE_INTERVAL = 0.05
+
+
+def requests_for(endpoints, stock_id):
+    """The (method, path, JSON body) a client cycles through to call ``endpoints``."""
+    cycle = []
+    for name in endpoints:
+        if name == "follow":
+            # Unfollowing first leaves the user as seeded after every pair
+            cycle.append(("DELETE", FOLLOW_PATH, {"stock": stock_id}))
+            cycle.append(("POST", FOLLOW_PATH, {"stock": stock_id}))
+        else:
+            cycle.append(("GET", GET_PATHS[name], None))
+    return cycle
+
+
+async def run(base_url, tokens, stock_id, server_pid, endpoints=ENDPOINTS, duration=10, timeout=30):
+    """A client per access token in ``tokens`` calls ``endpoints`` for ``duration`` seconds; report."""
+    cycle = requests_for(endpoints, stock_id)
+    latencies = []
+    statuses = {}
+    peak_threads = threads(server_pid)
+    memory_before = rss(server_pid)
+    cpu_before = cpu_seconds(server_pid)
+    done = asyncio.Event()
+
+    async def client(n, token):
+        headers = {"Authorization": f"Bearer {token}"}
+        async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=timeout) as http:
+            step = n
+            while not done.is_set():
+                method, path, body = cycle[step % len(cycle)]
+                step += 1
+                start = time.perf_counter()
+                try:
+                    response = await http.request(method, path, json=body)
+                    status = response.status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    async def sample_threads():
+        nonlocal peak_threads
+        while not done.is_set():
+            peak_threads = max(peak_threads or 0, threads(server_pid) or 0) or None
+            await asyncio.sleep(SAMPLE_INTERVAL)
+
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(client(n, token)) for n, token in enumerate(tokens)]
+    tasks.append(asyncio.create_task(sample_threads()))
+    await asyncio.sleep(duration)
+    done.set()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    memory_after = rss(server_pid)
+    cpu_after = cpu_seconds(server_pid)
+
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if not isinstance(status, int) or status >= 400)
+    return {
+        "clients": len(tokens),
+        "seconds": round(elapsed, 3),
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "latency_p50_ms": round(percentile(latencies, 0.5), 3) if latencies else None,
+        "latency_p99_ms": round(percentile(latencies, 0.99), 3) if latencies else None,
+        "latency_max_ms": round(latencies[-1], 3) if latencies else None,
+        # Comparable across machines where the clients share the server's cores
+        "server_cpu_ms_per_request": (
+            round((cpu_after - cpu_before) * 1000 / len(latencies), 3)
+            if cpu_before is not None and cpu_after is not None and latencies
+            else None
+        ),
+        "server_threads_peak": peak_threads,
+        "server_rss_before": memory_before,
+        "server_rss_after": memory_after,
+    }
@@ -0,0 +1,79 @@
+from django.db import transaction
+
+from .. import fake_twelvedata, fast_serializers, market_calendar
+from ..ingest import parse_bars, store_bars
+from ..models import Stock, StockTimeSeries
+from ..renderers import FastJSONRenderer
+from ..tasks import fan_out_stock_update
+from ..views import StockPricePagination
+from . import benchmark
+
+# Stocks refreshed at once by the ingest benchmark, as many as an INGEST_BATCH_SIZE batch by default
+INGEST_BATCH = 200
+
+
+def _get(client, path):
+    def get():
+        resp = client.get(path)
+        assert resp.status_code == 200, f"{path}: {resp.status_code}"
+
+    return get
+
+
+@benchmark("prices")
+def prices(universe):
+    return _get(universe.client(), "/stock/prices/")
+
+
+@benchmark("prices_last_page")
+def prices_last_page(universe):
+    pages = -(-len(universe.stocks) // StockPricePagination.page_size)
+    return _get(universe.client(), f"/stock/prices/?page={pages}")
+
+
+@benchmark("home")
+def home(universe):
+    return _get(universe.client(), "/home/")
+
+
+@benchmark("ingest")
+def ingest(universe):
+    """store_bars of the next session's bars for a batch of stocks, rolled back after every run."""
+    batch = universe.stocks[:INGEST_BATCH]
+    last = {stock.pk: stock.last_update_date for stock in batch}
+    day = market_calendar.next_trading_day(max(last.values()))
+    values = {stock.pk: fake_twelvedata.bars(stock.symbol, [day]) for stock in batch}
+
+    def refresh():
+        with transaction.atomic():
+            rows = [row for stock in batch for row in parse_bars(stock, values[stock.pk], after=last[stock.pk])]
+            store_bars(rows)
+            transaction.set_rollback(True)
+        for stock in batch:
+            stock.last_update_date = last[stock.pk]
+
+    return refresh
+
+
+@benchmark("fan_out")
+def fan_out(universe):
+    """fan_out_stock_update of the most followed stock, through the configured channel layer."""
+    stock_id = Stock.objects.order_by("-follower_count").values_list("pk", flat=True).first()
+    return lambda: fan_out_stock_update(stock_id)
+
+
+@benchmark("serialize_stocks")
+def serialize_stocks(universe):
+    """The JSON of every stock, as a full unpaginated listing would be."""
+    rows = list(Stock.objects.order_by("symbol").values(*fast_serializers.STOCK_VALUES))
+    return lambda: FastJSONRenderer().render(fast_serializers.stocks(rows))
+
+
+@benchmark("serialize_bars")
+def serialize_bars(universe):
+    """The JSON of the whole history of a stock."""
+    stock = universe.stocks[0]
+    rows = list(
+        StockTimeSeries.objects.filter(stock=stock).order_by("-recorded_date").values(*fast_serializers.BAR_VALUES)
+    )
+    return lambda: FastJSONRenderer().render(fast_serializers.bars(rows))
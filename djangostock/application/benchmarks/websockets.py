@@ -0,0 +1,250 @@
+"""
+Load test of HomeConsumer, run by ``manage.py benchmark_websockets``: opens many authenticated ``/ws/home/``
+sessions against a Daphne process serving benchmarks.asgi, has it ingest and fan out bars of a stock they
+all follow, and reports the connect rate, the server's memory per connection and the delivery latency.
+
+Latency runs from the moment the trigger request leaves, before the bar is stored, to the moment a client
+has the update, so it covers store_bars, fan_out_stock_update, the channel layer and the socket. Measure
+it on Redis: InMemoryChannelLayer sweeps every channel on every send, so there the latency grows with the
+square of the connections.
+"""
+import asyncio
+import base64
+import datetime
+import os
+import secrets
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.utils import timezone
+
+import httpx
+
+from .. import fake_twelvedata, market_calendar
+from ..ingest import parse_bars, store_bars
+from ..models import Country, Currency, Follow, Stock, User
+from ..tasks import fan_out_stock_update
+from . import percentile
+
+UPDATE_PATH = "/loadtest/update/"
+# Marks everything seeded, so a run cleans up after an earlier one that was killed
+SYMBOL = "LOADTEST"
+EMAIL_PREFIX = "loadtest."
+SESSION_PREFIX = "loadtest"
+FIRST_DATE = datetime.date(2023, 8, 14)
+BATCH_SIZE = 1000
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+
+def cleanup():
+    Session.objects.filter(session_key__startswith=SESSION_PREFIX).delete()
+    User.objects.filter(email__startswith=EMAIL_PREFIX, email__endswith="@example.com").delete()
+    Stock.objects.filter(symbol=SYMBOL).delete()
+
+
+def seed(connections):
+    """A stock with ``connections`` followers, each with a session for /ws/home/. Returns (stock, session keys)."""
+    stock = Stock.objects.create(
+        name="Load test",
+        symbol=SYMBOL,
+        exchange_name="NASDAQ",
+        type_of_stock=Stock.TypeOfStock.COMMON_STOCK,
+        currency=Currency.objects.get(name="USD"),
+        country=Country.objects.get(name="United States"),
+        follower_count=connections,
+    )
+    store_bars(parse_bars(stock, fake_twelvedata.bars(SYMBOL, [FIRST_DATE])))
+
+    users = User.objects.bulk_create(
+        [
+            User(email=f"{EMAIL_PREFIX}{n}@example.com", first_name="Load", last_name=f"Test {n}")
+            for n in range(connections)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    Follow.objects.bulk_create([Follow(user=user, stock=stock) for user in users], batch_size=BATCH_SIZE)
+
+    # What Home leaves in the session for HomeConsumer, without a request per user
+    expire_date = timezone.now() + datetime.timedelta(hours=1)
+    sessions = [
+        Session(
+            session_key=f"{SESSION_PREFIX}{secrets.token_hex(16)}",
+            session_data=SessionStore().encode({"ws_user": user.pk}),
+            expire_date=expire_date,
+        )
+        for user in users
+    ]
+    Session.objects.bulk_create(sessions, batch_size=BATCH_SIZE)
+    return stock, [session.session_key for session in sessions]
+
+
+def push_update(stock_id):
+    """Store the next session's bar of the stock and fan it out, as update_time_series does."""
+    stock = Stock.objects.get(pk=stock_id)
+    day = market_calendar.next_trading_day(stock.last_update_date)
+    store_bars(parse_bars(stock, fake_twelvedata.bars(stock.symbol, [day])))
+    fan_out_stock_update(stock.pk)
+
+
+def _status(pid, field):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def rss(pid):
+    """Resident memory of process ``pid`` in bytes, from /proc: None off Linux."""
+    kilobytes = _status(pid, "VmRSS")
+    return kilobytes * 1024 if kilobytes is not None else None
+
+
+def threads(pid):
+    """Threads of process ``pid``, from /proc: None off Linux."""
+    return _status(pid, "Threads")
+
+
+def cpu_seconds(pid):
+    """User and system CPU time process ``pid`` has used, from /proc: None off Linux."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # The fields after the command name, which is in parentheses and can hold spaces
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+class HomeClient:
+    """
+    Just enough of a WebSocket client (RFC 6455) to time the messages of a /ws/home/ connection. Payloads
+    are counted, not decoded, so a permessage-deflate offer costs the client nothing.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.received = []
+        self.closed = asyncio.get_running_loop().create_task(self.read())
+
+    @classmethod
+    async def connect(cls, url, session_key, deflate):
+        parts = urlsplit(url)
+        reader, writer = await asyncio.open_connection(parts.hostname, parts.port)
+        headers = {
+            "Host": parts.netloc,
+            "Upgrade": "websocket",
+            "Connection": "Upgrade",
+            "Sec-WebSocket-Key": base64.b64encode(secrets.token_bytes(16)).decode(),
+            "Sec-WebSocket-Version": "13",
+            "Origin": f"http://{parts.hostname}",
+            "Cookie": f"{settings.SESSION_COOKIE_NAME}={session_key}",
+        }
+        if deflate:
+            headers["Sec-WebSocket-Extensions"] = "permessage-deflate; client_max_window_bits"
+        lines = [f"GET {parts.path} HTTP/1.1", *(f"{name}: {value}" for name, value in headers.items())]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode())
+        response = await reader.readuntil(b"\r\n\r\n")
+        if not response.startswith(b"HTTP/1.1 101"):
+            writer.close()
+            raise ConnectionError(response.split(b"\r\n", 1)[0].decode())
+        return cls(reader, writer)
+
+    def send_frame(self, opcode, payload=b""):
+        # Client frames are masked; control frames, the only ones sent, are under 126 bytes
+        mask = secrets.token_bytes(4)
+        masked = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+        self.writer.write(bytes([0x80 | opcode, 0x80 | len(payload)]) + mask + masked)
+
+    async def read(self):
+        try:
+            while True:
+                first, second = await self.reader.readexactly(2)
+                length = second & 0x7F
+                if length == 126:
+                    length = int.from_bytes(await self.reader.readexactly(2), "big")
+                elif length == 127:
+                    length = int.from_bytes(await self.reader.readexactly(8), "big")
+                payload = await self.reader.readexactly(length)
+                opcode = first & 0x0F
+                if opcode == OPCODE_CLOSE:
+                    return
+                if opcode == OPCODE_PING:
+                    self.send_frame(OPCODE_PONG, payload)
+                elif first & 0x80 and opcode < OPCODE_CLOSE:
+                    # The last frame of a text, binary or continued message
+                    self.received.append(time.perf_counter())
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return
+        finally:
+            self.writer.close()
+
+    async def close(self):
+        if not self.closed.done():
+            self.send_frame(OPCODE_CLOSE, (1000).to_bytes(2, "big"))
+        await self.closed
+
+
+async def run(base_url, stock_id, session_keys, server_pid, updates=20, concurrency=100, deflate=True, timeout=30):
+    """Connect a client per session key, push ``updates`` updates one after the other, and report."""
+    url = f"{base_url.replace('http', 'ws', 1)}/ws/home/"
+    memory_before = rss(server_pid)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def open_one(session_key):
+        async with semaphore:
+            return await asyncio.wait_for(HomeClient.connect(url, session_key, deflate), timeout)
+
+    start = time.perf_counter()
+    opened = await asyncio.gather(*(open_one(key) for key in session_keys), return_exceptions=True)
+    connect_seconds = time.perf_counter() - start
+    clients = [client for client in opened if not isinstance(client, BaseException)]
+    # Let the server finish the group_adds that follow the handshakes
+    await asyncio.sleep(1)
+    memory_after = rss(server_pid)
+
+    latencies = []
+    missed = 0
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout) as http:
+        for n in range(updates):
+            sent = time.perf_counter()
+            (await http.post(UPDATE_PATH, params={"stock": stock_id})).raise_for_status()
+            deadline = sent + timeout
+            while time.perf_counter() < deadline and not all(len(client.received) > n for client in clients):
+                await asyncio.sleep(0.005)
+            for client in clients:
+                if len(client.received) > n:
+                    latencies.append((client.received[n] - sent) * 1000)
+                else:
+                    missed += 1
+
+    await asyncio.wait_for(asyncio.gather(*(client.close() for client in clients)), timeout)
+
+    latencies.sort()
+    per_connection = None
+    if memory_before is not None and memory_after is not None and clients:
+        per_connection = round((memory_after - memory_before) / len(clients))
+    return {
+        "connections": len(clients),
+        "failed_connections": len(opened) - len(clients),
+        "connect_seconds": round(connect_seconds, 3),
+        "connects_per_second": round(len(clients) / connect_seconds, 1) if connect_seconds else None,
+        "server_rss_before": memory_before,
+        "server_rss_after": memory_after,
+        "server_bytes_per_connection": per_connection,
+        "updates": updates,
+        "deliveries": len(latencies),
+        "missed_deliveries": missed,
+        "latency_p50_ms": round(percentile(latencies, 0.5), 3) if latencies else None,
+        "latency_p99_ms": round(percentile(latencies, 0.99), 3) if latencies else None,
+        "latency_max_ms": round(latencies[-1], 3) if latencies else None,
+    }
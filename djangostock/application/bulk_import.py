@@ -0,0 +1,180 @@
+"""
+Import of daily bars from CSV or Parquet files, for vendor dumps and restores, used by ``manage.py import_bars``.
+
+Files are streamed in record batches and checked a batch at a time with Arrow compute kernels. Valid rows
+are loaded with COPY on PostgreSQL and batched inserts elsewhere, so memory stays flat however large
+the file is.
+"""
+import io
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from django.db import connection
+from django.db.models import Max, OuterRef, Subquery
+
+from djangostock.application.metrics import BARS_WRITTEN
+from djangostock.application.models import Stock, StockTimeSeries
+from djangostock.application.versions import bump_data_version
+
+COLUMNS = ["symbol", "datetime", "open", "high", "low", "close", "volume"]
+PRICES = ["open", "high", "low", "close"]
+# StockTimeSeries.volume is an IntegerField
+MAX_VOLUME = 2**31 - 1
+
+NUMBER = r"^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$"
+
+
+class ImportFileError(Exception):
+    """The file cannot be imported at all, e.g. a column is missing."""
+
+
+def read_batches(path, batch_size=100_000, rename=None):
+    """
+    Yield the file at ``path`` (CSV, or Parquet by its extension) as tables of at most about ``batch_size`` rows
+    with the COLUMNS, renamed from their names in the file by ``rename`` ({column: name in the file}).
+    """
+    names = {column: (rename or {}).get(column, column) for column in COLUMNS}
+    if str(path).endswith((".parquet", ".pq")):
+        parquet = pq.ParquetFile(path)
+        missing = [name for name in names.values() if name not in parquet.schema_arrow.names]
+        if missing:
+            raise ImportFileError(f"Missing column(s): {', '.join(missing)}")
+        batches = parquet.iter_batches(batch_size=batch_size, columns=list(names.values()))
+    else:
+        # Everything is read as text and converted in validate, where a bad value only rejects its row.
+        # A missing column raises ArrowKeyError.
+        batches = pa_csv.open_csv(
+            path,
+            read_options=pa_csv.ReadOptions(block_size=64 * batch_size),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=list(names.values()),
+                column_types={name: pa.string() for name in names.values()},
+            ),
+        )
+    for batch in batches:
+        yield pa.Table.from_batches([batch]).select(list(names.values())).rename_columns(COLUMNS)
+
+
+def _valid_format(column):
+    """Rows whose value can be converted; text is checked against a pattern rather than converted blindly."""
+    if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        return pc.fill_null(pc.match_substring_regex(column, NUMBER), False)
+    return pc.is_valid(column)
+
+
+def _to_date(column):
+    if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        column = pc.strptime(pc.utf8_slice_codeunits(column, 0, 10), format="%Y-%m-%d", unit="s", error_is_null=True)
+    return column.cast(pa.date32())
+
+
+def validate(table, stock_ids):
+    """
+    Return (the valid rows, with a stock_id column instead of the symbol, how many rows were rejected).
+    A row is rejected when its symbol is not a Stock (``stock_ids`` is {symbol: pk}), a value is missing or
+    malformed, a price is not positive, the high/low do not bound the open/close, or the volume is out of range.
+    """
+    total = table.num_rows
+    symbols = pa.array(list(stock_ids), pa.string())
+    mask = pc.fill_null(pc.is_in(table["symbol"].cast(pa.string()), value_set=symbols), False)
+    for name in PRICES + ["volume"]:
+        mask = pc.and_(mask, _valid_format(table[name]))
+    table = table.filter(mask)
+
+    ids = pa.array(list(stock_ids.values()), pa.int64())
+    table = pa.table(
+        {
+            "stock_id": pc.take(ids, pc.index_in(table["symbol"].cast(pa.string()), value_set=symbols)),
+            "datetime": _to_date(table["datetime"]),
+            **{name: table[name].cast(pa.float64()) for name in PRICES},
+            "volume": table["volume"].cast(pa.float64()),
+        }
+    )
+    checks = [
+        pc.is_valid(table["datetime"]),
+        pc.greater(table["low"], 0),
+        pc.less_equal(table["low"], pc.min_element_wise(table["open"], table["close"])),
+        pc.greater_equal(table["high"], pc.max_element_wise(table["open"], table["close"])),
+        pc.is_finite(table["high"]),
+        pc.greater_equal(table["volume"], 0),
+        pc.less_equal(table["volume"], MAX_VOLUME),
+    ]
+    mask = checks[0]
+    for check in checks[1:]:
+        mask = pc.and_(mask, check)
+    table = table.filter(pc.fill_null(mask, False))
+    table = table.set_column(
+        table.schema.get_field_index("volume"), "volume", pc.floor(table["volume"]).cast(pa.int64())
+    )
+    return table, total - table.num_rows
+
+
+def _columns():
+    opts = StockTimeSeries._meta
+    return opts.db_table, [opts.get_field(name).column for name in ["stock", "recorded_date", *PRICES, "volume"]]
+
+
+def _copy(table):
+    """Load ``table`` with PostgreSQL COPY, streaming it as CSV."""
+    db_table, columns = _columns()
+    buffer = io.BytesIO()
+    pa_csv.write_csv(table, buffer, write_options=pa_csv.WriteOptions(include_header=False))
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {db_table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def _insert(table):
+    """Load ``table`` with multi-row INSERTs, without building a model instance per row."""
+    db_table, columns = _columns()
+    row = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    # SQLite allows 999 parameters per statement
+    per_statement = 999 // len(columns)
+    rows = list(zip(*(column.to_pylist() for column in table.columns)))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), per_statement):
+            end = start + per_statement
+            chunk = rows[start:end]
+            cursor.execute(
+                f"INSERT INTO {db_table} ({', '.join(columns)}) VALUES {', '.join([row] * len(chunk))}",
+                [value for values in chunk for value in values],
+            )
+
+
+def load(table):
+    """Store the rows of a validated ``table``."""
+    if not table.num_rows:
+        return
+    if connection.vendor == "postgresql":
+        _copy(table)
+    else:
+        _insert(table)
+    BARS_WRITTEN.labels("import").inc(table.num_rows)
+
+
+def date_ranges(table, ranges=None):
+    """Add the first and last date of each stock in a validated ``table`` to ``ranges``, {stock_id: (first, last)}."""
+    ranges = {} if ranges is None else ranges
+    grouped = table.group_by("stock_id").aggregate([("datetime", "min"), ("datetime", "max")])
+    for stock_id, first, last in zip(
+        grouped["stock_id"].to_pylist(), grouped["datetime_min"].to_pylist(), grouped["datetime_max"].to_pylist()
+    ):
+        if stock_id in ranges:
+            first, last = min(first, ranges[stock_id][0]), max(last, ranges[stock_id][1])
+        ranges[stock_id] = (first, last)
+    return ranges
+
+
+def delete_ranges(ranges):
+    """Delete the bars in ``ranges`` (see date_ranges), for a file to replace what was imported before."""
+    for stock_id, (first, last) in ranges.items():
+        StockTimeSeries.objects.filter(stock_id=stock_id, recorded_date__range=(first, last)).delete()
+
+
+def update_last_update_dates(stock_ids):
+    """Move the last_update_date of the stocks to their newest stored bar."""
+    newest = StockTimeSeries.objects.filter(stock=OuterRef("pk")).values("stock").annotate(newest=Max("recorded_date"))
+    Stock.objects.filter(pk__in=stock_ids).update(last_update_date=Subquery(newest.values("newest")))
+    bump_data_version()
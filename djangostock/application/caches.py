@@ -0,0 +1,119 @@
+import threading
+from functools import partial
+
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Currency, Country
+
+
+class ReferenceCache:
+    """
+    Process-local cache of a small reference table (a few rows that nearly never change).
+    The whole table is loaded on first use; local saves and deletes drop it through signals,
+    rows created by other processes are picked up by the single query made on a miss.
+
+    A row created by ``get_or_create`` inside a transaction is cached once the transaction commits. Until
+    then the creating thread does not fill the cache, which would otherwise keep the row if it rolled back.
+    """
+
+    def __init__(self, model, slug_field="name"):
+        self.model = model
+        self.slug_field = slug_field
+        self._lock = threading.Lock()
+        self._by_slug = None
+        self._by_pk = None
+        # Per thread: whether it created a row in a transaction that has not committed yet
+        self._local = threading.local()
+
+    def __deepcopy__(self, memo):
+        # DRF deep-copies field arguments for every serializer instance; the cache must stay shared.
+        return self
+
+    def _index(self, instances):
+        return (
+            {getattr(instance, self.slug_field): instance for instance in instances},
+            {instance.pk: instance for instance in instances},
+        )
+
+    def _uncommitted(self):
+        if getattr(self._local, "uncommitted", False) and not connection.in_atomic_block:
+            # The transaction ended without running _committed: it rolled back
+            self._local.uncommitted = False
+        return getattr(self._local, "uncommitted", False)
+
+    def _committed(self, instance=None):
+        self._local.uncommitted = False
+        if instance is not None:
+            self._remember(instance)
+
+    def _load(self):
+        if self._uncommitted():
+            return self._index(self.model.objects.all())
+        with self._lock:
+            if self._by_slug is None:
+                self._by_slug, self._by_pk = self._index(self.model.objects.all())
+            return self._by_slug, self._by_pk
+
+    def _remember(self, instance):
+        if self._uncommitted():
+            return instance
+        by_slug, by_pk = self._load()
+        by_slug[getattr(instance, self.slug_field)] = instance
+        by_pk[instance.pk] = instance
+        return instance
+
+    def get(self, slug):
+        by_slug, _ = self._load()
+        if slug in by_slug:
+            return by_slug[slug]
+        instance = self.model.objects.filter(**{self.slug_field: slug}).first()
+        return self._remember(instance) if instance is not None else None
+
+    def get_by_pk(self, pk):
+        _, by_pk = self._load()
+        if pk in by_pk:
+            return by_pk[pk]
+        instance = self.model.objects.filter(pk=pk).first()
+        return self._remember(instance) if instance is not None else None
+
+    def get_or_create(self, slug):
+        instance = self.get(slug)
+        if instance is None:
+            instance, created = self.model.objects.get_or_create(**{self.slug_field: slug})
+            if created and connection.in_atomic_block:
+                self._local.uncommitted = True
+                transaction.on_commit(partial(self._committed, instance))
+            else:
+                self._remember(instance)
+        return instance
+
+    def clear(self):
+        with self._lock:
+            self._by_slug = None
+            self._by_pk = None
+
+    def reset(self):
+        """Clear, and forget about this thread's uncommitted rows (for tests, whose transactions never commit)."""
+        self.clear()
+        self._committed()
+
+
+currencies = ReferenceCache(Currency)
+countries = ReferenceCache(Country)
+
+REFERENCE_CACHES = {Currency: currencies, Country: countries}
+
+
+@receiver(post_save, sender=Currency)
+@receiver(post_save, sender=Country)
+@receiver(post_delete, sender=Currency)
+@receiver(post_delete, sender=Country)
+def clear_reference_cache(sender, **kwargs):
+    REFERENCE_CACHES[sender].clear()
+
+
+def clear_reference_caches():
+    for cache in REFERENCE_CACHES.values():
+        cache.reset()
@@ -0,0 +1,96 @@
+"""
+Circuit breaker whose state lives in the Django cache, so every worker sees the same circuit.
+"""
+import random
+import time
+
+from django.core.cache import cache
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self,
+        name,
+        failure_rate=0.5,
+        min_calls=10,
+        window=60,
+        open_seconds=30,
+        max_open_seconds=30 * 60,
+    ):
+        """
+        The circuit opens when at least ``min_calls`` calls in a ``window``-second bucket failed at
+        ``failure_rate`` or worse, or at once on rate limiting. It stays open for ``open_seconds``,
+        doubled after every consecutive trip up to ``max_open_seconds``, then lets one probe call through.
+        """
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+
+    def _key(self, *parts):
+        return ":".join(["circuit", self.name, *map(str, parts)])
+
+    def _count(self, kind):
+        key = self._key(kind, int(time.time() // self.window))
+        cache.add(key, 0, timeout=self.window * 2)
+        return cache.incr(key)
+
+    def state(self):
+        open_until = cache.get(self._key("open_until"))
+        if open_until is None:
+            return self.CLOSED
+        return self.OPEN if time.time() < open_until else self.HALF_OPEN
+
+    def health(self):
+        bucket = int(time.time() // self.window)
+        return {
+            "state": self.state(),
+            "trips": cache.get(self._key("trips"), 0),
+            "open_until": cache.get(self._key("open_until")),
+            "calls": cache.get(self._key("calls", bucket), 0),
+            "failures": cache.get(self._key("failures", bucket), 0),
+        }
+
+    def allow_request(self):
+        state = self.state()
+        if state == self.HALF_OPEN:
+            # A single probe at a time decides whether the circuit closes again
+            return cache.add(self._key("probe"), 1, timeout=self.window)
+        return state == self.CLOSED
+
+    def record_success(self):
+        self._count("calls")
+        if self.state() != self.CLOSED:
+            cache.delete_many([self._key("open_until"), self._key("trips"), self._key("probe")])
+
+    def record_failure(self, rate_limited=False):
+        calls = self._count("calls")
+        failures = self._count("failures")
+        if (
+            rate_limited
+            or self.state() == self.HALF_OPEN
+            or (calls >= self.min_calls and failures / calls >= self.failure_rate)
+        ):
+            self.trip()
+
+    def trip(self):
+        cache.add(self._key("trips"), 0, timeout=None)
+        trips = cache.incr(self._key("trips"))
+        duration = min(self.open_seconds * 2 ** (trips - 1), self.max_open_seconds)
+        cache.set(self._key("open_until"), time.time() + duration, timeout=None)
+        cache.delete(self._key("probe"))
+
+    def retry_delay(self, attempt):
+        """
+        Seconds a deferred call should wait: past the current open period and growing exponentially
+        with ``attempt``, with jitter so deferred calls do not all return at the same moment.
+        """
+        open_until = cache.get(self._key("open_until")) or 0
+        delay = max(open_until - time.time(), self.open_seconds * 2**attempt)
+        return min(delay, self.max_open_seconds) * random.uniform(1, 1.5)
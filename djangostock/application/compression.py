@@ -0,0 +1,82 @@
+"""
+Response compression: brotli for clients that accept it, gzip otherwise, for responses of at least
+RESPONSE_COMPRESSION_MIN_SIZE bytes and for streaming responses. WebSocket messages are compressed by
+permessage-deflate instead, see djangostock.server.
+"""
+import brotli
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+
+def accepts_brotli(request):
+    """Whether the Accept-Encoding of ``request`` lists br, with a non-zero quality."""
+    for coding in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip() != "br":
+            continue
+        try:
+            return float(params.strip().removeprefix("q=") or 1) > 0
+        except ValueError:
+            return False
+    return False
+
+
+def _compressor():
+    return brotli.Compressor(mode=brotli.MODE_TEXT, quality=settings.RESPONSE_COMPRESSION_BROTLI_QUALITY)
+
+
+def compress_sequence(sequence):
+    compressor = _compressor()
+    for chunk in sequence:
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def acompress_sequence(sequence):
+    compressor = _compressor()
+    async for chunk in sequence:
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware that prefers brotli and leaves smaller responses alone. The gzip fallback keeps
+    Django's BREACH mitigation; brotli has no equivalent, so keep secrets out of compressed bodies.
+    """
+
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < settings.RESPONSE_COMPRESSION_MIN_SIZE:
+            return response
+        if response.has_header("Content-Encoding"):
+            return response
+        if not accepts_brotli(request):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = acompress_sequence(response.streaming_content)
+            else:
+                response.streaming_content = compress_sequence(response.streaming_content)
+            del response.headers["Content-Length"]
+        else:
+            compressed = brotli.compress(
+                response.content, mode=brotli.MODE_TEXT, quality=settings.RESPONSE_COMPRESSION_BROTLI_QUALITY
+            )
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers["Content-Length"] = str(len(compressed))
+
+        # A compressed body is not the same bytes, only the same representation
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = "br"
+        return response
@@ -1,7 +1,15 @@
-import json
-
 from channels.generic.websocket import AsyncWebsocketConsumer
 
+from . import tracing
+from .metrics import WEBSOCKET_CONNECTIONS, WEBSOCKET_MESSAGES
+from .renderers import FastJSONRenderer
+
+
+def encode(event):
+    # The same JSON encoding as the API; the trace context stays on the server
+    event = {key: value for key, value in event.items() if key != "traceparent"}
+    return FastJSONRenderer().render(event).decode()
+
 
 class HomeConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -13,10 +21,23 @@ class HomeConsumer(AsyncWebsocketConsumer):
         await self.channel_layer.group_add(self.group_name, self.channel_name)
 
         await self.accept()
+        WEBSOCKET_CONNECTIONS.inc()
+        self.counted = True
 
     async def disconnect(self, close_code):
+        if getattr(self, "counted", False):
+            WEBSOCKET_CONNECTIONS.dec()
+            self.counted = False
         await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
     async def send_stock_update(self, event):
         # Send a custom message to the client
-        await self.send(text_data=json.dumps(event))
+        with tracing.span("HomeConsumer.send_stock_update", parent=event.get("traceparent")):
+            await self.send(text_data=encode(event))
+        WEBSOCKET_MESSAGES.labels(event["type"]).inc()
+
+    async def send_follows_update(self, event):
+        # Sent once per bulk follow change, with the symbols followed and unfollowed
+        with tracing.span("HomeConsumer.send_follows_update", parent=event.get("traceparent")):
+            await self.send(text_data=encode(event))
+        WEBSOCKET_MESSAGES.labels(event["type"]).inc()
@@ -0,0 +1,135 @@
+"""
+Offline stand-in for the parts of the TwelveData API we use (``/stocks`` and daily ``/time_series``).
+
+Bars are synthetic but deterministic (seeded by symbol and date) over the NASDAQ calendar, so repeated runs agree.
+Run it locally and point TWELVEDATA_BASE_URL at it:
+
+    daphne djangostock.application.fake_twelvedata:application -p 8001
+
+``FAKE_TWELVEDATA_LATENCY`` (seconds) delays every response, to mimic the real round trip.
+"""
+import asyncio
+import datetime
+import json
+import os
+import random
+import string
+from urllib.parse import parse_qs
+
+from . import market_calendar
+
+UNIVERSE_SIZE = 5000
+DEFAULT_OUTPUTSIZE = 30
+MAX_OUTPUTSIZE = 5000
+
+
+def symbols(count=UNIVERSE_SIZE):
+    letters = string.ascii_uppercase
+    return ["".join(letters[n // 26**i % 26] for i in range(3, -1, -1)) for n in range(count)]
+
+
+def trading_days(end, count, start=None):
+    """Up to ``count`` trading days ending at ``end`` (newest first), not earlier than ``start``."""
+    days = []
+    day = end if market_calendar.is_trading_day(end) else market_calendar.previous_trading_day(end)
+    while len(days) < count and (start is None or day >= start):
+        days.append(day)
+        day = market_calendar.previous_trading_day(day)
+    return days
+
+
+def bars(symbol, days):
+    """OHLCV for ``days`` (newest first) around a per-symbol price level; any window of days is stable."""
+    level = 10 + sum((i + 1) * ord(c) for i, c in enumerate(symbol)) % 490
+    values = []
+    for day in days:
+        rng = random.Random(f"{symbol}:{day.isoformat()}")
+        close = level * (1 + 0.1 * rng.uniform(-1, 1))
+        open_ = close * (1 + rng.uniform(-0.02, 0.02))
+        values.append(
+            {
+                "datetime": day.isoformat(),
+                "open": f"{open_:.5f}",
+                "high": f"{max(open_, close) * (1 + rng.uniform(0, 0.02)):.5f}",
+                "low": f"{min(open_, close) * (1 - rng.uniform(0, 0.02)):.5f}",
+                "close": f"{close:.5f}",
+                "volume": str(rng.randint(1_000, 5_000_000)),
+            }
+        )
+    return values
+
+
+def stocks_response(params):
+    return {
+        "data": [
+            {
+                "symbol": symbol,
+                "name": f"{symbol} Fake Inc",
+                "currency": "USD",
+                "exchange": "NASDAQ",
+                "mic_code": "XNCM",
+                "country": "United States",
+                "type": "Common Stock",
+            }
+            for symbol in symbols()
+            if "symbol" not in params or params["symbol"] == symbol
+        ],
+        "status": "ok",
+    }
+
+
+def time_series_response(params):
+    symbol = params.get("symbol")
+    if not symbol:
+        return {"code": 400, "message": "symbol is required", "status": "error"}
+
+    end = datetime.date.fromisoformat(params["end_date"]) if "end_date" in params else None
+    end = end or market_calendar.latest_session(datetime.datetime.now(market_calendar.EXCHANGE_TIMEZONE))
+    start = datetime.date.fromisoformat(params["start_date"]) if "start_date" in params else None
+    outputsize = min(int(params.get("outputsize", DEFAULT_OUTPUTSIZE)), MAX_OUTPUTSIZE)
+
+    days = trading_days(end, outputsize, start)
+    if not days:
+        return {"code": 400, "message": "No data is available on the specified dates.", "status": "error"}
+    return {
+        "meta": {"symbol": symbol, "interval": "1day", "currency": "USD", "exchange": "NASDAQ"},
+        "values": bars(symbol, days),
+        "status": "ok",
+    }
+
+
+ROUTES = {
+    "/stocks": stocks_response,
+    "/time_series": time_series_response,
+}
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    latency = float(os.environ.get("FAKE_TWELVEDATA_LATENCY", 0))
+    if latency:
+        await asyncio.sleep(latency)
+
+    params = {key: values[-1] for key, values in parse_qs(scope["query_string"].decode()).items()}
+    route = ROUTES.get(scope["path"].rstrip("/"))
+    if route is None:
+        status, body = 404, {"code": 404, "message": "Not found", "status": "error"}
+    else:
+        status, body = 200, route(params)
+
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json")],
+        }
+    )
+    await send({"type": "http.response.body", "body": json.dumps(body).encode()})
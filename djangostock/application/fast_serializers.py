@@ -0,0 +1,85 @@
+"""
+Read-only fast paths for the serializers of read-heavy endpoints and WebSocket payloads. They build the
+JSON of StockSerializer, PopularStockSerializer and StockTimeSeriesSerializer from ``.values()`` rows
+with plain dict literals, instead of going through DRF fields object by object.
+
+Keep them in step with the serializers they stand in for; the parity tests compare both.
+"""
+from collections import defaultdict
+
+from django.db.models import Q
+
+from .caches import countries, currencies
+from .models import StockTimeSeries
+
+STOCK_VALUES = (
+    "pk",
+    "name",
+    "symbol",
+    "last_update_date",
+    "exchange_name",
+    "type_of_stock",
+    "currency_id",
+    "country_id",
+)
+BAR_VALUES = ("recorded_date", "open", "close", "high", "low", "volume")
+
+
+def bar(row):
+    """StockTimeSeriesSerializer's output for a row with the BAR_VALUES."""
+    return {
+        "datetime": row["recorded_date"].isoformat(),
+        "open": float(row["open"]),
+        "close": float(row["close"]),
+        "high": float(row["high"]),
+        "low": float(row["low"]),
+        "volume": int(row["volume"]),
+    }
+
+
+def bars(rows):
+    return [bar(row) for row in rows]
+
+
+def latest_bars(rows):
+    """{stock pk: latest bar} for stock rows with the STOCK_VALUES, in one query, like Stock.latest_time_series."""
+    if not rows:
+        return {}
+    # One term per last_update_date rather than per stock: most stocks share the latest session
+    by_date = defaultdict(list)
+    for row in rows:
+        by_date[row["last_update_date"]].append(row["pk"])
+    condition = Q()
+    for last_update_date, pks in by_date.items():
+        if last_update_date:
+            condition |= Q(stock_id__in=pks, recorded_date__gte=last_update_date)
+        else:
+            condition |= Q(stock_id__in=pks)
+    latest = {}
+    for series in StockTimeSeries.objects.filter(condition).order_by("recorded_date").values("stock_id", *BAR_VALUES):
+        latest[series["stock_id"]] = series
+    return latest
+
+
+def stocks(rows, extra=()):
+    """
+    StockSerializer's output for stock rows with the STOCK_VALUES, plus the ``extra`` values as they are,
+    e.g. ``extra=["follower_count"]`` for PopularStockSerializer.
+    """
+    latest = latest_bars(rows)
+    data = []
+    for row in rows:
+        item = {
+            "name": row["name"],
+            "symbol": row["symbol"],
+            "last_update_date": row["last_update_date"].isoformat() if row["last_update_date"] else None,
+            "exchange": row["exchange_name"],
+            "type": row["type_of_stock"],
+            "currency": currencies.get_by_pk(row["currency_id"]).name,
+            "country": countries.get_by_pk(row["country_id"]).name,
+            "latest_data": bar(latest[row["pk"]]) if row["pk"] in latest else None,
+        }
+        for name in extra:
+            item[name] = row[name]
+        data.append(item)
+    return data
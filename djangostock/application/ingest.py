@@ -0,0 +1,211 @@
+"""
+Time series refresh for many symbols in one process, the "asyncio" TIME_SERIES_REFRESH_ENGINE.
+
+``concurrency`` fetchers share one HTTP client (and the TwelveData rate limit and circuit breaker) and
+put what they fetch on a bounded queue. A single writer drains it and stores the bars in batches, so a
+slow database holds the fetchers back instead of piling responses up in memory.
+
+The lock, rate limit and circuit breaker calls are blocking Redis or cache round trips, so they run in
+worker threads rather than on the event loop; not in the writer's thread, or they would queue behind it.
+"""
+import asyncio
+import datetime
+import time
+
+import httpx
+from asgiref.sync import sync_to_async
+from celery.utils import uuid
+from django.conf import settings
+from django.db import transaction
+
+from djangostock.application import tracing, twelvedata
+from djangostock.application.locks import get_lock_backend, symbol_lock_key
+from djangostock.application.metrics import BARS_WRITTEN
+from djangostock.application.models import Stock, StockTimeSeries
+from djangostock.application.versions import bump_data_version
+
+# Seconds a partial batch may wait for more bars before it is written anyway
+FLUSH_INTERVAL = 1
+
+_DONE = object()
+
+
+def parse_bars(stock, values, after=None):
+    """StockTimeSeries rows for the TwelveData ``values`` newer than ``after``; malformed bars are skipped."""
+    rows = []
+    for value in values:
+        try:
+            row = StockTimeSeries(
+                stock=stock,
+                recorded_date=datetime.date.fromisoformat(value["datetime"]),
+                open=float(value["open"]),
+                close=float(value["close"]),
+                high=float(value["high"]),
+                low=float(value["low"]),
+                volume=int(value["volume"]),
+            )
+        except (KeyError, TypeError, ValueError):
+            continue
+        if after is None or row.recorded_date > after:
+            rows.append(row)
+    return rows
+
+
+def store_bars(rows, batch_size=1000):
+    """
+    Insert ``rows`` and move each stock's last_update_date up to its newest bar.
+    Returns the stocks whose last_update_date moved.
+    """
+    updated = {}
+    for row in rows:
+        stock = row.stock
+        if stock.last_update_date is None or row.recorded_date > stock.last_update_date:
+            stock.last_update_date = row.recorded_date
+            updated[stock.pk] = stock
+    with tracing.span("store_bars", rows=len(rows), stocks=len(updated)), transaction.atomic():
+        StockTimeSeries.objects.bulk_create(rows, batch_size=batch_size)
+        Stock.objects.bulk_update(updated.values(), ["last_update_date"], batch_size=batch_size)
+        if rows:
+            bump_data_version()
+    return list(updated.values())
+
+
+async def _fetch(client, stock, token):
+    query_params = {
+        "symbol": stock.symbol,
+        "apikey": settings.API_KEY_TWELVEDATA,
+        "interval": "1day",
+    }
+    if stock.last_update_date:
+        query_params["start_date"] = (stock.last_update_date + datetime.timedelta(days=1)).isoformat()
+
+    attempt = 0
+    while True:
+        try:
+            r = await twelvedata.aget(client, "time_series", query_params)
+            break
+        except twelvedata.UpstreamUnavailable:
+            if attempt >= settings.TWELVEDATA_MAX_DEFERRALS:
+                raise
+            delay = await sync_to_async(twelvedata.breaker.retry_delay, thread_sensitive=False)(attempt)
+            # Keep the symbol ours while waiting, as a deferred update_time_series does
+            await sync_to_async(get_lock_backend().acquire, thread_sensitive=False)(
+                symbol_lock_key(stock.symbol), token, delay + settings.UPDATE_TIME_SERIES_LOCK_TTL
+            )
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    try:
+        body = r.json()
+    except ValueError:
+        return []
+    if r.status_code != 200 or body.get("status") != "ok":
+        return []  # Also how TwelveData answers when there is nothing after start_date
+    return parse_bars(stock, body["values"], after=stock.last_update_date)
+
+
+class Ingestion:
+    def __init__(self, stocks, concurrency, batch_size):
+        self.stocks = stocks
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.token = uuid()
+        self.queue = asyncio.Queue(maxsize=concurrency)
+        self.stats = {"symbols": len(stocks), "updated": 0, "rows": 0, "skipped": 0, "failed": 0}
+
+    async def fetcher(self, client, stocks):
+        lock = get_lock_backend()
+        acquire = sync_to_async(lock.acquire, thread_sensitive=False)
+        release = sync_to_async(lock.release, thread_sensitive=False)
+        for stock in stocks:
+            key = symbol_lock_key(stock.symbol)
+            if not await acquire(key, self.token, settings.UPDATE_TIME_SERIES_LOCK_TTL):
+                self.stats["skipped"] += 1  # update_time_series or another ingestion has it
+                continue
+            try:
+                rows = await _fetch(client, stock, self.token)
+            except twelvedata.UpstreamUnavailable:
+                await release(key, self.token)
+                self.stats["failed"] += 1
+                continue
+            except BaseException:
+                await release(key, self.token)
+                raise
+            # The lock is released by the writer, once the bars are stored
+            await self.queue.put((stock, rows))
+
+    async def writer(self):
+        loop = asyncio.get_running_loop()
+        item = None
+        while item is not _DONE:
+            batch, size = [], 0
+            item = await self.queue.get()
+            deadline = loop.time() + FLUSH_INTERVAL
+            while item is not _DONE:
+                batch.append(item)
+                size += len(item[1])
+                if size >= self.batch_size:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), deadline - loop.time())
+                except TimeoutError:
+                    break
+            if batch:
+                await sync_to_async(self.flush)(batch)
+
+    def flush(self, batch):
+        from djangostock.application.tasks import fan_out_stock_update
+
+        lock = get_lock_backend()
+        try:
+            rows = [row for _, stock_rows in batch for row in stock_rows]
+            updated = store_bars(rows, batch_size=self.batch_size)
+        finally:
+            for stock, _ in batch:
+                lock.release(symbol_lock_key(stock.symbol), self.token)
+        self.stats["rows"] += len(rows)
+        BARS_WRITTEN.labels("ingest").inc(len(rows))
+        self.stats["updated"] += len(updated)
+        for stock in updated:
+            if stock.follower_count:
+                fan_out_stock_update.delay(stock.pk)
+
+    async def run(self, client):
+        stocks = iter(self.stocks)
+        async with asyncio.TaskGroup() as group:
+            writer = group.create_task(self.writer())
+            async with asyncio.TaskGroup() as fetchers:
+                for _ in range(self.concurrency):
+                    fetchers.create_task(self.fetcher(client, stocks))
+            await self.queue.put(_DONE)
+            await writer
+
+
+async def run(symbols=None, concurrency=None, batch_size=None, transport=None):
+    """
+    Refresh ``symbols`` (every stock by default) and return counts of what happened.
+    ``transport`` replaces the HTTP transport, e.g. ``httpx.ASGITransport(app=fake_twelvedata.application)``.
+    """
+    concurrency = concurrency or settings.INGEST_CONCURRENCY
+    stocks = Stock.objects.only("pk", "symbol", "last_update_date", "follower_count").order_by("-follower_count")
+    if symbols is not None:
+        stocks = stocks.filter(symbol__in=symbols)
+    ingestion = Ingestion(
+        await sync_to_async(list)(stocks),
+        concurrency=concurrency,
+        batch_size=batch_size or settings.INGEST_BATCH_SIZE,
+    )
+
+    start = time.monotonic()
+    async with httpx.AsyncClient(
+        base_url=settings.TWELVEDATA_BASE_URL,
+        transport=transport,
+        limits=httpx.Limits(max_connections=concurrency),
+    ) as client:
+        await ingestion.run(client)
+    elapsed = time.monotonic() - start
+
+    stats = ingestion.stats
+    stats["seconds"] = round(elapsed, 3)
+    stats["symbols_per_second"] = round(stats["symbols"] / elapsed, 1) if elapsed else None
+    return stats
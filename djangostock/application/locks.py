@@ -0,0 +1,84 @@
+"""
+Single-flight locks: a key is held by one token (usually a Celery task id) until released or expired.
+The backend is chosen by the SINGLE_FLIGHT_LOCKS setting, like CHANNEL_LAYERS chooses a channel layer.
+"""
+import threading
+import time
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class InMemoryLockBackend:
+    """Process-local stand-in for tests and single-process development."""
+
+    def __init__(self):
+        self._mutex = threading.Lock()
+        self._locks = {}
+
+    def acquire(self, key, token, ttl):
+        """Take ``key`` for ``token`` (or extend it if ``token`` already holds it) for ``ttl`` seconds."""
+        with self._mutex:
+            holder, expires = self._locks.get(key, (None, 0))
+            if holder not in (None, token) and expires > time.monotonic():
+                return False
+            self._locks[key] = (token, time.monotonic() + ttl)
+            return True
+
+    def release(self, key, token):
+        with self._mutex:
+            if self._locks.get(key, (None, 0))[0] == token:
+                del self._locks[key]
+
+    def holder(self, key):
+        with self._mutex:
+            holder, expires = self._locks.get(key, (None, 0))
+            return holder if expires > time.monotonic() else None
+
+
+class RedisLockBackend:
+    """Locks shared by every worker and web process, stored as ``SET key token NX PX ttl``."""
+
+    ACQUIRE_SCRIPT = """
+    if redis.call("get", KEYS[1]) == ARGV[1] then
+        return redis.call("pexpire", KEYS[1], ARGV[2])
+    end
+    if redis.call("set", KEYS[1], ARGV[1], "NX", "PX", ARGV[2]) then
+        return 1
+    end
+    return 0
+    """
+    RELEASE_SCRIPT = """
+    if redis.call("get", KEYS[1]) == ARGV[1] then
+        return redis.call("del", KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, url, prefix="djangostock:lock:"):
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._acquire = self.client.register_script(self.ACQUIRE_SCRIPT)
+        self._release = self.client.register_script(self.RELEASE_SCRIPT)
+
+    def acquire(self, key, token, ttl):
+        return bool(self._acquire(keys=[self.prefix + key], args=[token, int(ttl * 1000)]))
+
+    def release(self, key, token):
+        self._release(keys=[self.prefix + key], args=[token])
+
+    def holder(self, key):
+        return self.client.get(self.prefix + key)
+
+
+@lru_cache(maxsize=None)
+def get_lock_backend():
+    backend = settings.SINGLE_FLIGHT_LOCKS
+    return import_string(backend["BACKEND"])(**backend.get("CONFIG", {}))
+
+
+def symbol_lock_key(symbol):
+    """Key held while a symbol's time series is being refreshed, by whichever path refreshes it."""
+    return f"update_time_series:{symbol}"
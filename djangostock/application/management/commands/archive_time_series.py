@@ -0,0 +1,38 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+from django.db.models.functions import Length
+
+from djangostock.application import archive
+from djangostock.application.models import ArchivedTimeSeries, Stock
+
+
+class Command(BaseCommand):
+    help = "Compact old StockTimeSeries bars of the given stocks (every stock by default) into ArchivedTimeSeries."
+
+    def add_arguments(self, parser):
+        parser.add_argument("symbols", nargs="*", help="Symbols to compact.")
+        parser.add_argument(
+            "--before",
+            type=datetime.date.fromisoformat,
+            help="Compact the bars before this date (default: TIME_SERIES_ARCHIVE_AFTER_DAYS ago).",
+        )
+
+    def handle(self, *args, **options):
+        before = options["before"] or archive.archive_horizon()
+        if before is None:
+            raise CommandError("Archiving is off: set TIME_SERIES_ARCHIVE_AFTER_DAYS or pass --before.")
+
+        stocks = Stock.objects.filter(series__recorded_date__lt=before).distinct()
+        if options["symbols"]:
+            stocks = stocks.filter(symbol__in=options["symbols"])
+        moved = 0
+        for stock in stocks:
+            moved += archive.compact(stock, before)
+
+        archived = ArchivedTimeSeries.objects.aggregate(rows=Sum("rows"), size=Sum(Length("data")))
+        self.stdout.write(f"{moved} bar(s) archived before {before}.")
+        self.stdout.write(
+            self.style.SUCCESS(f"The archive holds {archived['rows'] or 0} bar(s) in {archived['size'] or 0} bytes.")
+        )
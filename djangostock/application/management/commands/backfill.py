@@ -0,0 +1,72 @@
+import datetime
+import multiprocessing
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from django import db
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from djangostock.application import backfill, market_calendar
+from djangostock.application.models import BackfillWindow, Stock
+
+
+class Command(BaseCommand):
+    help = (
+        "Load the daily history of the given stocks (every stock by default) over a process pool. "
+        "Completed windows are checkpointed: run it again to resume. "
+        "Throughput is bounded by TWELVEDATA_REQUESTS_PER_MINUTE, shared by all processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("symbols", nargs="*", help="Symbols to backfill.")
+        parser.add_argument(
+            "--start", type=datetime.date.fromisoformat, help="First day, YYYY-MM-DD (default: ten years ago)."
+        )
+        parser.add_argument(
+            "--end", type=datetime.date.fromisoformat, help="Last day, YYYY-MM-DD (default: the latest session)."
+        )
+        parser.add_argument("--window-days", type=int, default=365, help="Days fetched per request.")
+        parser.add_argument(
+            "--processes", type=int, default=os.cpu_count(), help="1 runs in this process, as needed on SQLite."
+        )
+        parser.add_argument("--reset", action="store_true", help="Forget the checkpoints of these stocks first.")
+
+    def handle(self, *args, **options):
+        end = options["end"] or market_calendar.latest_session(timezone.now())
+        start = options["start"] or backfill.years_before(end, 10)
+        symbols = options["symbols"] or list(Stock.objects.order_by("symbol").values_list("symbol", flat=True))
+        if options["reset"]:
+            BackfillWindow.objects.filter(stock__symbol__in=symbols).delete()
+
+        work = backfill.pending_windows(symbols, start, end, options["window_days"])
+        self.stdout.write(f"{len(work)} window(s) to backfill for {len(symbols)} stock(s), {start} to {end}.")
+
+        outcomes, rows = Counter(), 0
+        started = time.monotonic()
+        for i, (outcome, count) in enumerate(self._run(work, options["processes"]), 1):
+            outcomes[outcome] += 1
+            rows += count
+            if i % 100 == 0:
+                self.stdout.write(f"{i}/{len(work)} window(s), {rows / (time.monotonic() - started):.0f} rows/sec")
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(
+            f"{outcomes[backfill.DONE]} done, {outcomes[backfill.SKIPPED]} skipped, "
+            f"{outcomes[backfill.FAILED]} failed."
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"{rows} row(s) in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} rows/sec).")
+        )
+
+    def _run(self, work, processes):
+        if processes <= 1 or len(work) <= 1:
+            for unit in work:
+                yield backfill.backfill_window(*unit)
+            return
+        # Forked workers must open their own database connections rather than share ours
+        db.connections.close_all()
+        with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("fork")) as pool:
+            yield from pool.map(backfill.backfill_window, *zip(*work))
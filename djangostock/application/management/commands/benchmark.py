@@ -0,0 +1,61 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from django.utils import timezone
+
+from djangostock.application import benchmarks
+from djangostock.application.models import StockTimeSeries
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the core paths on a synthetic universe, in a test database created for the run, and print the "
+        "results as JSON. Run with --settings=djangostock.settings.tests to do without Redis."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("names", nargs="*", help="Benchmarks to run, all by default.")
+        parser.add_argument("--stocks", type=int, default=2000)
+        parser.add_argument("--bars", type=int, default=250, help="Daily bars per stock.")
+        parser.add_argument("--followers", type=int, default=100)
+        parser.add_argument("--follows", type=int, default=50, help="Stocks each follower follows.")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--output", help="Write the JSON to this file instead.")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_config = setup_databases(options["verbosity"], interactive=False)
+        try:
+            start = time.perf_counter()
+            universe = benchmarks.Universe.seed(
+                options["stocks"], options["bars"], options["followers"], options["follows"]
+            )
+            seed_seconds = time.perf_counter() - start
+            report = {
+                "commit": benchmarks.git_commit(),
+                "date": timezone.now().isoformat(),
+                "database": connection.vendor,
+                "universe": {
+                    "stocks": len(universe.stocks),
+                    "bars": StockTimeSeries.objects.count(),
+                    "followers": len(universe.users),
+                    "follows": universe.follows,
+                },
+                "seed_seconds": round(seed_seconds, 1),
+                "results": benchmarks.run(universe, options["names"], options["repeat"]),
+            }
+        finally:
+            teardown_databases(old_config, options["verbosity"])
+            teardown_test_environment()
+
+        data = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(data + "\n")
+            for name, result in report["results"].items():
+                self.stdout.write(f"{name:<20}{result['median_ms']:>10.2f}ms{result['queries']:>5} queries")
+        else:
+            self.stdout.write(data)
@@ -0,0 +1,92 @@
+import asyncio
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from rest_framework_simplejwt.tokens import AccessToken
+
+from djangostock.application import benchmarks
+from djangostock.application.benchmarks import concurrency, websockets
+from djangostock.application.models import User
+
+VARIANTS = ["sync", "async"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync and async views under concurrent clients: serves the API from a Daphne process per "
+        "variant, on the configured database, and prints the results as JSON. Seeds a LOADTEST stock and its "
+        "followers, and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=200, help="Clients, and requests in flight.")
+        parser.add_argument("--duration", type=float, default=10, help="Seconds each variant is run for.")
+        parser.add_argument(
+            "--endpoints",
+            default=",".join(concurrency.ENDPOINTS),
+            help=f"Comma-separated, of {', '.join(concurrency.ENDPOINTS)}.",
+        )
+        parser.add_argument("--variants", default=",".join(VARIANTS), help="Comma-separated, of sync, async.")
+        parser.add_argument(
+            "--db-latency", type=float, default=0, help="Milliseconds added to every query, as to a remote database."
+        )
+        parser.add_argument("--port", type=int, default=8766)
+        parser.add_argument("--timeout", type=float, default=30, help="Seconds to wait for the server or a response.")
+        parser.add_argument("--output", help="Write the JSON to this file instead.")
+
+    def handle(self, *args, **options):
+        endpoints = options["endpoints"].split(",")
+        variants = options["variants"].split(",")
+        unknown = (set(endpoints) - set(concurrency.ENDPOINTS)) | (set(variants) - set(VARIANTS))
+        if unknown:
+            raise CommandError(f"Unknown endpoints or variants: {', '.join(sorted(unknown))}.")
+        # A socket per client on both ends
+        benchmarks.raise_open_files_limit(options["clients"] * 2 + 256)
+
+        websockets.cleanup()
+        stock, _ = websockets.seed(options["clients"])
+        users = User.objects.filter(follows=stock).order_by("pk")
+        tokens = [str(AccessToken.for_user(user)) for user in users]
+        results = {}
+        try:
+            for variant in variants:
+                env = {"ASYNC_VIEWS": str(variant == "async"), "LOADTEST_DB_LATENCY_MS": str(options["db_latency"])}
+                with benchmarks.serve(options["port"], options["timeout"], env) as server:
+                    results[variant] = asyncio.run(
+                        concurrency.run(
+                            f"http://127.0.0.1:{options['port']}",
+                            tokens,
+                            stock.pk,
+                            server.pid,
+                            endpoints=endpoints,
+                            duration=options["duration"],
+                            timeout=options["timeout"],
+                        )
+                    )
+        finally:
+            websockets.cleanup()
+
+        report = {
+            "commit": benchmarks.git_commit(),
+            "date": timezone.now().isoformat(),
+            "database": settings.DATABASES["default"]["ENGINE"],
+            "db_latency_ms": options["db_latency"],
+            "endpoints": endpoints,
+            "results": results,
+        }
+        data = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(data + "\n")
+            for variant, result in results.items():
+                self.stdout.write(
+                    f"{variant}: {result['requests_per_second']} requests/s from {result['clients']} clients, "
+                    f"p50 {result['latency_p50_ms']}ms, p99 {result['latency_p99_ms']}ms, {result['errors']} errors; "
+                    f"{result['server_cpu_ms_per_request']}ms of server CPU per request, "
+                    f"{result['server_threads_peak']} server threads at most."
+                )
+        else:
+            self.stdout.write(data)
@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from djangostock.application import benchmarks
+from djangostock.application.benchmarks import websockets
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test /ws/home/ against a Daphne process started for the run, on the configured database and "
+        "channel layer, and print the results as JSON. Seeds a LOADTEST stock and its followers, and deletes "
+        "them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--connections", type=int, default=1000)
+        parser.add_argument("--updates", type=int, default=20, help="Updates pushed to every connection.")
+        parser.add_argument("--concurrency", type=int, default=100, help="Handshakes in flight at once.")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--timeout", type=float, default=30, help="Seconds to wait for a handshake or update.")
+        parser.add_argument("--no-deflate", action="store_true", help="Don't offer permessage-deflate.")
+        parser.add_argument("--output", help="Write the JSON to this file instead.")
+
+    def handle(self, *args, **options):
+        # A socket per connection on both ends
+        benchmarks.raise_open_files_limit(options["connections"] * 2 + 256)
+
+        websockets.cleanup()
+        stock, session_keys = websockets.seed(options["connections"])
+        try:
+            with benchmarks.serve(options["port"], options["timeout"]) as server:
+                results = asyncio.run(
+                    websockets.run(
+                        f"http://127.0.0.1:{options['port']}",
+                        stock.pk,
+                        session_keys,
+                        server.pid,
+                        updates=options["updates"],
+                        concurrency=options["concurrency"],
+                        deflate=not options["no_deflate"],
+                        timeout=options["timeout"],
+                    )
+                )
+        finally:
+            websockets.cleanup()
+
+        report = {
+            "commit": benchmarks.git_commit(),
+            "date": timezone.now().isoformat(),
+            "channel_layer": settings.CHANNEL_LAYERS["default"]["BACKEND"],
+            "permessage_deflate": not options["no_deflate"],
+            "results": results,
+        }
+        data = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(data + "\n")
+            self.stdout.write(
+                f"{results['connections']} connected at {results['connects_per_second']}/s, "
+                f"{results['server_bytes_per_connection']} bytes each; delivery p50 {results['latency_p50_ms']}ms, "
+                f"p99 {results['latency_p99_ms']}ms, {results['missed_deliveries']} missed."
+            )
+        else:
+            self.stdout.write(data)
@@ -0,0 +1,64 @@
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from djangostock.application import bulk_import
+from djangostock.application.models import Stock
+
+
+class Command(BaseCommand):
+    help = (
+        "Import daily bars from a CSV or Parquet file with symbol, datetime, open, high, low, close and volume "
+        "columns. Rows of unknown symbols or with invalid values are rejected; the import is all or nothing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file, or Parquet file ending in .parquet or .pq.")
+        parser.add_argument("--batch-size", type=int, default=100_000, help="Rows read and checked at a time.")
+        parser.add_argument(
+            "--column",
+            action="append",
+            default=[],
+            metavar="COLUMN=NAME",
+            help="Read COLUMN from the file's NAME column, e.g. --column datetime=date.",
+        )
+        parser.add_argument(
+            "--replace", action="store_true", help="Delete the bars already stored in the dates the file covers."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            rename = dict(option.split("=", 1) for option in options["column"])
+        except ValueError:
+            raise CommandError("--column must be COLUMN=NAME")
+        stock_ids = dict(Stock.objects.values_list("symbol", "pk"))
+
+        def batches():
+            for table in bulk_import.read_batches(options["path"], options["batch_size"], rename):
+                yield bulk_import.validate(table, stock_ids)
+
+        imported, rejected, stocks = 0, 0, set()
+        started = time.monotonic()
+        try:
+            with transaction.atomic():
+                if options["replace"]:
+                    # A first pass finds the dates to replace, as rows of one stock can be anywhere in the file
+                    ranges = {}
+                    for valid, _ in batches():
+                        bulk_import.date_ranges(valid, ranges)
+                    bulk_import.delete_ranges(ranges)
+                for valid, invalid in batches():
+                    bulk_import.load(valid)
+                    imported += valid.num_rows
+                    rejected += invalid
+                    stocks.update(pc.unique(valid["stock_id"]).to_pylist())
+                bulk_import.update_last_update_dates(stocks)
+        except (bulk_import.ImportFileError, pa.ArrowException, OSError) as e:
+            raise CommandError(f"Cannot import {options['path']}: {e}")
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(f"{imported} row(s) imported for {len(stocks)} stock(s), {rejected} rejected.")
+        self.stdout.write(self.style.SUCCESS(f"{elapsed:.1f}s ({imported / elapsed if elapsed else 0:.0f} rows/sec)."))
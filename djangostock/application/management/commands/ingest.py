@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from asgiref.sync import async_to_sync
+
+from djangostock.application import ingest
+
+
+class Command(BaseCommand):
+    help = "Refresh the time series of the given stocks (every stock by default) in this process."
+
+    def add_arguments(self, parser):
+        parser.add_argument("symbols", nargs="*", help="Symbols to refresh.")
+        parser.add_argument("--concurrency", type=int, default=settings.INGEST_CONCURRENCY)
+        parser.add_argument("--batch-size", type=int, default=settings.INGEST_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        stats = async_to_sync(ingest.run)(
+            options["symbols"] or None,
+            concurrency=options["concurrency"],
+            batch_size=options["batch_size"],
+        )
+        self.stdout.write(
+            f"{stats['updated']}/{stats['symbols']} stock(s) updated, {stats['rows']} row(s) stored, "
+            f"{stats['skipped']} skipped, {stats['failed']} failed."
+        )
+        self.stdout.write(self.style.SUCCESS(f"{stats['seconds']}s, {stats['symbols_per_second']} symbols/sec."))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F
+
+from djangostock.application.models import Stock
+
+
+class Command(BaseCommand):
+    help = "Recount Stock.follower_count from the Follow table and fix the stocks that drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report the stocks that drifted.")
+
+    def handle(self, *args, **options):
+        drifted = list(
+            Stock.objects.annotate(actual=Count("follow"))
+            .exclude(follower_count=F("actual"))
+            .only("pk", "symbol", "follower_count")
+        )
+        for stock in drifted:
+            self.stdout.write(f"{stock.symbol}: {stock.follower_count} -> {stock.actual}")
+            stock.follower_count = stock.actual
+
+        if not options["dry_run"]:
+            Stock.objects.bulk_update(drifted, ["follower_count"], batch_size=1000)
+        self.stdout.write(self.style.SUCCESS(f"{len(drifted)} stock(s) drifted."))
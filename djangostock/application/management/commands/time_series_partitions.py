@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from djangostock.application import partitions
+from djangostock.application.models import StockTimeSeries
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the yearly StockTimeSeries partitions of the coming years, and optionally detach old ones. "
+        "Needs PostgreSQL and a partitioned table (see STOCK_TIME_SERIES_PARTITIONED)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--years-ahead", type=int, default=1, help="Years after this one to create.")
+        parser.add_argument("--detach-before", type=int, metavar="YEAR", help="Detach the partitions before YEAR.")
+        parser.add_argument(
+            "--drop", action="store_true", help="Drop the detached partitions instead of keeping them."
+        )
+        parser.add_argument("--convert", action="store_true", help="Partition the table first if it is not yet.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("StockTimeSeries can only be partitioned on PostgreSQL.")
+        table = StockTimeSeries._meta.db_table
+
+        if not partitions.is_partitioned(table):
+            if not options["convert"]:
+                raise CommandError(f"{table} is not partitioned, use --convert.")
+            with transaction.atomic():
+                partitions.partition_table(StockTimeSeries, connection, options["years_ahead"])
+            self.stdout.write(f"{table} partitioned.")
+
+        for year in partitions.create_future_partitions(table, options["years_ahead"]):
+            self.stdout.write(f"Created {partitions.partition_name(table, year)}.")
+
+        if options["detach_before"]:
+            for year in partitions.partition_years(table):
+                if year < options["detach_before"]:
+                    partitions.detach_partition(table, year, drop=options["drop"])
+                    action = "Dropped" if options["drop"] else "Detached"
+                    self.stdout.write(f"{action} {partitions.partition_name(table, year)}.")
+
+        self.stdout.write(self.style.SUCCESS(f"Partitions: {', '.join(partitions.partitions(table))}"))
@@ -1,4 +1,11 @@
+from contextvars import ContextVar
+
 from django.contrib.auth.base_user import BaseUserManager
+from django.db import models, transaction
+from django.db.models import F, Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .versions import bump_follows_version
 
 
 class UserManager(BaseUserManager):
@@ -13,3 +20,92 @@ class UserManager(BaseUserManager):
         user.is_admin = True
         user.save()
         return user
+
+
+class CatalogEntryManager(models.Manager):
+    def search(self, term, limit=10):
+        """
+        Autocomplete lookup: exact symbol, then symbol prefix, then name prefix, then name substring.
+        Every step is served by an index (see migration 0008), so no step scans the whole catalog.
+        """
+        term = term.strip()
+        if not term:
+            return []
+
+        lookups = [
+            {"symbol": term.upper()},
+            {"symbol__startswith": term.upper()},
+            {"name__istartswith": term},
+            {"name__icontains": term},
+        ]
+        found = {}
+        for lookup in lookups:
+            for entry in self.filter(**lookup).exclude(pk__in=found.keys()).order_by("symbol")[: limit - len(found)]:
+                found[entry.pk] = entry
+            if len(found) >= limit:
+                break
+        return list(found.values())
+
+
+class StockQuerySet(models.QuerySet):
+    def recount_followers(self):
+        """Set follower_count from the Follow table; one UPDATE, but it counts every follower row."""
+        follow_model = self.model.followers.through
+        followers = (
+            follow_model.objects.filter(stock=OuterRef("pk"))
+            .values("stock")
+            .annotate(count=Count("pk"))
+            .values("count")
+        )
+        return self.update(follower_count=Coalesce(Subquery(followers), 0))
+
+
+# Set while FollowManager.unfollow deletes follows it counts itself, so the post_delete receiver skips them
+unfollowing = ContextVar("unfollowing", default=False)
+
+
+class FollowManager(models.Manager):
+    """
+    Follow and unfollow in bulk while keeping ``Stock.follower_count`` in step.
+    Both methods lock the user row, so concurrent changes for one user cannot count a row twice.
+    """
+
+    def _lock_user(self, user):
+        user_model = self.model._meta.get_field("user").related_model
+        user_model.objects.select_for_update().filter(pk=user.pk).exists()
+
+    def _stocks(self):
+        return self.model._meta.get_field("stock").related_model.objects
+
+    def follow(self, user, stock_ids):
+        """Follow every stock in ``stock_ids`` not followed yet and return the ids that were added."""
+        if not stock_ids:
+            return set()
+        with transaction.atomic():
+            self._lock_user(user)
+            followed = set(self.filter(user=user, stock_id__in=stock_ids).values_list("stock_id", flat=True))
+            added = set(stock_ids) - followed
+            if added:
+                self.bulk_create(
+                    [self.model(user=user, stock_id=stock_id) for stock_id in added], ignore_conflicts=True
+                )
+                self._stocks().filter(pk__in=added).update(follower_count=F("follower_count") + 1)
+                bump_follows_version(user.pk)
+        return added
+
+    def unfollow(self, user, stock_ids):
+        """Unfollow every followed stock in ``stock_ids`` and return the ids that were removed."""
+        if not stock_ids:
+            return set()
+        with transaction.atomic():
+            self._lock_user(user)
+            removed = set(self.filter(user=user, stock_id__in=stock_ids).values_list("stock_id", flat=True))
+            if removed:
+                token = unfollowing.set(True)
+                try:
+                    self.filter(user=user, stock_id__in=removed).delete()
+                finally:
+                    unfollowing.reset(token)
+                self._stocks().filter(pk__in=removed).update(follower_count=Greatest(F("follower_count") - 1, 0))
+                bump_follows_version(user.pk)
+        return removed
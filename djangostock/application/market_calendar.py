@@ -0,0 +1,98 @@
+"""
+NASDAQ trading calendar, computed from the exchange's holiday rules so it needs no data files.
+Early closes are treated as full sessions: the daily bar only shows up sooner.
+"""
+import datetime
+from zoneinfo import ZoneInfo
+
+from django.utils import timezone
+
+EXCHANGE_TIMEZONE = ZoneInfo("America/New_York")
+SESSION_CLOSE = datetime.time(16, 0)
+# TwelveData publishes the daily bar shortly after the close
+BAR_PUBLICATION_DELAY = datetime.timedelta(minutes=30)
+
+
+def _easter(year):
+    """Gregorian Easter Sunday (anonymous Gregorian algorithm)."""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    n = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * n) // 451
+    month, day = divmod(h + n - 7 * m + 114, 31)
+    return datetime.date(year, month, day + 1)
+
+
+def _nth_weekday(year, month, weekday, n):
+    """n-th (1-based) given weekday of the month, or the last one for n = -1."""
+    if n > 0:
+        first = datetime.date(year, month, 1)
+        return first + datetime.timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = datetime.date(year + month // 12, month % 12 + 1, 1) - datetime.timedelta(days=1)
+    return last - datetime.timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _observed(day):
+    """Saturday holidays are observed on Friday, Sunday holidays on Monday."""
+    if day.weekday() == 5:
+        return day - datetime.timedelta(days=1)
+    if day.weekday() == 6:
+        return day + datetime.timedelta(days=1)
+    return day
+
+
+def holidays(year):
+    days = {
+        _nth_weekday(year, 1, 0, 3),  # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),  # Washington's Birthday
+        _easter(year) - datetime.timedelta(days=2),  # Good Friday
+        _nth_weekday(year, 5, 0, -1),  # Memorial Day
+        _observed(datetime.date(year, 7, 4)),  # Independence Day
+        _nth_weekday(year, 9, 0, 1),  # Labor Day
+        _nth_weekday(year, 11, 3, 4),  # Thanksgiving Day
+        _observed(datetime.date(year, 12, 25)),  # Christmas Day
+    }
+    # New Year's Day on a Saturday is not observed on the last trading day of the previous year
+    new_year = datetime.date(year, 1, 1)
+    if new_year.weekday() != 5:
+        days.add(_observed(new_year))
+    if year >= 2022:
+        days.add(_observed(datetime.date(year, 6, 19)))  # Juneteenth
+    return days
+
+
+def is_trading_day(day):
+    return day.weekday() < 5 and day not in holidays(day.year)
+
+
+def previous_trading_day(day):
+    day -= datetime.timedelta(days=1)
+    while not is_trading_day(day):
+        day -= datetime.timedelta(days=1)
+    return day
+
+
+def next_trading_day(day):
+    day += datetime.timedelta(days=1)
+    while not is_trading_day(day):
+        day += datetime.timedelta(days=1)
+    return day
+
+
+def session_close(day):
+    """Moment the daily bar for ``day`` is expected to be available."""
+    return datetime.datetime.combine(day, SESSION_CLOSE, tzinfo=EXCHANGE_TIMEZONE) + BAR_PUBLICATION_DELAY
+
+
+def latest_session(now=None):
+    """Date of the most recent session whose daily bar should already be published."""
+    now = now or timezone.now()
+    today = now.astimezone(EXCHANGE_TIMEZONE).date()
+    if is_trading_day(today) and now >= session_close(today):
+        return today
+    return previous_trading_day(today)
@@ -0,0 +1,162 @@
+"""
+Prometheus metrics of the hot paths, served on ``/metrics``: Celery tasks, TwelveData calls, bars written,
+fan-out, HTTP views (through MetricsMiddleware), WebSocket connections and channel layer sends.
+
+With PROMETHEUS_MULTIPROC_DIR set in the environment (before the process starts), every process, Daphne
+and Celery workers alike, writes its values to that directory and ``/metrics`` adds them all up. Processes
+tell their files apart by host name and pid. prometheus_client needs the directory emptied between runs, so
+each container gets its own, which its start script clears, under a shared PROMETHEUS_MULTIPROC_ROOT that
+``/metrics`` reads every directory of.
+"""
+import atexit
+import glob
+import os
+import socket
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from celery.signals import task_postrun, task_prerun, worker_process_shutdown
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    values,
+)
+
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+
+def process_identifier():
+    # MultiProcessCollector splits file names on "_"
+    return f"{socket.gethostname().replace('_', '-')}-{os.getpid()}"
+
+
+if MULTIPROCESS:
+    values.ValueClass = values.MultiProcessValue(process_identifier)
+
+# Tasks can wait minutes on the TwelveData rate limit
+TASK_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+TASK_DURATION = Histogram("djangostock_task_duration_seconds", "Celery task run time.", ["task"], buckets=TASK_BUCKETS)
+TASK_RUNS = Counter("djangostock_task_runs_total", "Celery task runs, by final state.", ["task", "state"])
+UPSTREAM_REQUESTS = Counter(
+    "djangostock_upstream_requests_total",
+    "TwelveData calls by outcome: ok, rate_limited, error (5xx or transport) or rejected (circuit open).",
+    ["endpoint", "outcome"],
+)
+UPSTREAM_DURATION = Histogram("djangostock_upstream_request_duration_seconds", "TwelveData call time.", ["endpoint"])
+BARS_WRITTEN = Counter("djangostock_bars_written_total", "StockTimeSeries rows written.", ["source"])
+FAN_OUT_DURATION = Histogram("djangostock_fan_out_duration_seconds", "Time to send a stock update to its followers.")
+FAN_OUT_MESSAGES = Counter("djangostock_fan_out_messages_total", "Stock updates sent to followers.")
+HTTP_REQUESTS = Counter(
+    "djangostock_http_requests_total", "HTTP responses by view route.", ["route", "method", "status"]
+)
+HTTP_DURATION = Histogram("djangostock_http_request_duration_seconds", "HTTP response time.", ["route", "method"])
+WEBSOCKET_CONNECTIONS = Gauge(
+    "djangostock_websocket_connections", "Open HomeConsumer connections.", multiprocess_mode="livesum"
+)
+WEBSOCKET_MESSAGES = Counter("djangostock_websocket_messages_total", "Messages sent to WebSockets.", ["type"])
+CHANNEL_LAYER_SEND_DURATION = Histogram(
+    "djangostock_channel_layer_send_duration_seconds", "Channel layer group_send time.", ["type"]
+)
+# Of the requests sampled by djangostock.application.profiling
+DB_QUERIES = Histogram(
+    "djangostock_db_queries_per_request",
+    "Queries run by a request.",
+    ["route"],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+DB_DURATION = Histogram("djangostock_db_duration_seconds", "Time a request spent in the database.", ["route"])
+QUERY_BUDGET_EXCEEDED = Counter(
+    "djangostock_query_budget_exceeded_total",
+    "Requests over a limit of their QUERY_PROFILING budget.",
+    ["route", "limit"],
+)
+
+
+class MultiDirectoryCollector:
+    """MultiProcessCollector over the directories of ``root``, one per container."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def collect(self):
+        files = glob.glob(os.path.join(self.root, "*", "*.db"))
+        return multiprocess.MultiProcessCollector.merge(files, accumulate=True)
+
+
+def metrics_view(request):
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        if "PROMETHEUS_MULTIPROC_ROOT" in os.environ:
+            registry.register(MultiDirectoryCollector(os.environ["PROMETHEUS_MULTIPROC_ROOT"]))
+        else:
+            multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+class MetricsMiddleware:
+    """Count and time responses by the route of their view, e.g. ``stock/prices/``."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self.observe(request, response, start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, response, start)
+        return response
+
+    def observe(self, request, response, start):
+        match = request.resolver_match
+        route = match.route if match else "unmatched"
+        HTTP_DURATION.labels(route, request.method).observe(time.perf_counter() - start)
+        HTTP_REQUESTS.labels(route, request.method, response.status_code).inc()
+
+
+_task_started = {}
+
+
+@task_prerun.connect
+def task_started(task_id, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def task_finished(task_id, task, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        TASK_DURATION.labels(task.name).observe(time.perf_counter() - started)
+    TASK_RUNS.labels(task.name, state or "UNKNOWN").inc()
+
+
+def mark_process_dead(**kwargs):
+    """Drop the live gauges of this process, e.g. its WebSocket connections."""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(process_identifier())
+
+
+# Prefork children leave through os._exit, which skips atexit
+worker_process_shutdown.connect(mark_process_dead)
+atexit.register(mark_process_dead)
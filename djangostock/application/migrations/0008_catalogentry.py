@@ -0,0 +1,46 @@
+# Generated by Django 4.2.4 on 2026-10-19 11:50
+
+from django.db import migrations, models
+
+# gin_trgm_ops on UPPER(name) serves the ``istartswith`` / ``icontains`` lookups used by
+# CatalogEntryManager.search, which Django compiles to ``UPPER(name) LIKE UPPER(%s)``.
+CREATE_NAME_TRIGRAM_INDEX = """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX application_catalogentry_name_trgm ON application_catalogentry USING gin (UPPER(name) gin_trgm_ops);
+"""
+
+DROP_NAME_TRIGRAM_INDEX = "DROP INDEX IF EXISTS application_catalogentry_name_trgm;"
+
+
+def create_name_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(CREATE_NAME_TRIGRAM_INDEX)
+
+
+def drop_name_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(DROP_NAME_TRIGRAM_INDEX)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("application", "0007_alter_stocktimeseries_stock_follow"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CatalogEntry",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.CharField(max_length=250)),
+                ("symbol", models.CharField(max_length=40, unique=True)),
+                ("exchange_name", models.CharField(max_length=40)),
+                ("mic_code", models.CharField(blank=True, max_length=10)),
+                ("type_of_stock", models.CharField(choices=[("Common Stock", "Common Stock")], max_length=100)),
+                ("currency", models.CharField(max_length=40)),
+                ("country", models.CharField(max_length=100)),
+                ("sync_date", models.DateTimeField()),
+            ],
+        ),
+        migrations.RunPython(create_name_trigram_index, drop_name_trigram_index),
+    ]
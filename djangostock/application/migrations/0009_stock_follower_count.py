@@ -0,0 +1,31 @@
+# Generated by Django 4.2.4 on 2026-10-19 11:54
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_followers(apps, schema_editor):
+    Stock = apps.get_model("application", "Stock")
+    Follow = apps.get_model("application", "Follow")
+    followers = Follow.objects.filter(stock=OuterRef("pk")).values("stock").annotate(count=Count("pk")).values("count")
+    Stock.objects.update(follower_count=Coalesce(Subquery(followers), 0))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("application", "0008_catalogentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="stock",
+            name="follower_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="stock",
+            index=models.Index(fields=["-follower_count", "symbol"], name="stock_popularity_idx"),
+        ),
+        migrations.RunPython(count_followers, migrations.RunPython.noop),
+    ]
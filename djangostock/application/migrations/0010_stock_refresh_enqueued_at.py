@@ -0,0 +1,17 @@
+# Generated by Django 4.2.4 on 2026-10-19 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("application", "0009_stock_follower_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="stock",
+            name="refresh_enqueued_at",
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.4 on 2026-10-19 12:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("application", "0010_stock_refresh_enqueued_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BackfillWindow",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("start_date", models.DateField()),
+                ("end_date", models.DateField()),
+                ("rows", models.PositiveIntegerField()),
+                ("completed_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "stock",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="backfill_windows",
+                        to="application.stock",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("stock", "start_date", "end_date")},
+            },
+        ),
+    ]
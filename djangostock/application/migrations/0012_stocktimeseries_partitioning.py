@@ -0,0 +1,28 @@
+# Generated by Django 4.2.4 on 2026-10-19 13:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+from djangostock.application import partitions
+
+
+def partition_time_series(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql" or not settings.STOCK_TIME_SERIES_PARTITIONED:
+        return
+    model = apps.get_model("application", "StockTimeSeries")
+    if not partitions.is_partitioned(model._meta.db_table, schema_editor.connection):
+        partitions.partition_table(model, schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("application", "0011_backfillwindow"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="stocktimeseries",
+            index=models.Index(fields=["stock", "-recorded_date"], name="series_stock_date_idx"),
+        ),
+        migrations.RunPython(partition_time_series, migrations.RunPython.noop),
+    ]
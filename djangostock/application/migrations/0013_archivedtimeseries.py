@@ -0,0 +1,33 @@
+# Generated by Django 4.2.4 on 2026-10-19 13:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("application", "0012_stocktimeseries_partitioning"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedTimeSeries",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("year", models.PositiveSmallIntegerField()),
+                ("start_date", models.DateField()),
+                ("end_date", models.DateField()),
+                ("rows", models.PositiveIntegerField()),
+                ("data", models.BinaryField()),
+                (
+                    "stock",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="archives", to="application.stock"
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("stock", "year")},
+            },
+        ),
+    ]
@@ -1,7 +1,7 @@
 from django.contrib.auth.base_user import AbstractBaseUser
 from django.db import models
 
-from .managers import UserManager
+from .managers import UserManager, CatalogEntryManager, FollowManager, StockQuerySet
 
 
 class ModelWithTimestamps(models.Model):
@@ -58,14 +58,29 @@ class Stock(models.Model):
     exchange_name = models.fields.CharField(max_length=40)
     type_of_stock = models.fields.CharField(max_length=100, choices=TypeOfStock.choices)
     last_update_date = models.DateField(null=True)
+    # Last time the scheduler queued a refresh, so that queued symbols are not queued again
+    refresh_enqueued_at = models.DateTimeField(null=True)
     currency = models.ForeignKey(Currency, on_delete=models.PROTECT)
     country = models.ForeignKey(Country, on_delete=models.PROTECT)
 
     followers = models.ManyToManyField(User, related_name="follows", through="Follow")
+    # Maintained by FollowManager and the Follow signals; `manage.py reconcile_follower_counts` repairs drift.
+    follower_count = models.PositiveIntegerField(default=0)
+
+    objects = StockQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-follower_count", "symbol"], name="stock_popularity_idx"),
+        ]
 
     @property
     def latest_time_series(self):
-        return self.series.latest("recorded_date")
+        series = self.series.all()
+        if self.last_update_date:
+            # The newest bar is on last_update_date; the bound prunes older partitions
+            series = series.filter(recorded_date__gte=self.last_update_date)
+        return series.latest("recorded_date")
 
 
 class StockTimeSeries(models.Model):
@@ -77,10 +92,62 @@ class StockTimeSeries(models.Model):
     volume = models.fields.IntegerField()
     recorded_date = models.DateField()
 
+    class Meta:
+        # Also what lets a partitioned table (see djangostock.application.partitions) find the newest bar
+        # of a stock in its newest partition
+        indexes = [models.Index(fields=["stock", "-recorded_date"], name="series_stock_date_idx")]
+
+
+class ArchivedTimeSeries(models.Model):
+    """
+    The bars of ``stock`` in ``year`` older than the archive horizon, compacted out of StockTimeSeries into
+    a compressed Parquet block by ``manage.py archive_time_series`` (see djangostock.application.archive).
+    """
+
+    stock = models.ForeignKey(Stock, related_name="archives", on_delete=models.CASCADE)
+    year = models.PositiveSmallIntegerField()
+    start_date = models.DateField()
+    end_date = models.DateField()
+    rows = models.PositiveIntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        unique_together = ["stock", "year"]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     stock = models.ForeignKey(Stock, on_delete=models.CASCADE)
 
+    objects = FollowManager()
+
     class Meta:
         unique_together = ["user", "stock"]
+
+
+class CatalogEntry(models.Model):
+    """Local copy of the instruments TwelveData lists as tradable, refreshed by ``sync_stock_catalog``."""
+
+    name = models.fields.CharField(max_length=250)
+    symbol = models.fields.CharField(max_length=40, unique=True)
+    exchange_name = models.fields.CharField(max_length=40)
+    mic_code = models.fields.CharField(max_length=10, blank=True)
+    type_of_stock = models.fields.CharField(max_length=100, choices=Stock.TypeOfStock.choices)
+    currency = models.fields.CharField(max_length=40)
+    country = models.fields.CharField(max_length=100)
+    sync_date = models.DateTimeField()
+
+    objects = CatalogEntryManager()
+
+
+class BackfillWindow(models.Model):
+    """Checkpoint of ``manage.py backfill``: the bars of ``stock`` from start_date to end_date are stored."""
+
+    stock = models.ForeignKey(Stock, related_name="backfill_windows", on_delete=models.CASCADE)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    rows = models.PositiveIntegerField()
+    completed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ["stock", "start_date", "end_date"]
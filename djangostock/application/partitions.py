@@ -0,0 +1,155 @@
+"""
+Optional PostgreSQL range partitioning of StockTimeSeries by recorded_date, one partition per year.
+
+With STOCK_TIME_SERIES_PARTITIONED, migration 0012 turns the table into a partitioned table, and
+``manage.py time_series_partitions`` creates the partitions of the coming years and detaches old ones.
+Queries constrained on recorded_date only scan the partitions they need, and the newest bar of a stock
+is found in the newest partition, so they stay as fast as history grows.
+"""
+import datetime
+
+from django.db import connection as default_connection, transaction
+
+# Bars outside every yearly partition land here rather than failing to insert
+DEFAULT_PARTITION_SUFFIX = "default"
+
+
+def partition_name(table, year):
+    return f"{table}_y{year}"
+
+
+def is_partitioned(table, connection=default_connection):
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [table])
+        return cursor.fetchone() is not None
+
+
+def partitions(table, connection=default_connection):
+    """Names of the partitions attached to ``table``, by name."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass(%s) ORDER BY 1", [table]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def create_partition(table, year, connection=default_connection):
+    """
+    Create the partition of ``year`` if it does not exist, moving the bars of ``year`` out of the default
+    partition into it. Returns whether it was created.
+    """
+    name = partition_name(table, year)
+    attached = partitions(table, connection)
+    if name in attached:
+        return False
+    default = f"{table}_{DEFAULT_PARTITION_SUFFIX}"
+    qn = connection.ops.quote_name
+    bounds = [datetime.date(year, 1, 1), datetime.date(year + 1, 1, 1)]
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        # PostgreSQL refuses to create a partition while the default partition holds rows of its range, so
+        # the default partition is detached, emptied of them into the new partition and attached again
+        if default in attached:
+            cursor.execute(f"ALTER TABLE {qn(table)} DETACH PARTITION {qn(default)}")
+        cursor.execute(f"CREATE TABLE {qn(name)} PARTITION OF {qn(table)} FOR VALUES FROM (%s) TO (%s)", bounds)
+        if default in attached:
+            cursor.execute(
+                f"WITH moved AS (DELETE FROM {qn(default)} WHERE recorded_date >= %s AND recorded_date < %s "
+                f"RETURNING *) INSERT INTO {qn(table)} SELECT * FROM moved",
+                bounds,
+            )
+            cursor.execute(f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(default)} DEFAULT")
+    return True
+
+
+def create_future_partitions(table, years_ahead=1, connection=default_connection):
+    """Make sure the partitions of this year and the next ``years_ahead`` exist. Returns the years created."""
+    this_year = datetime.date.today().year
+    return [
+        year for year in range(this_year, this_year + years_ahead + 1) if create_partition(table, year, connection)
+    ]
+
+
+def partition_years(table, connection=default_connection):
+    """Years of the yearly partitions attached to ``table``."""
+    prefix = partition_name(table, "")
+    return sorted(int(name.removeprefix(prefix)) for name in partitions(table, connection) if name.startswith(prefix))
+
+
+def detach_partition(table, year, drop=False, connection=default_connection):
+    """
+    Detach the partition of ``year``: its bars are no longer queried but stay in a table of their own
+    (unless ``drop``) to be archived or attached again. Returns whether there was such a partition.
+    """
+    name = partition_name(table, year)
+    if name not in partitions(table, connection):
+        return False
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {qn(table)} DETACH PARTITION {qn(name)}")
+        if drop:
+            cursor.execute(f"DROP TABLE {qn(name)}")
+    return True
+
+
+def partition_table(model, connection, years_ahead=1):
+    """
+    Replace the table of ``model`` by a partitioned table with the same columns, indexes and foreign keys,
+    with yearly partitions from its oldest bar to ``years_ahead`` years from now, and copy the rows over.
+    """
+    table = model._meta.db_table
+    old_table = f"{table}_unpartitioned"
+    qn = connection.ops.quote_name
+    introspection = connection.introspection
+
+    with connection.cursor() as cursor:
+        constraints = introspection.get_constraints(cursor, table)
+        cursor.execute(f"SELECT MIN(recorded_date) FROM {qn(table)}")
+        oldest = cursor.fetchone()[0] or datetime.date.today()
+
+        cursor.execute(f"ALTER TABLE {qn(table)} RENAME TO {qn(old_table)}")
+        # Free the names of the old indexes and constraints for the new table
+        for name, constraint in constraints.items():
+            if constraint["index"] and not constraint["unique"] and not constraint["primary_key"]:
+                cursor.execute(f"ALTER INDEX {qn(name)} RENAME TO {qn(name + '_old')}")
+            else:
+                cursor.execute(f"ALTER TABLE {qn(old_table)} RENAME CONSTRAINT {qn(name)} TO {qn(name + '_old')}")
+
+        columns = []
+        for field in model._meta.local_fields:
+            db_type = field.rel_db_type(connection) if field.primary_key else field.db_type(connection)
+            if field.primary_key:
+                db_type += " GENERATED BY DEFAULT AS IDENTITY"
+            columns.append(f"{qn(field.column)} {db_type}{'' if field.null else ' NOT NULL'}")
+        pk = model._meta.pk.column
+        # The partition key has to be part of the primary key
+        cursor.execute(
+            f"CREATE TABLE {qn(table)} ({', '.join(columns)}, PRIMARY KEY ({qn(pk)}, recorded_date)) "
+            f"PARTITION BY RANGE (recorded_date)"
+        )
+        cursor.execute(f"CREATE TABLE {qn(table + '_' + DEFAULT_PARTITION_SUFFIX)} PARTITION OF {qn(table)} DEFAULT")
+        for year in range(oldest.year, datetime.date.today().year + years_ahead + 1):
+            create_partition(table, year, connection)
+
+        names = ", ".join(qn(field.column) for field in model._meta.local_fields)
+        cursor.execute(f"INSERT INTO {qn(table)} ({names}) SELECT {names} FROM {qn(old_table)}")
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, %s), COALESCE(MAX({qn(pk)}), 0) + 1, false) FROM {qn(table)}",
+            [table, pk],
+        )
+
+        for name, constraint in constraints.items():
+            columns = ", ".join(qn(column) for column in constraint["columns"])
+            if constraint["foreign_key"]:
+                to_table, to_column = constraint["foreign_key"]
+                cursor.execute(
+                    f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} FOREIGN KEY ({columns}) "
+                    f"REFERENCES {qn(to_table)} ({qn(to_column)}) DEFERRABLE INITIALLY DEFERRED"
+                )
+            elif constraint["index"] and not constraint["unique"] and not constraint["primary_key"]:
+                orders = constraint.get("orders") or ["ASC"] * len(constraint["columns"])
+                columns = ", ".join(f"{qn(column)} {order}" for column, order in zip(constraint["columns"], orders))
+                # An index on the partitioned table is created on every partition, present and future
+                cursor.execute(f"CREATE INDEX {qn(name)} ON {qn(table)} ({columns})")
+        cursor.execute(f"DROP TABLE {qn(old_table)}")
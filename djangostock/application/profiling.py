@@ -0,0 +1,133 @@
+"""
+Sampled query profiling of requests, safe to leave on in production: it needs no DEBUG and only wraps the
+database connections of the requests it samples. See the QUERY_PROFILING setting.
+
+A sampled request gets a ``Server-Timing`` header with its database and total time and query count. It
+counts in the djangostock_db_* metrics, and a request over its route's budget is logged with its slowest SQL.
+"""
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from .metrics import DB_DURATION, DB_QUERIES, QUERY_BUDGET_EXCEEDED
+
+logger = logging.getLogger(__name__)
+
+# Logged SQL is cut to this many characters
+MAX_SQL_LENGTH = 1000
+
+
+class QueryProfile:
+    """Database execute wrapper that counts and times queries, and keeps the slowest one."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest_duration = 0.0
+        self.slowest_sql = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            if duration >= self.slowest_duration:
+                self.slowest_duration = duration
+                self.slowest_sql = sql
+
+
+def budget(route):
+    """The budget of ``route``: the default one updated with the route's own, if any."""
+    budgets = settings.QUERY_PROFILING["BUDGETS"]
+    return {**budgets["default"], **budgets.get(route, {})}
+
+
+def over_budget(profile, total, route):
+    """Names of the limits of ``route``'s budget that a request broke."""
+    limits = budget(route)
+    over = []
+    if profile.count > limits["queries"]:
+        over.append("queries")
+    if profile.duration * 1000 > limits["db_ms"]:
+        over.append("db_ms")
+    if total * 1000 > limits["total_ms"]:
+        over.append("total_ms")
+    return over
+
+
+def profile_connections(profile):
+    """An ExitStack wrapping the database connections of the current thread with ``profile``."""
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(profile))
+    return stack
+
+
+class QueryProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= settings.QUERY_PROFILING["SAMPLE_RATE"]:
+            return self.get_response(request)
+
+        profile = QueryProfile()
+        start = time.perf_counter()
+        with profile_connections(profile):
+            response = self.get_response(request)
+        return self.report(request, response, profile, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if random.random() >= settings.QUERY_PROFILING["SAMPLE_RATE"]:
+            return await self.get_response(request)
+
+        profile = QueryProfile()
+        start = time.perf_counter()
+        # Connections are per thread: the request's sync code and async ORM calls share one thread, wrap its own
+        stack = await sync_to_async(profile_connections)(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.report(request, response, profile, time.perf_counter() - start)
+
+    def report(self, request, response, profile, total):
+        match = request.resolver_match
+        route = match.route if match else "unmatched"
+        db_ms, total_ms = profile.duration * 1000, total * 1000
+        response["Server-Timing"] = f'db;dur={db_ms:.1f};desc="{profile.count} queries", total;dur={total_ms:.1f}'
+        DB_QUERIES.labels(route).observe(profile.count)
+        DB_DURATION.labels(route).observe(profile.duration)
+
+        over = over_budget(profile, total, route)
+        for limit in over:
+            QUERY_BUDGET_EXCEEDED.labels(route, limit).inc()
+        if over:
+            logger.warning(
+                "%s %s over budget (%s): %d queries, %.1f ms in the database, %.1f ms in total; "
+                "slowest query, %.1f ms: %s",
+                request.method,
+                request.path,
+                ", ".join(over),
+                profile.count,
+                db_ms,
+                total_ms,
+                profile.slowest_duration * 1000,
+                (profile.slowest_sql or "")[:MAX_SQL_LENGTH],
+            )
+        return response
@@ -0,0 +1,35 @@
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+
+class RateLimiter:
+    """
+    At most ``limit`` calls per ``period`` seconds, counted in fixed windows in the Django cache,
+    so that every process calling the same upstream shares one budget.
+    """
+
+    def __init__(self, name, limit, period=60):
+        self.name = name
+        self.limit = limit
+        self.period = period
+
+    def _take(self, now):
+        """Take a slot in the current window; return 0, or the seconds until the next window."""
+        window = int(now // self.period)
+        key = f"ratelimit:{self.name}:{window}"
+        cache.add(key, 0, timeout=self.period * 2)
+        if cache.incr(key) <= self.limit:
+            return 0
+        return (window + 1) * self.period - now
+
+    def wait(self):
+        while delay := self._take(time.time()):
+            time.sleep(delay)
+
+    async def await_turn(self):
+        # Off the event loop: the cache is a blocking round trip to Redis
+        while delay := await sync_to_async(self._take, thread_sensitive=False)(time.time()):
+            await asyncio.sleep(delay)
@@ -0,0 +1,80 @@
+"""
+JSON renderer and parser on orjson, drop-in replacements for DRF's JSONRenderer and JSONParser that encode
+and decode several times faster. They are the defaults in ``REST_FRAMEWORK``, and the WebSocket consumer
+encodes its messages with FastJSONRenderer too.
+
+orjson encodes dates, datetimes (with their microseconds, as DRF's JSONEncoder does), UUIDs and dict and
+list subclasses itself; anything else, e.g. Decimals, lazy strings or querysets, goes through DRF's
+JSONEncoder. What orjson cannot encode like DRF is handed to DRF's JSONRenderer instead: integers over 64
+bits, which orjson refuses, and NaN and infinities, which orjson writes as null and DRF rejects under
+STRICT_JSON. The rendered output is DRF's byte for byte, but for the indent, see FastJSONRenderer.
+"""
+import decimal
+import math
+
+from django.conf import settings
+
+import orjson
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+_default = JSONEncoder().default
+
+# Non-string keys are written as strings like json does, and UTC datetimes end in Z like DRF's
+OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+
+
+def dumps(data, indent=False):
+    """``data`` as UTF-8 encoded JSON, indented by two spaces if ``indent``."""
+    ret = orjson.dumps(data, default=_default, option=(OPTIONS | orjson.OPT_INDENT_2) if indent else OPTIONS)
+    # Escaped like DRF does, to keep the output a strict JavaScript subset
+    if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+        ret = ret.replace("\u2028".encode(), b"\\u2028").replace("\u2029".encode(), b"\\u2029")
+    return ret
+
+
+def has_non_finite(data):
+    """Whether ``data`` holds a NaN or infinite float or Decimal, which orjson would write as null."""
+    if isinstance(data, float):
+        return not math.isfinite(data)
+    if isinstance(data, decimal.Decimal):
+        return not data.is_finite()
+    if isinstance(data, dict):
+        return any(has_non_finite(value) for value in data.values())
+    if isinstance(data, (list, tuple)):
+        return any(has_non_finite(value) for value in data)
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer on orjson. Any ``indent`` asked for, e.g. by the browsable API, gives two spaces."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        try:
+            ret = dumps(data, indent=bool(self.get_indent(accepted_media_type, renderer_context or {})))
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Only output with a null can hide a NaN; most large responses, e.g. bars, have none
+        if b"null" in ret and has_non_finite(data):
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser on orjson, which always rejects NaN and infinities."""
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get("encoding", settings.DEFAULT_CHARSET)
+        data = stream.read()
+        try:
+            if encoding.lower().replace("_", "-") not in ("utf-8", "utf8"):
+                data = data.decode(encoding)
+            return orjson.loads(data)
+        except (ValueError, LookupError) as exc:
+            raise ParseError(f"JSON parse error - {exc}")
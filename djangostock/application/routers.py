@@ -0,0 +1,81 @@
+"""
+Optional read replicas, listed in DATABASE_REPLICA_URLS. Only the views decorated with ``replica_reads`` read
+from them, and only this app's models: writes, tasks, the fan-out, sessions and every other view stay on
+the primary, which keeps the replicas off the ingestion path's read-after-write.
+
+Replicas lag behind, so a user who changed their follows (a follow, an unfollow or an onboarding) in the
+last DATABASE_REPLICA_STICKINESS seconds reads from the primary and sees their own change. So does everyone
+for that long after the data version moved, e.g. when bars land: the conditional views take their ETag and
+Last-Modified from the current version, and a body read from a replica behind it would be cached by clients
+under that ETag until the next change. DATABASE_REPLICA_STICKINESS should cover the replicas' lag.
+"""
+import contextvars
+import random
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+
+from . import versions
+
+_replica_reads = contextvars.ContextVar("djangostock_replica_reads", default=False)
+
+
+@contextmanager
+def read_from_replicas():
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def pinned(user_id=None):
+    """Whether the data, or the follows of ``user_id``, changed too recently to read from a replica."""
+    return time.time() - versions.modified(user_id) < settings.DATABASE_REPLICA_STICKINESS
+
+
+def replica_reads(view):
+    """View decorator: the view reads from a replica, unless the request is pinned to the primary."""
+
+    def use_primary(request):
+        return not settings.DATABASE_REPLICAS or pinned(request.user.pk if request.user.is_authenticated else None)
+
+    if iscoroutinefunction(view):
+
+        @wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            if await sync_to_async(use_primary)(request):
+                return await view(request, *args, **kwargs)
+            with read_from_replicas():
+                return await view(request, *args, **kwargs)
+
+        return wrapped
+
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        if use_primary(request):
+            return view(request, *args, **kwargs)
+        with read_from_replicas():
+            return view(request, *args, **kwargs)
+
+    return wrapped
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and settings.DATABASE_REPLICAS and model._meta.app_label == "application":
+            return random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # A replica holds the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return False if db in settings.DATABASE_REPLICAS else None
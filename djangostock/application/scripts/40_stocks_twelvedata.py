@@ -1,34 +1,23 @@
 import os
 import sys
-import random
 from pathlib import Path
 
 import django
-import requests
 
 
 sys.path.append(Path(__file__).parent.parent.parent.parent.as_posix())
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "djangostock.settings.local")
 django.setup()
 
-from djangostock.application.serializers import StockSerializer
-from djangostock.application.models import Stock
+from djangostock.application.serializers import StockSerializer, CatalogEntrySerializer
+from djangostock.application.models import Stock, CatalogEntry
+from djangostock.application.tasks import sync_stock_catalog
 
-if not Stock.objects.exists():
-    query_params = {
-        "currency": "USD",
-        "country": "United States",
-        "exchange": "NASDAQ",
-        "type": "Common Stock",
-    }
-
-    r = requests.get(
-        "https://api.twelvedata.com/stocks",
-        params=query_params,
-    )
-    stocks = random.sample(r.json()["data"], 40)
+if not CatalogEntry.objects.exists():
+    sync_stock_catalog()
 
-    for stock in stocks:
-        serializer = StockSerializer(data=stock)
+if not Stock.objects.exists():
+    for entry in CatalogEntry.objects.order_by("?")[:40]:
+        serializer = StockSerializer(data=CatalogEntrySerializer(entry).data)
         if serializer.is_valid():
             serializer.save()
@@ -0,0 +1,53 @@
+"""
+Weigh compression CPU time against bytes saved on the JSON of /stock/prices/ and /stock/history/:
+
+    python djangostock/application/scripts/benchmark_compression.py [--stocks 1000] [--years 20] [--mbps 10]
+
+"gain" is the transfer time saved at --mbps minus the time spent compressing.
+"""
+import argparse
+import gzip
+import os
+import sys
+import timeit
+from pathlib import Path
+
+import django
+
+import brotli
+
+sys.path.append(Path(__file__).parent.parent.parent.parent.as_posix())
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "djangostock.settings.local")
+django.setup()
+
+from payloads import sample_payloads
+
+from djangostock.application.renderers import FastJSONRenderer
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--stocks", type=int, default=1000, help="Stocks in the full prices listing.")
+parser.add_argument("--years", type=int, default=20, help="Years of daily bars in the history.")
+parser.add_argument("--mbps", type=float, default=10, help="Client bandwidth, in megabits per second.")
+parser.add_argument("--repeat", type=int, default=20)
+args = parser.parse_args()
+
+CODECS = {
+    **{f"gzip -{level}": lambda data, level=level: gzip.compress(data, level, mtime=0) for level in (1, 6, 9)},
+    **{
+        f"brotli q{quality}": lambda data, quality=quality: brotli.compress(
+            data, mode=brotli.MODE_TEXT, quality=quality
+        )
+        for quality in (1, 4, 6, 11)
+    },
+}
+bytes_per_ms = args.mbps * 1e6 / 8 / 1e3
+
+for name, payload in sample_payloads(args.stocks, args.years).items():
+    data = FastJSONRenderer().render(payload)
+    print(f"\n{name}: {len(data):,} bytes")
+    print(f"{'codec':<12}{'bytes':>12}{'ratio':>8}{'compress':>12}{'gain':>12}")
+    for codec, compress in CODECS.items():
+        size = len(compress(data))
+        elapsed = min(timeit.repeat(lambda: compress(data), number=args.repeat, repeat=3)) / args.repeat * 1e3
+        gain = (len(data) - size) / bytes_per_ms - elapsed
+        print(f"{codec:<12}{size:>12,}{len(data) / size:>7.1f}x{elapsed:>10.2f}ms{gain:>10.1f}ms")
@@ -0,0 +1,38 @@
+"""
+Time the JSON renderers on the payloads of /stock/prices/ and /stock/history/:
+
+    python djangostock/application/scripts/benchmark_json.py [--stocks 1000] [--years 20] [--repeat 200]
+"""
+import argparse
+import os
+import sys
+import timeit
+from pathlib import Path
+
+import django
+
+sys.path.append(Path(__file__).parent.parent.parent.parent.as_posix())
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "djangostock.settings.local")
+django.setup()
+
+from payloads import sample_payloads
+from rest_framework.renderers import JSONRenderer
+
+from djangostock.application.renderers import FastJSONRenderer
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--stocks", type=int, default=1000, help="Stocks in the full prices listing.")
+parser.add_argument("--years", type=int, default=20, help="Years of daily bars in the history.")
+parser.add_argument("--repeat", type=int, default=200)
+args = parser.parse_args()
+
+payloads = sample_payloads(args.stocks, args.years)
+
+print(f"{'payload':<36}{'JSONRenderer':>14}{'FastJSONRenderer':>18}{'speedup':>9}")
+for name, payload in payloads.items():
+    assert JSONRenderer().render(payload) == FastJSONRenderer().render(payload)
+    timings = [
+        min(timeit.repeat(lambda: renderer.render(payload), number=args.repeat, repeat=3)) / args.repeat
+        for renderer in (JSONRenderer(), FastJSONRenderer())
+    ]
+    print(f"{name:<36}{timings[0] * 1e3:>12.3f}ms{timings[1] * 1e3:>16.3f}ms{timings[0] / timings[1]:>8.1f}x")
@@ -0,0 +1,54 @@
+"""
+Synthetic payloads of /stock/prices/ and /stock/history/ for the benchmark scripts, built with
+fake_twelvedata bars and fast_serializers. Needs Django set up first.
+"""
+import datetime
+
+from djangostock.application import fake_twelvedata, fast_serializers
+from djangostock.application.views import StockPricePagination
+
+
+def bars(symbol, count):
+    days = fake_twelvedata.trading_days(datetime.date.today(), count)
+    return [
+        fast_serializers.bar(
+            {
+                "recorded_date": datetime.date.fromisoformat(value["datetime"]),
+                "open": float(value["open"]),
+                "close": float(value["close"]),
+                "high": float(value["high"]),
+                "low": float(value["low"]),
+                "volume": int(value["volume"]),
+            }
+        )
+        for value in fake_twelvedata.bars(symbol, days)
+    ]
+
+
+def stock(symbol):
+    return {
+        "name": f"Name of Stock {symbol}",
+        "symbol": symbol,
+        "last_update_date": datetime.date.today().isoformat(),
+        "exchange": "NASDAQ",
+        "type": "Common Stock",
+        "currency": "USD",
+        "country": "United States",
+        "latest_data": bars(symbol, 1)[0],
+    }
+
+
+def sample_payloads(stock_count, years):
+    """{name: payload} of a prices page, a listing of ``stock_count`` stocks and ``years`` of daily bars."""
+    stocks = [stock(symbol) for symbol in fake_twelvedata.symbols(stock_count)]
+    page_size = StockPricePagination.page_size
+    return {
+        f"prices page ({page_size} stocks)": {
+            "count": len(stocks),
+            "next": "http://localhost/stock/prices/?page=2",
+            "previous": None,
+            "results": stocks[:page_size],
+        },
+        f"prices, all {len(stocks)} stocks": stocks,
+        f"history, {years} years of bars": bars("AAAA", years * 252),
+    }
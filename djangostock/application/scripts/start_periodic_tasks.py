@@ -10,14 +10,46 @@ django.setup()
 
 from django_celery_beat.models import IntervalSchedule, PeriodicTask
 
+# The task only queues stocks behind the latest session close, so running it often is cheap
 schedule, created = IntervalSchedule.objects.get_or_create(
-    every=12,
-    period=IntervalSchedule.HOURS,
+    every=30,
+    period=IntervalSchedule.MINUTES,
 )
 
-if not PeriodicTask.objects.filter(name="Updating StockTimeSeries").exists():
+PeriodicTask.objects.update_or_create(
+    name="Updating StockTimeSeries",  # simply describes this periodic task.
+    defaults={
+        "interval": schedule,  # we created this above.
+        "task": "djangostock.application.tasks.periodic_update_time_series",  # name of task.
+    },
+)
+
+catalog_schedule, created = IntervalSchedule.objects.get_or_create(
+    every=1,
+    period=IntervalSchedule.DAYS,
+)
+
+if not PeriodicTask.objects.filter(name="Syncing CatalogEntry").exists():
     PeriodicTask.objects.create(
-        interval=schedule,  # we created this above.
-        name="Updating StockTimeSeries",  # simply describes this periodic task.
-        task="djangostock.application.tasks.periodic_update_time_series",  # name of task.
+        interval=catalog_schedule,
+        name="Syncing CatalogEntry",
+        task="djangostock.application.tasks.sync_stock_catalog",
     )
+
+# A no-op unless StockTimeSeries is partitioned
+PeriodicTask.objects.update_or_create(
+    name="Creating StockTimeSeries partitions",
+    defaults={
+        "interval": catalog_schedule,
+        "task": "djangostock.application.tasks.create_time_series_partitions",
+    },
+)
+
+# A no-op unless TIME_SERIES_ARCHIVE_AFTER_DAYS is set
+PeriodicTask.objects.update_or_create(
+    name="Archiving StockTimeSeries",
+    defaults={
+        "interval": catalog_schedule,
+        "task": "djangostock.application.tasks.archive_time_series",
+    },
+)
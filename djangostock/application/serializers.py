@@ -1,7 +1,10 @@
+from django.db.models import Q
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from .models import User, Currency, Country, Stock, StockTimeSeries, Follow
+from .caches import currencies, countries
+from .archive import INTERVALS
+from .models import User, Currency, Country, Stock, StockTimeSeries, Follow, CatalogEntry
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -35,6 +38,29 @@ class CountrySerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class CachedSlugRelatedField(serializers.SlugRelatedField):
+    """
+    SlugRelatedField backed by a ReferenceCache: resolving a slug (creating the row when missing)
+    and rendering the related object both skip the database once the cache is warm.
+    """
+
+    def __init__(self, cache, **kwargs):
+        self.cache = cache
+        kwargs["slug_field"] = cache.slug_field
+        kwargs["queryset"] = cache.model.objects.all()
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str) or not data:
+            self.fail("invalid")
+        return self.cache.get_or_create(data)
+
+    def get_attribute(self, instance):
+        # Read the raw foreign key so that rendering does not lazy-load the related row.
+        pk = getattr(instance, instance._meta.get_field(self.source).attname)
+        return self.cache.get_by_pk(pk)
+
+
 class StockTimeSeriesSerializer(serializers.ModelSerializer):
     datetime = serializers.DateField(source="recorded_date")
 
@@ -52,18 +78,19 @@ class StockTimeSeriesSerializer(serializers.ModelSerializer):
         extra_kwargs = {"stock": {"write_only": "true"}}
 
 
+class StockHistoryQuerySerializer(serializers.Serializer):
+    symbol = serializers.CharField()
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    interval = serializers.ChoiceField(choices=INTERVALS, default="1day")
+
+
 class StockSerializer(serializers.ModelSerializer):
     exchange = serializers.CharField(source="exchange_name")
     type = serializers.CharField(source="type_of_stock")
 
-    currency = serializers.SlugRelatedField(
-        slug_field="name",
-        queryset=Currency.objects.all(),
-    )
-    country = serializers.SlugRelatedField(
-        slug_field="name",
-        queryset=Country.objects.all(),
-    )
+    currency = CachedSlugRelatedField(currencies)
+    country = CachedSlugRelatedField(countries)
     latest_data = StockTimeSeriesSerializer(source="latest_time_series", read_only=True)
 
     class Meta:
@@ -86,7 +113,66 @@ class StockRequestSerializer(serializers.ModelSerializer):
         fields = ["symbol"]
 
 
+class CatalogEntrySerializer(serializers.ModelSerializer):
+    """Same field names as TwelveData's ``/stocks`` payload, so the output can be fed to StockSerializer."""
+
+    exchange = serializers.CharField(source="exchange_name")
+    type = serializers.CharField(source="type_of_stock")
+
+    class Meta:
+        model = CatalogEntry
+        fields = [
+            "name",
+            "symbol",
+            "exchange",
+            "mic_code",
+            "type",
+            "currency",
+            "country",
+        ]
+
+
 class FollowSerializer(serializers.ModelSerializer):
     class Meta:
         model = Follow
         fields = "__all__"
+
+    def create(self, validated_data):
+        Follow.objects.follow(validated_data["user"], [validated_data["stock"].pk])
+        return Follow.objects.get(**validated_data)
+
+
+class PopularStockSerializer(StockSerializer):
+    class Meta(StockSerializer.Meta):
+        fields = StockSerializer.Meta.fields + ["follower_count"]
+
+
+class BulkFollowSerializer(serializers.Serializer):
+    """
+    The complete set of stocks a user wants to follow, given by id, by symbol or both.
+    Validated data carries the resolved ``{stock_id: symbol}`` map under ``stocks_by_id``.
+    """
+
+    MAX_STOCKS = 1000
+
+    stocks = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=MAX_STOCKS)
+    symbols = serializers.ListField(child=serializers.CharField(), required=False, max_length=MAX_STOCKS)
+
+    def validate(self, attrs):
+        if "stocks" not in attrs and "symbols" not in attrs:
+            raise ValidationError("Either stocks or symbols must be provided.")
+        ids = set(attrs.get("stocks", []))
+        symbols = set(attrs.get("symbols", []))
+
+        found = dict(
+            Stock.objects.filter(Q(pk__in=ids) | Q(symbol__in=symbols)).values_list("pk", "symbol"),
+        )
+        errors = {}
+        if ids - found.keys():
+            errors["stocks"] = [f"Unknown stock: {pk}." for pk in sorted(ids - found.keys())]
+        if symbols - set(found.values()):
+            errors["symbols"] = [f"Unknown symbol: {symbol}." for symbol in sorted(symbols - set(found.values()))]
+        if errors:
+            raise ValidationError(errors)
+
+        return {"stocks_by_id": found}
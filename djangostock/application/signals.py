@@ -0,0 +1,63 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .managers import unfollowing
+from .models import Stock, Follow
+from .versions import bump_data_version, bump_follows_version
+
+
+@receiver(m2m_changed, sender=Follow)
+def recount_followers(sender, instance, action, pk_set, **kwargs):
+    """
+    Keep follower_count right when follows change through ``stock.followers`` or ``user.follows``
+    (admin, shell) instead of FollowManager.
+    """
+    if isinstance(instance, Stock):
+        if action == "pre_clear":
+            instance._cleared_user_ids = list(instance.followers.values_list("pk", flat=True))
+        elif action in ("post_add", "post_remove"):
+            Stock.objects.filter(pk=instance.pk).recount_followers()
+            for user_id in pk_set:
+                bump_follows_version(user_id)
+        elif action == "post_clear":
+            Stock.objects.filter(pk=instance.pk).recount_followers()
+            for user_id in instance.__dict__.pop("_cleared_user_ids", []):
+                bump_follows_version(user_id)
+        return
+
+    if action == "pre_clear":
+        instance._cleared_stock_ids = list(instance.follows.values_list("pk", flat=True))
+    elif action in ("post_add", "post_remove"):
+        Stock.objects.filter(pk__in=pk_set).recount_followers()
+        bump_follows_version(instance.pk)
+    elif action == "post_clear":
+        Stock.objects.filter(pk__in=instance.__dict__.pop("_cleared_stock_ids", [])).recount_followers()
+        bump_follows_version(instance.pk)
+
+
+@receiver(post_save, sender=Stock)
+@receiver(post_delete, sender=Stock)
+def stock_changed(sender, **kwargs):
+    bump_data_version()
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    # FollowManager, which the API goes through, bulk creates without signals and counts itself
+    if created:
+        Stock.objects.filter(pk=instance.stock_id).update(follower_count=F("follower_count") + 1)
+    bump_follows_version(instance.user_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    """
+    Count down follows deleted one by one, by a queryset or by deleting their user or stock.
+    FollowManager.unfollow counts its deletes itself, in one query.
+    """
+    if unfollowing.get():
+        return
+    Stock.objects.filter(pk=instance.stock_id).update(follower_count=Greatest(F("follower_count") - 1, 0))
+    bump_follows_version(instance.user_id)
@@ -1,72 +1,251 @@
-import datetime
+import time
 
-import requests
 from asgiref.sync import async_to_sync
 from celery import shared_task
+from celery.utils import uuid
 from channels.layers import get_channel_layer
 from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
 
-from djangostock.application.models import Stock
+from djangostock.application import archive, fast_serializers, market_calendar, partitions, tracing, twelvedata
+from djangostock.application.ingest import parse_bars, store_bars
+from djangostock.application.locks import get_lock_backend, symbol_lock_key
+from djangostock.application.metrics import (
+    BARS_WRITTEN,
+    CHANNEL_LAYER_SEND_DURATION,
+    FAN_OUT_DURATION,
+    FAN_OUT_MESSAGES,
+)
+from djangostock.application.models import Stock, CatalogEntry, StockTimeSeries, Follow
 
-from djangostock.application.serializers import StockTimeSeriesSerializer, StockSerializer
+# Celery priorities (0-9, higher first) within a queue
+PRIORITY_INTERACTIVE = 9
+PRIORITY_BULK = 3
 
+CATALOG_QUERY_PARAMS = {
+    "currency": "USD",
+    "country": "United States",
+    "exchange": "NASDAQ",
+    "type": "Common Stock",
+}
 
-@shared_task(ignore_result=True)
-def update_time_series(symbol):
+
+# A run due sooner than this is left alone by take_over, it may be starting already
+TAKE_OVER_MARGIN = 60
+
+
+def _due_key(symbol):
+    return f"update_time_series:due:{symbol}"
+
+
+def _superseded_key(task_id):
+    return f"update_time_series:superseded:{task_id}"
+
+
+def _set_due(symbol, task_id, countdown):
+    """Remember that ``task_id`` runs for ``symbol`` in ``countdown`` seconds, for take_over."""
+    cache.set(_due_key(symbol), (task_id, time.time() + countdown), timeout=countdown + TAKE_OVER_MARGIN)
+
+
+def _take_over(symbol, key, lock):
+    """Supersede the run queued for ``symbol`` if it is not due for a while. Returns whether it was."""
+    pending = cache.get(_due_key(symbol))
+    if pending is None:
+        return False
+    pending_id, due = pending
+    if due - time.time() < TAKE_OVER_MARGIN or lock.holder(key) != pending_id:
+        return False
+    # The superseded run, and its retries, end as soon as they start
+    cache.set(_superseded_key(pending_id), True, timeout=due - time.time() + settings.UPDATE_TIME_SERIES_LOCK_TTL)
+    cache.delete(_due_key(symbol))
+    lock.release(key, pending_id)
+    return True
+
+
+def enqueue_update_time_series(symbol, countdown=0, take_over=False, **options):
+    """
+    Queue update_time_series for ``symbol`` unless a run for it is already queued or in progress.
+    With ``take_over``, for a user waiting on the bars, a run queued to start later (a deferral, a retry or
+    a periodic batch's countdown) is superseded by this one instead.
+    Returns the task id, or None when the call was a no-op.
+    """
+    task_id = uuid()
+    key = symbol_lock_key(symbol)
+    lock = get_lock_backend()
+    ttl = countdown + settings.UPDATE_TIME_SERIES_LOCK_TTL
+    if not lock.acquire(key, task_id, ttl):
+        if not (take_over and _take_over(symbol, key, lock) and lock.acquire(key, task_id, ttl)):
+            return None
+    if countdown:
+        _set_due(symbol, task_id, countdown)
+    try:
+        update_time_series.apply_async(kwargs={"symbol": symbol}, countdown=countdown, task_id=task_id, **options)
+    except Exception:
+        lock.release(key, task_id)
+        raise
+    return task_id
+
+
+@shared_task(bind=True, ignore_result=True)
+def update_time_series(self, symbol):
+    # The lock is already ours when queued by enqueue_update_time_series, under the same task id
+    token = self.request.id or uuid()
+    if cache.get(_superseded_key(token)):
+        return
+    key = symbol_lock_key(symbol)
+    lock = get_lock_backend()
+    if not lock.acquire(key, token, settings.UPDATE_TIME_SERIES_LOCK_TTL):
+        return
+    pending = cache.get(_due_key(symbol))
+    if pending is not None and pending[0] == token:
+        cache.delete(_due_key(symbol))
+    deferred = False
+    try:
+        _update_time_series(symbol)
+    except twelvedata.UpstreamUnavailable as e:
+        if self.request.retries >= settings.TWELVEDATA_MAX_DEFERRALS:
+            raise
+        countdown = twelvedata.breaker.retry_delay(self.request.retries)
+        # Keep the symbol ours while deferred; the retry runs under the same task id
+        lock.acquire(key, token, countdown + settings.UPDATE_TIME_SERIES_LOCK_TTL)
+        _set_due(symbol, token, countdown)
+        deferred = True
+        raise self.retry(exc=e, countdown=countdown, max_retries=settings.TWELVEDATA_MAX_DEFERRALS)
+    finally:
+        if not deferred:
+            lock.release(key, token)
+
+
+def _update_time_series(symbol):
     query_params = {
         "symbol": symbol,
         "apikey": settings.API_KEY_TWELVEDATA,
         "interval": "1day",
     }
 
-    r = requests.get(
-        "https://api.twelvedata.com/time_series",
-        params=query_params,
-    )
+    r = twelvedata.get("time_series", query_params)
     if r.status_code == 200 and r.json()["status"] == "ok":
-        updated = False
         stock = Stock.objects.get(symbol=symbol)
-        if not stock.last_update_date:
-            stock.last_update_date = r.json()["values"][0]["datetime"]
-            for value in r.json()["values"]:
-                data = value
-                data["stock"] = stock.pk
-                serializer = StockTimeSeriesSerializer(data=data)
-                if serializer.is_valid():
-                    serializer.save()
-            stock.save()
-            updated = True
-        else:
-            values = [
-                v
-                for v in r.json()["values"]
-                if datetime.datetime.strptime(v["datetime"], "%Y-%m-%d").date() > stock.last_update_date
-            ]
-            for value in values:
-                data = value
-                data["stock"] = stock.pk
-                serializer = StockTimeSeriesSerializer(data=data)
-                if serializer.is_valid():
-                    serializer.save()
-            if values:
-                stock.last_update_date = values[0]["datetime"]
-                stock.save()
-                updated = True
-        if updated:
-            channel_layer = get_channel_layer()
-            for follower in stock.followers.all():
-                async_to_sync(channel_layer.group_send)(
-                    f"user_{follower.id}",
-                    {
-                        "type": "send.stock.update",  # This is the custom consumer type you define
-                        "message": StockSerializer(stock).data,
-                    },
-                )
+        # Stored in one go, so the queries do not grow with the number of bars
+        rows = parse_bars(stock, r.json()["values"], after=stock.last_update_date)
+        updated = store_bars(rows)
+        BARS_WRITTEN.labels("update_time_series").inc(len(rows))
+        # follower_count spares the fan-out task for the many stocks nobody follows
+        if updated and stock.follower_count:
+            fan_out_stock_update.delay(stock.pk)
+
+
+@shared_task(ignore_result=True)
+@FAN_OUT_DURATION.time()
+def fan_out_stock_update(stock_id):
+    stock = Stock.objects.values(*fast_serializers.STOCK_VALUES).get(pk=stock_id)
+    message = fast_serializers.stocks([stock])[0]
+    follower_ids = list(Follow.objects.filter(stock_id=stock_id).values_list("user_id", flat=True))
+    event = {
+        "type": "send.stock.update",  # This is the custom consumer type you define
+        "message": message,
+    }
+    with tracing.span("fan_out", stock=stock["symbol"], followers=len(follower_ids)):
+        # One trip into the event loop for all the sends, not one per follower
+        async_to_sync(_send_stock_update)(follower_ids, tracing.with_trace_context(event))
+
+
+async def _send_stock_update(follower_ids, event):
+    channel_layer = get_channel_layer()
+    for follower_id in follower_ids:
+        with CHANNEL_LAYER_SEND_DURATION.labels("send.stock.update").time():
+            await channel_layer.group_send(f"user_{follower_id}", event)
+        FAN_OUT_MESSAGES.inc()
 
 
 @shared_task
 def periodic_update_time_series():
-    symbols = Stock.objects.values_list("symbol", flat=True)
+    """
+    Queue a refresh for every stock missing the latest published session, most followed first.
+    Cheap to run often: outside of a new session close it finds nothing to do.
+    """
+    if twelvedata.breaker.state() == twelvedata.breaker.OPEN:
+        return  # Nothing is marked as queued, the next run after recovery picks everything up
+
+    now = timezone.now()
+    session = market_calendar.latest_session(now)
+    # Queue once per session close, then again only after the retry interval if the bar is still missing
+    requeue_before = max(market_calendar.session_close(session), now - settings.STOCK_REFRESH_RETRY_INTERVAL)
+
+    stale = Stock.objects.filter(Q(last_update_date__isnull=True) | Q(last_update_date__lt=session)).filter(
+        Q(refresh_enqueued_at__isnull=True) | Q(refresh_enqueued_at__lt=requeue_before)
+    )
+    symbols = list(stale.order_by("-follower_count", "symbol").values_list("symbol", flat=True))
+    Stock.objects.filter(symbol__in=symbols).update(refresh_enqueued_at=now)
+
+    if settings.TIME_SERIES_REFRESH_ENGINE == "asyncio":
+        if symbols:
+            ingest_time_series.apply_async(kwargs={"symbols": symbols}, priority=PRIORITY_BULK)
+        return
+
     for i, symbol in enumerate(symbols):
         batch_num = i // 8
-        update_time_series.apply_async(kwargs={"symbol": symbol}, countdown=90 * batch_num)
+        enqueue_update_time_series(symbol, countdown=90 * batch_num, priority=PRIORITY_BULK)
+
+
+@shared_task
+def ingest_time_series(symbols=None):
+    """Refresh ``symbols`` (every stock by default) in this one task, see djangostock.application.ingest."""
+    from djangostock.application import ingest
+
+    return async_to_sync(ingest.run)(symbols)
+
+
+@shared_task(ignore_result=True)
+def sync_stock_catalog():
+    try:
+        r = twelvedata.get("stocks", CATALOG_QUERY_PARAMS)
+    except twelvedata.UpstreamUnavailable:
+        return  # The catalog stays as it is until the next daily sync
+    if r.status_code != 200 or r.json().get("status") != "ok":
+        return
+
+    sync_date = timezone.now()
+    # The listing can repeat a symbol; an upsert must not touch the same row twice.
+    entries = {
+        data["symbol"]: CatalogEntry(
+            name=data["name"],
+            symbol=data["symbol"],
+            exchange_name=data["exchange"],
+            mic_code=data.get("mic_code", ""),
+            type_of_stock=data["type"],
+            currency=data["currency"],
+            country=data["country"],
+            sync_date=sync_date,
+        )
+        for data in r.json()["data"]
+    }
+    CatalogEntry.objects.bulk_create(
+        entries.values(),
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=["symbol"],
+        update_fields=["name", "exchange_name", "mic_code", "type_of_stock", "currency", "country", "sync_date"],
+    )
+    # Whatever was not in this listing has been delisted.
+    CatalogEntry.objects.filter(sync_date__lt=sync_date).delete()
+
+
+@shared_task(ignore_result=True)
+def create_time_series_partitions():
+    """Keep the next year's partition ready, so that no bar ever lands in the default partition."""
+    table = StockTimeSeries._meta.db_table
+    if partitions.is_partitioned(table):
+        partitions.create_future_partitions(table)
+
+
+@shared_task(ignore_result=True)
+def archive_time_series():
+    """Compact the bars past TIME_SERIES_ARCHIVE_AFTER_DAYS of every stock, a no-op while it is 0."""
+    horizon = archive.archive_horizon()
+    if horizon is None:
+        return
+    for stock in Stock.objects.filter(series__recorded_date__lt=horizon).distinct():
+        archive.compact(stock, horizon)
@@ -1,14 +1,27 @@
+import datetime
 import string
+import uuid
 
 import factory
 import factory.random
+from django.core.cache import cache
 from django.utils import timezone
-from djangostock.application.models import User, Stock, Currency, Country, StockTimeSeries
+from djangostock.application import fake_twelvedata
+from djangostock.application.caches import clear_reference_caches
+from djangostock.application.ingest import parse_bars
+from djangostock.application.locks import get_lock_backend
+from djangostock.application.models import User, Stock, Currency, Country, StockTimeSeries, CatalogEntry, Follow
+
+BULK_BATCH_SIZE = 1000
 
 
 def setup_test_environment():
     factory.random.reseed_random("my_seed")
     StockFactory.reset_sequence()
+    CatalogEntryFactory.reset_sequence()
+    clear_reference_caches()
+    get_lock_backend.cache_clear()
+    cache.clear()
 
 
 class UserFactory(factory.Factory):
@@ -61,3 +74,45 @@ class StockTimeSeriesFactory(factory.Factory):
     high = 2.60
     low = 2.08
     volume = 6600
+
+
+class CatalogEntryFactory(factory.Factory):
+    class Meta:
+        model = CatalogEntry
+
+    name = factory.Sequence(lambda n: f"Name of Stock {_symbol(n)}")
+    symbol = factory.Sequence(lambda n: _symbol(n))
+    exchange_name = "NASDAQ"
+    mic_code = "XNCM"
+    type_of_stock = "Common Stock"
+    currency = "USD"
+    country = "United States"
+    sync_date = factory.LazyFunction(timezone.now)
+
+
+def seed_universe(stocks, bars=1, followers=0, follows=None, last_date=datetime.date(2023, 8, 14)):
+    """
+    Save ``stocks`` stocks with fake_twelvedata bars for the ``bars`` trading days up to ``last_date``, and
+    ``followers`` users following ``follows`` of them each, all by default. Returns (stocks, users).
+    """
+    days = fake_twelvedata.trading_days(last_date, bars)
+    saved = []
+    for _ in range(stocks):
+        stock = StockFactory(last_update_date=days[0] if days else None)
+        stock.save()
+        StockTimeSeries.objects.bulk_create(
+            parse_bars(stock, fake_twelvedata.bars(stock.symbol, days)), batch_size=BULK_BATCH_SIZE
+        )
+        saved.append(stock)
+
+    follows = len(saved) if follows is None else min(follows, len(saved))
+    users = []
+    for n in range(followers):
+        # Faker names repeat sooner than the follower counts these are seeded with
+        user = UserFactory(email=f"follower.{uuid.uuid4().hex}@example.com")
+        user.save()
+        # Each follower takes the next stocks round the universe, so followers spread evenly
+        start = n * follows % len(saved) if saved else 0
+        Follow.objects.follow(user, [stock.pk for stock in (saved[start:] + saved[:start])[:follows]])
+        users.append(user)
+    return saved, users
@@ -0,0 +1,36 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+# Far enough apart that a query per stock, bar or follower can't hide
+DEFAULT_SIZES = (5, 50)
+
+
+class QueryCountMixin:
+    """
+    For TestCases: ``assertConstantQueries`` fails when the queries of a code path grow with the size of the
+    data it works on, e.g. a query per stock in a listing.
+    """
+
+    def assertConstantQueries(self, seed, run, sizes=DEFAULT_SIZES):
+        """
+        Calls ``run(seed(size))`` for each of ``sizes`` and checks they all make as many queries.
+        ``seed(size)`` saves the data, e.g. through factories.seed_universe, and returns what ``run`` needs.
+        """
+        # Once beforehand, so the reference caches and sessions are already loaded for every size
+        run(seed(sizes[0]))
+
+        counts = {}
+        for size in sizes:
+            arguments = seed(size)
+            with CaptureQueriesContext(connection) as context:
+                run(arguments)
+            counts[size] = context.captured_queries
+
+        first = counts[sizes[0]]
+        for size in sizes[1:]:
+            if len(counts[size]) != len(first):
+                queries = "\n".join(query["sql"] for query in counts[size])
+                self.fail(
+                    f"Queries grow with the data: {len(first)} for {sizes[0]}, {len(counts[size])} for {size}:\n"
+                    f"{queries}"
+                )
@@ -1,16 +1,98 @@
+import asyncio
 import datetime
+import decimal
+import gzip
+import io
 import json
+import os
+import tempfile
+import time
+import uuid
 from unittest import mock
 
+from io import StringIO
+
 from django.contrib.auth import authenticate
-from django.test import TestCase, override_settings
+import brotli
+import httpx
+import pyarrow as pa
+import pyarrow.parquet as pq
+from asgiref.sync import async_to_sync, sync_to_async
+from autobahn.websocket.compress import PerMessageDeflateOffer, PerMessageDeflateOfferAccept
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils.translation import gettext_lazy
+from prometheus_client import REGISTRY, Counter, values
 from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
 from rest_framework_simplejwt.tokens import AccessToken
 
-from .factories import UserFactory, setup_test_environment, StockFactory, StockTimeSeriesFactory
-
-from ..models import User, Stock, StockTimeSeries, Follow
-from ..tasks import update_time_series
+from djangostock import server
+
+from .factories import (
+    UserFactory,
+    setup_test_environment,
+    StockFactory,
+    StockTimeSeriesFactory,
+    CatalogEntryFactory,
+    seed_universe,
+)
+from .query_counts import QueryCountMixin
+
+from ..benchmarks import concurrency as concurrency_benchmark, websockets as websocket_benchmark
+from ..caches import currencies, countries
+from ..compression import CompressionMiddleware
+from ..consumers import HomeConsumer
+from ..locks import get_lock_backend
+from ..models import (
+    User,
+    Stock,
+    StockTimeSeries,
+    Follow,
+    CatalogEntry,
+    Currency,
+    BackfillWindow,
+    ArchivedTimeSeries,
+)
+from ..serializers import StockSerializer, PopularStockSerializer, StockTimeSeriesSerializer
+from .. import (
+    archive,
+    backfill,
+    benchmarks,
+    consumers,
+    fake_twelvedata,
+    fast_serializers,
+    metrics,
+    partitions,
+    profiling,
+    routers,
+    ingest,
+    market_calendar,
+    tracing,
+    twelvedata,
+    urls,
+    versions,
+)
+from ..rate_limit import RateLimiter
+from ..renderers import FastJSONParser, FastJSONRenderer
+from ..tasks import (
+    update_time_series,
+    sync_stock_catalog,
+    fan_out_stock_update,
+    periodic_update_time_series,
+    enqueue_update_time_series,
+    ingest_time_series,
+    create_time_series_partitions,
+    PRIORITY_INTERACTIVE,
+)
 
 
 class UserListTest(TestCase):
@@ -655,6 +737,75 @@ class FollowTest(TestCase):
             Follow.objects.get(user=self.user, stock=stock)
 
 
+class FollowBulkTest(TestCase):
+    def setUp(self):
+        setup_test_environment()
+        self.user = UserFactory()
+        self.user.save()
+        self.bearer_header = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+        self.stocks = [StockFactory() for _ in range(5)]
+        for stock in self.stocks:
+            stock.save()
+
+    def _put(self, data):
+        return self.client.put(
+            "/stock/follow/bulk/",
+            json.dumps(data),
+            content_type="application/json",
+            headers=self.bearer_header,
+        )
+
+    def test_follow_by_symbols_and_ids(self):
+        resp = self._put({"symbols": [self.stocks[0].symbol, self.stocks[1].symbol], "stocks": [self.stocks[2].pk]})
+
+        self.assertEquals(resp.status_code, status.HTTP_200_OK)
+        self.assertEquals(resp.data["followed"], sorted(stock.symbol for stock in self.stocks[:3]))
+        self.assertEquals(resp.data["unfollowed"], [])
+        self.assertEquals(set(self.user.follows.all()), set(self.stocks[:3]))
+
+    def test_replaces_follow_set(self):
+        self.user.follows.add(self.stocks[0], self.stocks[1])
+
+        resp = self._put({"stocks": [self.stocks[1].pk, self.stocks[2].pk]})
+
+        self.assertEquals(resp.status_code, status.HTTP_200_OK)
+        self.assertEquals(resp.data["followed"], [self.stocks[2].symbol])
+        self.assertEquals(resp.data["unfollowed"], [self.stocks[0].symbol])
+        self.assertEquals(set(self.user.follows.all()), {self.stocks[1], self.stocks[2]})
+
+    def test_empty_list_unfollows_all(self):
+        self.user.follows.add(*self.stocks)
+
+        resp = self._put({"stocks": []})
+
+        self.assertEquals(resp.status_code, status.HTTP_200_OK)
+        self.assertFalse(Follow.objects.filter(user=self.user).exists())
+
+    def test_unknown_symbol(self):
+        self.user.follows.add(self.stocks[0])
+
+        resp = self._put({"symbols": [self.stocks[1].symbol, "NOPE"]})
+
+        self.assertEquals(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("symbols", resp.data)
+        self.assertEquals(list(self.user.follows.all()), [self.stocks[0]])
+
+    def test_missing_fields(self):
+        resp = self._put({})
+        self.assertEquals(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_query_count_independent_of_size(self):
+        with self.assertNumQueries(11):
+            self._put({"stocks": [self.stocks[0].pk]})
+        self.user.follows.clear()
+        with self.assertNumQueries(11):
+            self._put({"stocks": [stock.pk for stock in self.stocks]})
+
+    def test_unauthorized(self):
+        resp = self.client.put("/stock/follow/bulk/", json.dumps({"stocks": []}), content_type="application/json")
+        self.assertEquals(resp.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
 class RequestTest(TestCase):
     def setUp(self):
         setup_test_environment()
@@ -664,36 +815,21 @@ class RequestTest(TestCase):
         self.bearer_header = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
 
     @mock.patch("requests.get")
-    def test_stock_available_in_api(self, mock_get):
-        stock = StockFactory.build()
+    def test_stock_in_catalog(self, mock_get):
+        entry = CatalogEntryFactory()
+        entry.save()
 
-        stocks_response_mock = mock.Mock()
-        stocks_response_mock.status_code = 200
-        stocks_response_mock.json = lambda: {
-            "data": [
-                {
-                    "symbol": stock.symbol,
-                    "name": stock.name,
-                    "currency": stock.currency.name,
-                    "exchange": stock.exchange_name,
-                    "mic_code": "XNCM",
-                    "country": stock.country.name,
-                    "type": stock.type_of_stock,
-                }
-            ],
-            "status": "ok",
-        }
         stocktimeseries_response_mock = mock.Mock()
         stocktimeseries_response_mock.status_code = 200
         stocktimeseries_response_mock.json = lambda: {
             "meta": {
-                "symbol": stock.symbol,
+                "symbol": entry.symbol,
                 "interval": "1day",
-                "currency": stock.currency,
+                "currency": entry.currency,
                 "exchange_timezone": "America/New_York",
-                "exchange": stock.exchange_name,
-                "mic_code": "XNCM",
-                "type": stock.type_of_stock,
+                "exchange": entry.exchange_name,
+                "mic_code": entry.mic_code,
+                "type": entry.type_of_stock,
             },
             "values": [
                 {
@@ -707,13 +843,13 @@ class RequestTest(TestCase):
             ],
             "status": "ok",
         }
-        mock_get.side_effect = [stocks_response_mock, stocktimeseries_response_mock]
+        mock_get.side_effect = [stocktimeseries_response_mock]
 
         resp = self.client.post(
             f"/stock/request/",
             json.dumps(
                 {
-                    "symbol": stock.symbol,
+                    "symbol": entry.symbol,
                 }
             ),
             content_type="application/json",
@@ -721,22 +857,16 @@ class RequestTest(TestCase):
         )
 
         self.assertEquals(resp.status_code, status.HTTP_201_CREATED)
-        stock = Stock.objects.get(symbol=stock.symbol)
+        self.assertEquals(mock_get.call_count, 1)
+        stock = Stock.objects.get(symbol=entry.symbol)
+        self.assertEquals(stock.name, entry.name)
         self.assertEquals(stock.latest_time_series.recorded_date, datetime.date(year=2023, month=8, day=8))
         self.assertEquals(stock, self.user.follows.get(symbol=stock.symbol))
 
     @mock.patch("requests.get")
-    def test_stock_not_available_in_api(self, mock_get):
+    def test_stock_not_in_catalog(self, mock_get):
         stock = StockFactory.build()
 
-        stocks_response_mock = mock.Mock()
-        stocks_response_mock.status_code = 200
-        stocks_response_mock.json = lambda: {
-            "data": [],
-            "status": "ok",
-        }
-        mock_get.side_effect = [stocks_response_mock]
-
         resp = self.client.post(
             f"/stock/request/",
             json.dumps(
@@ -749,9 +879,27 @@ class RequestTest(TestCase):
         )
 
         self.assertEquals(resp.status_code, status.HTTP_404_NOT_FOUND)
+        mock_get.assert_not_called()
         with self.assertRaises(Stock.DoesNotExist):
             Stock.objects.get(symbol=stock.symbol)
 
+    @mock.patch.object(update_time_series, "apply_async")
+    def test_onboarding_is_interactive(self, mock_apply_async):
+        entry = CatalogEntryFactory()
+        entry.save()
+
+        self.client.post(
+            f"/stock/request/",
+            json.dumps({"symbol": entry.symbol}),
+            content_type="application/json",
+            headers=self.bearer_header,
+        )
+
+        mock_apply_async.assert_called_once()
+        self.assertEquals(mock_apply_async.call_args.kwargs["kwargs"], {"symbol": entry.symbol})
+        self.assertEquals(mock_apply_async.call_args.kwargs["queue"], "interactive")
+        self.assertEquals(mock_apply_async.call_args.kwargs["priority"], PRIORITY_INTERACTIVE)
+
     def test_stock_already_in_db(self):
         stock = StockFactory()
         stock.save()
@@ -781,3 +929,1854 @@ class RequestTest(TestCase):
             content_type="application/json",
         )
         self.assertEquals(resp.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class CatalogSyncTest(TestCase):
+    def setUp(self):
+        setup_test_environment()
+        self.response_mock = mock.Mock()
+        self.response_mock.status_code = 200
+        self.response_mock.json = lambda: {
+            "data": [
+                {
+                    "symbol": "AAPL",
+                    "name": "Apple Inc",
+                    "currency": "USD",
+                    "exchange": "NASDAQ",
+                    "mic_code": "XNGS",
+                    "country": "United States",
+                    "type": "Common Stock",
+                },
+                {
+                    "symbol": "AMZN",
+                    "name": "Amazon.com Inc",
+                    "currency": "USD",
+                    "exchange": "NASDAQ",
+                    "mic_code": "XNGS",
+                    "country": "United States",
+                    "type": "Common Stock",
+                },
+            ],
+            "status": "ok",
+        }
+
+    @mock.patch("requests.get")
+    def test_sync_creates_entries(self, mock_get):
+        mock_get.return_value = self.response_mock
+        sync_stock_catalog.delay()
+
+        self.assertEquals(CatalogEntry.objects.count(), 2)
+        entry = CatalogEntry.objects.get(symbol="AAPL")
+        self.assertEquals(entry.name, "Apple Inc")
+        self.assertEquals(entry.exchange_name, "NASDAQ")
+        self.assertEquals(entry.mic_code, "XNGS")
+
+    @mock.patch("requests.get")
+    def test_sync_updates_and_removes_delisted(self, mock_get):
+        CatalogEntryFactory(symbol="AAPL", name="Apple Computer").save()
+        CatalogEntryFactory(symbol="GONE").save()
+
+        mock_get.return_value = self.response_mock
+        sync_stock_catalog.delay()
+
+        self.assertEquals(set(CatalogEntry.objects.values_list("symbol", flat=True)), {"AAPL", "AMZN"})
+        self.assertEquals(CatalogEntry.objects.get(symbol="AAPL").name, "Apple Inc")
+
+    @mock.patch("requests.get")
+    def test_sync_upstream_error_keeps_catalog(self, mock_get):
+        CatalogEntryFactory(symbol="AAPL").save()
+
+        mock_get.return_value.status_code = 429
+        sync_stock_catalog.delay()
+
+        self.assertTrue(CatalogEntry.objects.filter(symbol="AAPL").exists())
+
+
+class StockSearchTest(TestCase):
+    def setUp(self):
+        setup_test_environment()
+        self.user = UserFactory()
+        self.user.save()
+        self.bearer_header = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+        CatalogEntryFactory(symbol="AMD", name="Advanced Micro Devices Inc").save()
+        CatalogEntryFactory(symbol="AMZN", name="Amazon.com Inc").save()
+        CatalogEntryFactory(symbol="AAPL", name="Apple Inc").save()
+        CatalogEntryFactory(symbol="MSFT", name="Microsoft Corp").save()
+
+    def test_exact_symbol_first(self):
+        resp = self.client.get("/stock/search/?q=amd", headers=self.bearer_header)
+        self.assertEquals(resp.status_code, status.HTTP_200_OK)
+        self.assertEquals(resp.data[0]["symbol"], "AMD")
+        self.assertEquals(resp.data[0]["exchange"], "NASDAQ")
+
+    def test_symbol_prefix_then_name(self):
+        resp = self.client.get("/stock/search/?q=am", headers=self.bearer_header)
+        self.assertEquals([e["symbol"] for e in resp.data], ["AMD", "AMZN"])
+
+        resp = self.client.get("/stock/search/?q=micro", headers=self.bearer_header)
+        self.assertEquals([e["symbol"] for e in resp.data], ["MSFT", "AMD"])
+
+    def test_empty_query(self):
+        resp = self.client.get("/stock/search/", headers=self.bearer_header)
+        self.assertEquals(resp.status_code, status.HTTP_200_OK)
+        self.assertEquals(resp.data, [])
+
+    def test_unauthorized(self):
+        resp = self.client.get("/stock/search/?q=am")
+        self.assertEquals(resp.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class ReferenceCacheTest(TestCase):
+    def setUp(self):
+        setup_test_environment()
+
+    def _stock_data(self, symbol, currency="USD"):
+        return {
+            "symbol": symbol,
+            "name": f"Name of Stock {symbol}",
+            "currency": currency,
+            "exchange": "NASDAQ",
+            "country": "United States",
+            "type": "Common Stock",
+        }
+
+    def test_validation_skips_reference_queries_when_warm(self):
+        StockSerializer(data=self._stock_data("WARM")).is_valid(raise_exception=True)
+
+        # Only the unique check on symbol remains.
+        with self.assertNumQueries(1):
+            serializer = StockSerializer(data=self._stock_data("AAPL"))
+            serializer.is_valid(raise_exception=True)
+        self.assertEquals(serializer.validated_data["currency"].name, "USD")
+
+    def test_representation_skips_related_rows(self):
+        stock = StockFactory()
+        stock.save()
+        stock = Stock.objects.get(pk=stock.pk)
+        currencies.get("USD")
+        countries.get("United States")
+
+        with self.assertNumQueries(1):  # the one for latest_data
+            data = StockSerializer(stock).data
+        self.assertEquals(data["currency"], "USD")
+        self.assertEquals(data["country"], "United States")
+
+    def test_missing_currency_is_created(self):
+        serializer = StockSerializer(data=self._stock_data("EURO", currency="EUR"))
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        self.assertEquals(Stock.objects.get(symbol="EURO").currency, Currency.objects.get(name="EUR"))
+
+    def test_invalidated_on_change(self):
+        usd = currencies.get("USD")
+        usd.name = "US Dollar"
+        usd.save()
+
+        self.assertIsNone(currencies.get("USD"))
+        self.assertEquals(currencies.get("US Dollar").pk, usd.pk)
+
+    def test_created_row_cached_on_commit(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.assertEquals(currencies.get_or_create("EUR").name, "EUR")
+            self.assertEquals(currencies.get("EUR").name, "EUR")
+            raise RuntimeError
+        self.assertIsNone(currencies.get("EUR"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            eur = currencies.get_or_create("EUR")
+        with self.assertNumQueries(0):
+            self.assertEquals(currencies.get("EUR"), eur)
+
+
+class FollowerCountTest(TestCase):
+    def setUp(self):
+        setup_test_environment()
+        self.user = UserFactory()
+        self.user.save()
+        self.bearer_header = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+        self.stocks = [StockFactory() for _ in range(3)]
+        for stock in self.stocks:
+            stock.save()
+
+    def _follower_count(self, stock):
+        return Stock.objects.get(pk=stock.pk).follower_count
+
+    def test_follow_and_unfollow(self):
+        self.client.post(
+            "/stock/follow/",
+            json.dumps({"stock": self.stocks[0].pk}),
+            content_type="application/json",
+            headers=self.bearer_header,
+        )
+        self.assertEquals(self._follower_count(self.stocks[0]), 1)
+
+        self.client.delete(
+            "/stock/follow/",
+            json.dumps({"stock": self.stocks[0].pk}),
+            content_type="application/json",
+            headers=self.bearer_header,
+        )
+        self.assertEquals(self._follower_count(self.stocks[0]), 0)
+
+    def test_bulk(self):
+        Follow.objects.follow(self.user, [self.stocks[0].pk])
+        other = UserFactory()
+        other.save()
+        Follow.objects.follow(other, [self.stocks[1].pk])
+
+        self.client.put(
+            "/stock/follow/bulk/",
+            json.dumps({"stocks": [self.stocks[1].pk, self.stocks[2].pk]}),
+            content_type="application/json",
+            headers=self.bearer_header,
+        )
+
+        self.assertEquals([self._follower_count(stock) for stock in self.stocks], [0, 2, 1])
+
+    def test_following_twice_counts_once(self):
+        self.assertEquals(Follow.objects.follow(self.user, [self.stocks[0].pk]), {self.stocks[0].pk})
+        self.assertEquals(Follow.objects.follow(self.user, [self.stocks[0].pk]), set())
+        self.assertEquals(self._follower_count(self.stocks[0]), 1)
+
+    def test_user_delete(self):
+        Follow.objects.follow(self.user, [self.stocks[0].pk, self.stocks[1].pk])
+        self.user.delete()
+        self.assertEquals([self._follower_count(stock) for stock in self.stocks], [0, 0, 0])
+
+    def test_cascaded_deletes(self):
+        others = [UserFactory() for _ in range(2)]
+        for user in [self.user, *others]:
+            user.save()
+            Follow.objects.follow(user, [self.stocks[0].pk, self.stocks[1].pk])
+
+        User.objects.filter(pk__in=[user.pk for user in others]).delete()
+        self.assertEquals([self._follower_count(stock) for stock in self.stocks], [1, 1, 0])
+        self.stocks[1].delete()
+        self.assertEquals(self._follower_count(self.stocks[0]), 1)
+        self.assertFalse(Follow.objects.filter(stock_id=self.stocks[1].pk).exists())
+
+    def test_follows_created_and_deleted_directly(self):
+        follow = Follow.objects.create(user=self.user, stock=self.stocks[0])
+        Follow.objects.create(user=self.user, stock=self.stocks[1])
+        self.assertEquals([self._follower_count(stock) for stock in self.stocks], [1, 1, 0])
+
+        follow.delete()
+        Follow.objects.filter(stock=self.stocks[1]).delete()
+        self.assertEquals([self._follower_count(stock) for stock in self.stocks], [0, 0, 0])
+
+    def test_unfollow_counts_once(self):
+        other = UserFactory()
+        other.save()
+        ids = [stock.pk for stock in self.stocks]
+        Follow.objects.follow(self.user, ids)
+        Follow.objects.follow(other, ids)
+
+        self.assertEquals(Follow.objects.unfollow(self.user, ids), set(ids))
+        self.assertEquals([self._follower_count(stock) for stock in self.stocks], [1, 1, 1])
+
+    def test_count_never_negative(self):
+        Follow.objects.create(user=self.user, stock=self.stocks[0])
+        Stock.objects.filter(pk=self.stocks[0].pk).update(follower_count=0)
+
+        self.assertEquals(Follow.objects.unfollow(self.user, [self.stocks[0].pk]), {self.stocks[0].pk})
+        self.assertEquals(self._follower_count(self.stocks[0]), 0)
+
+    def test_popular(self):
+        other = UserFactory()
+        other.save()
+        Follow.objects.follow(self.user, [self.stocks[1].pk, self.stocks[2].pk])
+        Follow.objects.follow(other, [self.stocks[2].pk])
+
+        resp = self.client.get("/stock/popular/", headers=self.bearer_header)
+
+        self.assertEquals(resp.status_code, status.HTTP_200_OK)
+        self.assertEquals([s["symbol"] for s in resp.data["results"]], [self.stocks[2].symbol, self.stocks[1].symbol])
+        self.assertEquals(resp.data["results"][0]["follower_count"], 2)
+
+    def test_m2m_changes(self):
+        self.user.follows.add(self.stocks[0], self.stocks[1])
+        self.stocks[2].followers.add(self.user)
+        self.assertEquals([self._follower_count(stock) for stock in self.stocks], [1, 1, 1])
+
+        self.user.follows.remove(self.stocks[0])
+        self.assertEquals([self._follower_count(stock) for stock in self.stocks], [0, 1, 1])
+
+        self.user.follows.clear()
+        self.assertEquals([self._follower_count(stock) for stock in self.stocks], [0, 0, 0])
+
+    def test_reconcile_command(self):
+        # Raw inserts bypass both FollowManager and the m2m_changed receiver.
+        Follow.objects.bulk_create(
+            [Follow(user=self.user, stock=self.stocks[0]), Follow(user=self.user, stock=self.stocks[1])]
+        )
+        Stock.objects.filter(pk=self.stocks[2].pk).update(follower_count=5)
+
+        out = StringIO()
+        call_command("reconcile_follower_counts", stdout=out)
+
+        self.assertEquals([self._follower_count(stock) for stock in self.stocks], [1, 1, 0])
+        self.assertIn("3 stock(s) drifted.", out.getvalue())
+
+
+class TaskRoutingTest(TestCase):
+    def test_routes(self):
+        from djangostock.celery import app
+
+        def queue_of(task):
+            return app.amqp.router.route({}, f"djangostock.application.tasks.{task}")["queue"].name
+
+        self.assertEquals(queue_of("update_time_series"), "ingest")
+        self.assertEquals(queue_of("periodic_update_time_series"), "ingest")
+        self.assertEquals(queue_of("sync_stock_catalog"), "ingest")
+        self.assertEquals(queue_of("fan_out_stock_update"), "fanout")
+        self.assertEquals(app.amqp.router.route({}, "djangostock.celery.debug_task")["queue"].name, "interactive")
+
+
+class FanOutTest(TestCase):
+    def setUp(self):
+        setup_test_environment()
+        self.stock = StockFactory()
+        self.stock.save()
+        self.follower = UserFactory()
+        self.follower.save()
+        self.other = UserFactory()
+        self.other.save()
+        Follow.objects.follow(self.follower, [self.stock.pk])
+
+    def test_sends_to_followers_only(self):
+        channel_layer = get_channel_layer()
+        follower_channel = async_to_sync(channel_layer.new_channel)()
+        other_channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(f"user_{self.follower.id}", follower_channel)
+        async_to_sync(channel_layer.group_add)(f"user_{self.other.id}", other_channel)
+
+        fan_out_stock_update.delay(self.stock.pk)
+
+        event = async_to_sync(channel_layer.receive)(follower_channel)
+        self.assertEquals(event["type"], "send.stock.update")
+        self.assertEquals(event["message"]["symbol"], self.stock.symbol)
+        self.assertEquals(channel_layer.channels.get(other_channel, None), None)
+
+
+class MarketCalendarTest(TestCase):
+    def _at(self, *args):
+        return datetime.datetime(*args, tzinfo=market_calendar.EXCHANGE_TIMEZONE)
+
+    def test_holidays(self):
+        self.assertEquals(
+            sorted(market_calendar.holidays(2023)),
+            [
+                datetime.date(2023, 1, 2),
+                datetime.date(2023, 1, 16),
+                datetime.date(2023, 2, 20),
+                datetime.date(2023, 4, 7),
+                datetime.date(2023, 5, 29),
+                datetime.date(2023, 6, 19),
+                datetime.date(2023, 7, 4),
+                datetime.date(2023, 9, 4),
+                datetime.date(2023, 11, 23),
+                datetime.date(2023, 12, 25),
+            ],
+        )
+        # New Year's Day 2022 fell on a Saturday and was not observed
+        self.assertNotIn(datetime.date(2021, 12, 31), market_calendar.holidays(2021))
+        self.assertIn(datetime.date(2022, 6, 20), market_calendar.holidays(2022))
+
+    def test_latest_session(self):
+        # Friday before the close, after the close, then the weekend
+        self.assertEquals(market_calendar.latest_session(self._at(2023, 8, 11, 12)), datetime.date(2023, 8, 10))
+        self.assertEquals(market_calendar.latest_session(self._at(2023, 8, 11, 17)), datetime.date(2023, 8, 11))
+        self.assertEquals(market_calendar.latest_session(self._at(2023, 8, 13, 12)), datetime.date(2023, 8, 11))
+        # Tuesday after Labor Day, before the close
+        self.assertEquals(market_calendar.latest_session(self._at(2023, 9, 5, 9)), datetime.date(2023, 9, 1))
+
+
+class PeriodicUpdateTimeSeriesTest(TestCase):
+    # Monday 2023-08-14, after the close: the latest session is 2023-08-14
+    NOW = datetime.datetime(2023, 8, 14, 21, 0, tzinfo=datetime.timezone.utc)
+
+    def setUp(self):
+        setup_test_environment()
+        self.up_to_date = StockFactory(last_update_date=datetime.date(2023, 8, 14))
+        self.behind = StockFactory(last_update_date=datetime.date(2023, 8, 11))
+        self.popular = StockFactory(last_update_date=datetime.date(2023, 8, 11), follower_count=3)
+        self.new = StockFactory(last_update_date=None)
+        for stock in [self.up_to_date, self.behind, self.popular, self.new]:
+            stock.save()
+
+    def _run(self, now):
+        with mock.patch("django.utils.timezone.now", return_value=now), mock.patch.object(
+            update_time_series, "apply_async"
+        ) as mock_apply_async:
+            periodic_update_time_series.delay()
+        return [c.kwargs["kwargs"]["symbol"] for c in mock_apply_async.call_args_list]
+
+    def test_only_stale_most_followed_first(self):
+        self.assertEquals(self._run(self.NOW), [self.popular.symbol, self.behind.symbol, self.new.symbol])
+
+    def test_not_queued_twice_per_session(self):
+        self._run(self.NOW)
+        self.assertEquals(self._run(self.NOW + datetime.timedelta(hours=1)), [])
+        get_lock_backend.cache_clear()  # the queued runs have finished without a new bar
+        self.assertEquals(
+            len(self._run(self.NOW + settings.STOCK_REFRESH_RETRY_INTERVAL + datetime.timedelta(minutes=1))), 3
+        )
+
+    def test_weekend(self):
+        for stock in [self.behind, self.popular, self.new]:
+            stock.last_update_date = datetime.date(2023, 8, 11)
+            stock.save()
+        self.assertEquals(self._run(datetime.datetime(2023, 8, 13, 12, 0, tzinfo=datetime.timezone.utc)), [])
+
+
+class SingleFlightTest(TestCase):
+    def setUp(self):
+        setup_test_environment()
+        self.stock = StockFactory()
+        self.stock.save()
+
+    def test_enqueue_is_noop_while_queued(self):
+        with mock.patch.object(update_time_series, "apply_async") as mock_apply_async:
+            task_id = enqueue_update_time_series(self.stock.symbol)
+            self.assertIsNotNone(task_id)
+            self.assertIsNone(enqueue_update_time_series(self.stock.symbol))
+        mock_apply_async.assert_called_once()
+        self.assertEquals(mock_apply_async.call_args.kwargs["task_id"], task_id)
+
+    @mock.patch("requests.get")
+    def test_run_skipped_while_other_run_holds_lock(self, mock_get):
+        get_lock_backend().acquire(f"update_time_series:{self.stock.symbol}", "other-task", 60)
+
+        update_time_series.delay(self.stock.symbol)
+
+        mock_get.assert_not_called()
+
+    @mock.patch("requests.get")
+    def test_lock_released_after_run(self, mock_get):
+        mock_get.return_value.status_code = 400
+
+        self.assertIsNotNone(enqueue_update_time_series(self.stock.symbol))
+
+        mock_get.assert_called_once()
+        self.assertIsNone(get_lock_backend().holder(f"update_time_series:{self.stock.symbol}"))
+        self.assertIsNotNone(enqueue_update_time_series(self.stock.symbol))
+
+    def _queue_deferred_run(self, countdown):
+        with mock.patch.object(update_time_series, "apply_async"):
+            return enqueue_update_time_series(self.stock.symbol, countdown=countdown)
+
+    @mock.patch("requests.get")
+    def test_interactive_enqueue_takes_over_deferred_run(self, mock_get):
+        mock_get.return_value.status_code = 400
+        pending = self._queue_deferred_run(countdown=3600)
+        self.assertIsNone(enqueue_update_time_series(self.stock.symbol))
+
+        task_id = enqueue_update_time_series(self.stock.symbol, take_over=True)
+
+        self.assertNotIn(task_id, [None, pending])
+        mock_get.assert_called_once()
+        # The superseded run ends without calling TwelveData when it comes due
+        update_time_series.apply(kwargs={"symbol": self.stock.symbol}, task_id=pending)
+        mock_get.assert_called_once()
+
+    def test_take_over_leaves_run_about_to_start(self):
+        self._queue_deferred_run(countdown=10)
+        with mock.patch.object(update_time_series, "apply_async") as mock_apply_async:
+            self.assertIsNone(enqueue_update_time_series(self.stock.symbol, take_over=True))
+        mock_apply_async.assert_not_called()
+
+    def test_in_memory_lock_expires(self):
+        lock = get_lock_backend()
+        self.assertTrue(lock.acquire("key", "a", 60))
+        self.assertFalse(lock.acquire("key", "b", 60))
+        self.assertTrue(lock.acquire("key", "a", 60))
+        with mock.patch("time.monotonic", return_value=time.monotonic() + 61):
+            self.assertTrue(lock.acquire("key", "b", 60))
+
+
+class CircuitBreakerTest(TestCase):
+    def setUp(self):
+        setup_test_environment()
+        self.stock = StockFactory(last_update_date=datetime.date(2023, 8, 4))
+        self.stock.save()
+        self.user = UserFactory()
+        self.user.save()
+
+    def _response(self, status_code, body):
+        response = mock.Mock()
+        response.status_code = status_code
+        response.json = lambda: body
+        return response
+
+    @mock.patch("requests.get")
+    def test_rate_limit_trips_at_once(self, mock_get):
+        mock_get.return_value = self._response(200, {"code": 429, "status": "error"})
+
+        with self.assertRaises(twelvedata.UpstreamUnavailable):
+            twelvedata.get("time_series", {})
+        self.assertEquals(twelvedata.breaker.state(), "open")
+
+        with self.assertRaises(twelvedata.UpstreamUnavailable):
+            twelvedata.get("time_series", {})
+        self.assertEquals(mock_get.call_count, 1)
+
+    @mock.patch("requests.get")
+    def test_error_rate_trips(self, mock_get):
+        mock_get.return_value = self._response(502, {})
+        for _ in range(twelvedata.breaker.min_calls):
+            self.assertEquals(twelvedata.breaker.state(), "closed")
+            with self.assertRaises(twelvedata.UpstreamUnavailable):
+                twelvedata.get("time_series", {})
+        self.assertEquals(twelvedata.breaker.state(), "open")
+
+    @mock.patch("requests.get")
+    def test_half_open_probe(self, mock_get):
+        twelvedata.breaker.trip()
+        with mock.patch("time.time", return_value=time.time() + twelvedata.breaker.open_seconds + 1):
+            self.assertEquals(twelvedata.breaker.state(), "half-open")
+            self.assertTrue(twelvedata.breaker.allow_request())
+            # Only one probe at a time
+            self.assertFalse(twelvedata.breaker.allow_request())
+            twelvedata.breaker.record_success()
+            self.assertEquals(twelvedata.breaker.state(), "closed")
+
+    def test_open_period_doubles(self):
+        now = time.time()
+        with mock.patch("time.time", return_value=now):
+            twelvedata.breaker.trip()
+            twelvedata.breaker.trip()
+            self.assertEquals(twelvedata.breaker.health()["open_until"], now + 2 * twelvedata.breaker.open_seconds)
+
+    @mock.patch("requests.get")
+    def test_update_deferred_while_open(self, mock_get):
+        twelvedata.breaker.trip()
+
+        with mock.patch.object(update_time_series, "retry", wraps=update_time_series.retry) as mock_retry:
+            update_time_series.delay(self.stock.symbol)
+
+        mock_get.assert_not_called()
+        # Eager mode runs the deferred retries at once, until TWELVEDATA_MAX_DEFERRALS gives up
+        self.assertEquals(mock_retry.call_count, settings.TWELVEDATA_MAX_DEFERRALS)
+        self.assertIsNone(get_lock_backend().holder(f"update_time_series:{self.stock.symbol}"))
+
+    def test_periodic_skipped_while_open(self):
+        twelvedata.breaker.trip()
+        with mock.patch.object(update_time_series, "apply_async") as mock_apply_async:
+            periodic_update_time_series.delay()
+        mock_apply_async.assert_not_called()
+        self.assertIsNone(Stock.objects.get(pk=self.stock.pk).refresh_enqueued_at)
+
+    def test_health(self):
+        resp = self.client.get("/health/twelvedata/")
+        self.assertEquals(resp.status_code, status.HTTP_200_OK)
+        self.assertEquals(resp.data["state"], "closed")
+
+        twelvedata.breaker.trip()
+        resp = self.client.get("/health/twelvedata/")
+        self.assertEquals(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEquals(resp.data["trips"], 1)
+
+
+class IngestTest(TestCase):
+    def setUp(self):
+        setup_test_environment()
+        self.latest = market_calendar.latest_session(datetime.datetime.now(market_calendar.EXCHANGE_TIMEZONE))
+        self.new = StockFactory(last_update_date=None)
+        self.behind = StockFactory(last_update_date=market_calendar.previous_trading_day(self.latest))
+        self.up_to_date = StockFactory(last_update_date=self.latest)
+        for stock in [self.new, self.behind, self.up_to_date]:
+            stock.save()
+
+    def _run(self, symbols=None, **kwargs):
+        transport = httpx.ASGITransport(app=fake_twelvedata.application)
+        return async_to_sync(ingest.run)(symbols, transport=transport, **kwargs)
+
+    def test_stale_stocks_ingested(self):
+        stats = self._run(concurrency=2, batch_size=10)
+
+        self.assertEquals(stats["symbols"], 3)
+        self.assertEquals(stats["updated"], 2)
+        self.assertEquals(stats["rows"], fake_twelvedata.DEFAULT_OUTPUTSIZE + 1)
+        self.assertEquals(StockTimeSeries.objects.filter(stock=self.new).count(), fake_twelvedata.DEFAULT_OUTPUTSIZE)
+        self.assertEquals(StockTimeSeries.objects.filter(stock=self.behind).count(), 1)
+        self.assertEquals(StockTimeSeries.objects.filter(stock=self.up_to_date).count(), 0)
+        for stock in [self.new, self.behind, self.up_to_date]:
+            self.assertEquals(Stock.objects.get(pk=stock.pk).last_update_date, self.latest)
+            self.assertIsNone(get_lock_backend().holder(f"update_time_series:{stock.symbol}"))
+
+    def test_second_run_stores_nothing(self):
+        self._run()
+        stats = self._run()
+        self.assertEquals((stats["updated"], stats["rows"]), (0, 0))
+
+    def test_locked_symbol_skipped(self):
+        get_lock_backend().acquire(f"update_time_series:{self.new.symbol}", "other-task", 60)
+
+        stats = self._run([self.new.symbol, self.behind.symbol])
+
+        self.assertEquals((stats["skipped"], stats["updated"]), (1, 1))
+        self.assertFalse(StockTimeSeries.objects.filter(stock=self.new).exists())
+        self.assertEquals(get_lock_backend().holder(f"update_time_series:{self.new.symbol}"), "other-task")
+
+    def test_blocking_calls_off_event_loop(self):
+        on_loop = []
+
+        def record(method):
+            def wrapped(*args, **kwargs):
+                try:
+                    on_loop.append(asyncio.get_running_loop() is not None)
+                except RuntimeError:
+                    on_loop.append(False)
+                return method(*args, **kwargs)
+
+            return wrapped
+
+        lock = get_lock_backend()
+        with mock.patch.object(lock, "acquire", record(lock.acquire)), mock.patch.object(
+            twelvedata.limiter, "_take", record(twelvedata.limiter._take)
+        ), mock.patch.object(twelvedata.breaker, "allow_request", record(twelvedata.breaker.allow_request)):
+            self._run([self.behind.symbol])
+
+        self.assertEquals(on_loop, [False, False, False])
+
+    def test_followed_stock_fanned_out(self):
+        Stock.objects.filter(pk=self.behind.pk).update(follower_count=1)
+        with mock.patch.object(fan_out_stock_update, "delay") as mock_delay:
+            self._run()
+        mock_delay.assert_called_once_with(self.behind.pk)
+
+    def test_malformed_bars_skipped(self):
+        values = fake_twelvedata.bars("AAAA", [datetime.date(2023, 8, 14), datetime.date(2023, 8, 11)])
+        del values[0]["close"]
+        rows = ingest.parse_bars(self.new, values)
+        self.assertEquals([row.recorded_date for row in rows], [datetime.date(2023, 8, 11)])
+
+    @override_settings(TIME_SERIES_REFRESH_ENGINE="asyncio")
+    def test_periodic_queues_one_task(self):
+        with mock.patch.object(ingest_time_series, "apply_async") as mock_ingest, mock.patch.object(
+            update_time_series, "apply_async"
+        ) as mock_update:
+            periodic_update_time_series.delay()
+        mock_update.assert_not_called()
+        mock_ingest.assert_called_once()
+        self.assertEquals(
+            sorted(mock_ingest.call_args.kwargs["kwargs"]["symbols"]), sorted([self.new.symbol, self.behind.symbol])
+        )
+
+    def test_rate_limiter(self):
+        limiter = RateLimiter("test", 2, period=60)
+        now = 600.0
+        self.assertEquals(limiter._take(now), 0)
+        self.assertEquals(limiter._take(now + 1), 0)
+        self.assertEquals(limiter._take(now + 2), 58)
+        self.assertEquals(limiter._take(now + 60), 0)
+
+
+class BackfillTest(TestCase):
+    def setUp(self):
+        setup_test_environment()
+        self.stocks = [StockFactory(), StockFactory()]
+        for stock in self.stocks:
+            stock.save()
+
+    def _fake_get(self, url, params, timeout):
+        response = mock.Mock()
+        response.status_code = 200
+        body = fake_twelvedata.time_series_response(params)
+        response.json = lambda: body
+        return response
+
+    def _backfill(self, *args):
+        out = StringIO()
+        with mock.patch("requests.get", side_effect=self._fake_get) as mock_get:
+            call_command("backfill", *args, "--processes=1", stdout=out)
+        return mock_get.call_count, out.getvalue()
+
+    def test_backfill(self):
+        calls, out = self._backfill("--start=2022-01-01", "--end=2023-12-31")
+
+        self.assertEquals(calls, 4)
+        trading_days = len(fake_twelvedata.trading_days(datetime.date(2023, 12, 31), 1000, datetime.date(2022, 1, 1)))
+        for stock in self.stocks:
+            self.assertEquals(StockTimeSeries.objects.filter(stock=stock).count(), trading_days)
+            self.assertEquals(Stock.objects.get(pk=stock.pk).last_update_date, datetime.date(2023, 12, 29))
+        self.assertIn("4 done, 0 skipped, 0 failed.", out)
+        self.assertIn(f"{2 * trading_days} row(s)", out)
+
+    def test_resumes_from_checkpoints(self):
+        self._backfill(self.stocks[0].symbol, "--start=2022-01-01", "--end=2023-12-31")
+        StockTimeSeries.objects.filter(stock=self.stocks[0], recorded_date__year=2022).delete()
+        BackfillWindow.objects.filter(stock=self.stocks[0], start_date__year=2022).delete()
+
+        calls, out = self._backfill("--start=2022-01-01", "--end=2023-12-31")
+
+        self.assertEquals(calls, 3)
+        self.assertEquals(
+            StockTimeSeries.objects.filter(stock=self.stocks[0]).count(),
+            StockTimeSeries.objects.filter(stock=self.stocks[1]).count(),
+        )
+
+    def test_window_replaces_existing_bars(self):
+        StockTimeSeriesFactory(stock=self.stocks[0], recorded_date=datetime.date(2023, 8, 14)).save()
+
+        self._backfill(self.stocks[0].symbol, "--start=2023-08-01", "--end=2023-08-31")
+
+        self.assertEquals(
+            StockTimeSeries.objects.filter(stock=self.stocks[0], recorded_date=datetime.date(2023, 8, 14)).count(), 1
+        )
+
+    def test_default_start_on_leap_day(self):
+        self.assertEquals(backfill.years_before(datetime.date(2024, 2, 29), 10), datetime.date(2014, 2, 28))
+        self.assertEquals(backfill.years_before(datetime.date(2024, 2, 29), 4), datetime.date(2020, 2, 29))
+
+        latest_session = datetime.date(2024, 2, 29)
+        with mock.patch.object(market_calendar, "latest_session", return_value=latest_session):
+            _, out = self._backfill(self.stocks[0].symbol)
+
+        self.assertIn("window(s) to backfill for 1 stock(s), 2014-02-28 to 2024-02-29.", out)
+        self.assertEquals(Stock.objects.get(pk=self.stocks[0].pk).last_update_date, latest_session)
+
+    def test_locked_symbol_skipped(self):
+        get_lock_backend().acquire(f"update_time_series:{self.stocks[0].symbol}", "other-task", 60)
+
+        calls, out = self._backfill("--start=2023-01-01", "--end=2023-12-31")
+
+        self.assertEquals(calls, 1)
+        self.assertIn("1 done, 1 skipped, 0 failed.", out)
+        self.assertFalse(BackfillWindow.objects.filter(stock=self.stocks[0]).exists())
+
+
+class ImportBarsTest(TestCase):
+    CSV = (
+        "symbol,datetime,open,high,low,close,volume\n"
+        "AAAA,2023-08-11,10.0,11.0,9.5,10.5,1000\n"
+        "AAAA,2023-08-14,10.5,12.0,10.0,11.5,2000\n"
+        "AAAB,2023-08-14 00:00:00,5,5.5,4.5,5.25,300\n"
+        "ZZZZ,2023-08-14,1,1,1,1,1\n"  # unknown symbol
+        "AAAB,2023-08-15,5,abc,4.5,5.25,300\n"  # malformed price
+        "AAAB,2023-08-16,5,4.9,4.5,5.25,300\n"  # high below the close
+        "AAAB,2023-08-17,5,5.5,4.5,5.25,\n"  # missing volume
+        "AAAB,2023-13-01,5,5.5,4.5,5.25,300\n"  # invalid date
+    )
+
+    def setUp(self):
+        setup_test_environment()
+        self.stocks = [StockFactory(), StockFactory()]
+        for stock in self.stocks:
+            stock.save()
+
+    def _file(self, suffix=".csv", content=None):
+        f = tempfile.NamedTemporaryFile(suffix=suffix, mode="w", delete=False)
+        self.addCleanup(os.remove, f.name)
+        f.write(self.CSV if content is None else content)
+        f.close()
+        return f.name
+
+    def _import(self, *args):
+        out = StringIO()
+        call_command("import_bars", *args, stdout=out)
+        return out.getvalue()
+
+    def test_import_csv(self):
+        out = self._import(self._file())
+
+        self.assertIn("3 row(s) imported for 2 stock(s), 5 rejected.", out)
+        self.assertEquals(StockTimeSeries.objects.filter(stock=self.stocks[0]).count(), 2)
+        bar = StockTimeSeries.objects.get(stock=self.stocks[1])
+        self.assertEquals(
+            (bar.recorded_date, bar.open, bar.high, bar.low, bar.close, bar.volume),
+            (datetime.date(2023, 8, 14), 5, 5.5, 4.5, 5.25, 300),
+        )
+        self.assertEquals(Stock.objects.get(pk=self.stocks[0].pk).last_update_date, datetime.date(2023, 8, 14))
+
+    def test_replace(self):
+        path = self._file()
+        self._import(path)
+        self._import(path, "--replace", "--batch-size=2")
+        self.assertEquals(StockTimeSeries.objects.count(), 3)
+
+    def test_import_parquet_with_renamed_column(self):
+        path = self._file(suffix=".parquet", content="")
+        table = pa.table(
+            {
+                "symbol": ["AAAA", "AAAA"],
+                "date": pa.array([datetime.date(2023, 8, 11), datetime.date(2023, 8, 14)], pa.date32()),
+                "open": [10.0, 10.5],
+                "high": [11.0, 12.0],
+                "low": [9.5, 10.0],
+                "close": [10.5, 11.5],
+                "volume": pa.array([1000, 2000], pa.int64()),
+            }
+        )
+        pq.write_table(table, path)
+
+        out = self._import(path, "--column", "datetime=date")
+
+        self.assertIn("2 row(s) imported for 1 stock(s), 0 rejected.", out)
+        self.assertEquals(
+            list(StockTimeSeries.objects.order_by("recorded_date").values_list("close", flat=True)), [10.5, 11.5]
+        )
+
+    def test_missing_column(self):
+        with self.assertRaises(CommandError):
+            self._import(self._file(content="symbol,datetime,open\nAAAA,2023-08-14,1\n"))
+        self.assertFalse(StockTimeSeries.objects.exists())
+
+
+class TimeSeriesPartitionsTest(TestCase):
+    def setUp(self):
+        setup_test_environment()
+        self.stock = StockFactory(last_update_date=datetime.date(2023, 8, 14))
+        self.stock.save()
+
+    def test_latest_time_series_from_last_update_date(self):
+        for day in [11, 14]:
+            StockTimeSeriesFactory(stock=self.stock, recorded_date=datetime.date(2023, 8, day)).save()
+        self.assertEquals(self.stock.latest_time_series.recorded_date, datetime.date(2023, 8, 14))
+
+    def test_postgresql_only(self):
+        with self.assertRaises(CommandError):
+            call_command("time_series_partitions", stdout=StringIO())
+        # Scheduled everywhere, a no-op unless the table is partitioned
+        create_time_series_partitions.delay()
+
+    def _create_partition(self, attached):
+        connection = mock.MagicMock(alias="default")
+        connection.ops.quote_name = lambda name: f'"{name}"'
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = [(name,) for name in attached]
+        created = partitions.create_partition("bars", 2024, connection)
+        return created, [call.args[0] for call in cursor.execute.call_args_list[1:]]
+
+    def test_create_partition_moves_rows_out_of_default(self):
+        created, statements = self._create_partition(["bars_default", "bars_y2023"])
+
+        self.assertTrue(created)
+        self.assertEquals(
+            [statement.split(" (")[0] for statement in statements],
+            [
+                'ALTER TABLE "bars" DETACH PARTITION "bars_default"',
+                'CREATE TABLE "bars_y2024" PARTITION OF "bars" FOR VALUES FROM',
+                "WITH moved AS",
+                'ALTER TABLE "bars" ATTACH PARTITION "bars_default" DEFAULT',
+            ],
+        )
+        self.assertIn('DELETE FROM "bars_default"', statements[2])
+
+    def test_create_partition(self):
+        created, statements = self._create_partition(["bars_y2023"])
+        self.assertTrue(created)
+        self.assertEquals(len(statements), 1)
+        self.assertTrue(statements[0].startswith('CREATE TABLE "bars_y2024" PARTITION OF "bars"'))
+        self.assertEquals(self._create_partition(["bars_default", "bars_y2024"]), (False, []))
+
+
+class ArchiveTest(TestCase):
+    def setUp(self):
+        setup_test_environment()
+        self.user = UserFactory()
+        self.user.save()
+        self.bearer_header = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+        self.stock = StockFactory(last_update_date=datetime.date(2023, 8, 14))
+        self.stock.save()
+        self.days = fake_twelvedata.trading_days(datetime.date(2023, 8, 14), 300)
+        StockTimeSeries.objects.bulk_create(ingest.parse_bars(self.stock, fake_twelvedata.bars("AAAA", self.days)))
+        self.expected = archive.history(self.stock)
+
+    def test_compact(self):
+        moved = archive.compact(self.stock, datetime.date(2023, 1, 1))
+
+        self.assertEquals(moved, len([day for day in self.days if day.year < 2023]))
+        self.assertFalse(StockTimeSeries.objects.filter(recorded_date__lt=datetime.date(2023, 1, 1)).exists())
+        block = ArchivedTimeSeries.objects.get(stock=self.stock)
+        self.assertEquals(block.year, 2022)
+        self.assertEquals(block.rows, moved)
+        self.assertEquals(block.end_date, datetime.date(2022, 12, 30))
+        self.assertEquals(archive.history(self.stock), self.expected)
+
+    def test_blocks_per_year(self):
+        archive.compact(self.stock, datetime.date(2023, 1, 1))
+        sealed = ArchivedTimeSeries.objects.get(stock=self.stock, year=2022)
+
+        with mock.patch.object(archive, "decode", wraps=archive.decode) as decode:
+            archive.compact(self.stock, datetime.date(2023, 6, 1))
+            archive.compact(self.stock, datetime.date(2023, 7, 1))
+
+        # The 2023 block is created, then rewritten; the 2022 one is never read nor written again
+        self.assertEquals(decode.call_count, 1)
+        self.assertEquals(ArchivedTimeSeries.objects.get(stock=self.stock, year=2022).data, sealed.data)
+        block = ArchivedTimeSeries.objects.get(stock=self.stock, year=2023)
+        self.assertEquals((block.start_date, block.end_date), (datetime.date(2023, 1, 3), datetime.date(2023, 6, 30)))
+        self.assertEquals(archive.history(self.stock), self.expected)
+
+    def test_keeps_latest_bar(self):
+        # A stock that stopped trading: every bar is past the horizon
+        moved = archive.compact(self.stock, datetime.date(2024, 8, 14))
+
+        self.assertEquals(moved, len(self.days) - 1)
+        self.assertEquals(
+            list(StockTimeSeries.objects.filter(stock=self.stock).values_list("recorded_date", flat=True)),
+            [datetime.date(2023, 8, 14)],
+        )
+        self.assertEquals(self.stock.latest_time_series.recorded_date, datetime.date(2023, 8, 14))
+        self.assertEquals(archive.history(self.stock), self.expected)
+
+        resp = self.client.get("/stock/prices/", headers=self.bearer_header)
+        self.assertEquals(resp.data["results"][0]["latest_data"]["datetime"], "2023-08-14")
+        self.assertEquals(archive.compact(self.stock, datetime.date(2024, 8, 14)), 0)
+
+    def test_history_range_across_tiers(self):
+        archive.compact(self.stock, datetime.date(2023, 1, 1))
+        bars = archive.history(self.stock, datetime.date(2022, 12, 1), datetime.date(2023, 1, 31))
+        self.assertEquals(
+            bars,
+            [
+                bar
+                for bar in self.expected
+                if datetime.date(2022, 12, 1) <= bar["recorded_date"] <= datetime.date(2023, 1, 31)
+            ],
+        )
+
+    def test_compact_again_merges(self):
+        archive.compact(self.stock, datetime.date(2022, 12, 1))
+        # A late correction of an archived bar
+        StockTimeSeries.objects.create(
+            stock=self.stock, recorded_date=datetime.date(2022, 11, 1), open=1, high=1, low=1, close=1, volume=1
+        )
+        self.assertEquals(archive.history(self.stock, end=datetime.date(2022, 11, 1))[-1]["close"], 1)
+
+        archive.compact(self.stock, datetime.date(2023, 1, 1))
+
+        bars = archive.history(self.stock)
+        self.assertEquals(len(bars), len(self.expected))
+        self.assertEquals(
+            ArchivedTimeSeries.objects.get(stock=self.stock).rows, len([d for d in self.days if d.year < 2023])
+        )
+        self.assertEquals(archive.history(self.stock, end=datetime.date(2022, 11, 1))[-1]["close"], 1)
+
+    def test_resample(self):
+        bars = archive.history(self.stock, datetime.date(2023, 8, 7), datetime.date(2023, 8, 14))
+        weeks = archive.resample(bars, "1week")
+        self.assertEquals(
+            [week["recorded_date"] for week in weeks], [datetime.date(2023, 8, 7), datetime.date(2023, 8, 14)]
+        )
+        self.assertEquals(weeks[0]["open"], bars[0]["open"])
+        self.assertEquals(weeks[0]["close"], bars[4]["close"])
+        self.assertEquals(weeks[0]["high"], max(bar["high"] for bar in bars[:5]))
+        self.assertEquals(weeks[0]["volume"], sum(bar["volume"] for bar in bars[:5]))
+
+    def test_history_endpoint(self):
+        archive.compact(self.stock, datetime.date(2023, 1, 1))
+
+        resp = self.client.get(
+            "/stock/history/",
+            {"symbol": self.stock.symbol, "start": "2022-12-01", "interval": "1month"},
+            headers=self.bearer_header,
+        )
+
+        self.assertEquals(resp.status_code, status.HTTP_200_OK)
+        self.assertEquals([bar["datetime"] for bar in resp.data][:2], ["2022-12-01", "2023-01-01"])
+        self.assertEquals(len(resp.data), 9)
+
+        resp = self.client.get("/stock/history/", {"symbol": "NONE"}, headers=self.bearer_header)
+        self.assertEquals(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_command(self):
+        out = StringIO()
+        call_command("archive_time_series", "--before=2022-08-14", stdout=out)
+        self.assertFalse(StockTimeSeries.objects.filter(recorded_date__lt=datetime.date(2022, 8, 14)).exists())
+        self.assertIn("bar(s) archived before 2022-08-14.", out.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command("archive_time_series", stdout=out)
+        with override_settings(TIME_SERIES_ARCHIVE_AFTER_DAYS=365):
+            self.assertEquals(archive.archive_horizon(datetime.date(2023, 8, 14)), datetime.date(2022, 8, 14))
+
+
+class FastSerializersTest(TestCase):
+    def setUp(self):
+        setup_test_environment()
+        self.user = UserFactory()
+        self.user.save()
+        self.bearer_header = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+        self.stocks = [StockFactory(last_update_date=datetime.date(2023, 8, 14), follower_count=i) for i in range(3)]
+        for stock in self.stocks:
+            stock.save()
+        days = fake_twelvedata.trading_days(datetime.date(2023, 8, 14), 10)
+        for stock in self.stocks[:2]:
+            StockTimeSeries.objects.bulk_create(ingest.parse_bars(stock, fake_twelvedata.bars(stock.symbol, days)))
+        # Nothing stored yet for the last one
+        self.stocks[2].last_update_date = None
+        self.stocks[2].save()
+
+    def test_stocks_parity(self):
+        stocks = Stock.objects.order_by("symbol")
+        expected = StockSerializer(stocks, many=True).data
+
+        with self.assertNumQueries(2):
+            data = fast_serializers.stocks(stocks.values(*fast_serializers.STOCK_VALUES))
+
+        self.assertEquals(data, json.loads(json.dumps(expected)))
+        self.assertEquals(data[0]["latest_data"]["datetime"], "2023-08-14")
+        self.assertIsNone(data[2]["latest_data"])
+
+    def test_popular_stocks_parity(self):
+        stocks = Stock.objects.filter(follower_count__gt=0).order_by("-follower_count", "symbol")
+        expected = PopularStockSerializer(stocks, many=True).data
+
+        data = fast_serializers.stocks(
+            stocks.values(*fast_serializers.STOCK_VALUES, "follower_count"), extra=["follower_count"]
+        )
+
+        self.assertEquals(data, json.loads(json.dumps(expected)))
+
+    def test_bars_parity(self):
+        series = StockTimeSeries.objects.filter(stock=self.stocks[0]).order_by("recorded_date")
+        expected = StockTimeSeriesSerializer(series, many=True).data
+
+        self.assertEquals(fast_serializers.bars(archive.history(self.stocks[0])), json.loads(json.dumps(expected)))
+
+    def test_endpoints(self):
+        resp = self.client.get("/stock/prices/", headers=self.bearer_header)
+        self.assertEquals(resp.status_code, status.HTTP_200_OK)
+        self.assertEquals(
+            resp.json()["results"],
+            StockSerializer(
+                sorted(self.stocks[:2], key=lambda stock: -stock.latest_time_series.volume), many=True
+            ).data,
+        )
+
+        resp = self.client.get("/stock/popular/", headers=self.bearer_header)
+        self.assertEquals([stock["follower_count"] for stock in resp.json()["results"]], [2, 1])
+
+
+class RenderersTest(TestCase):
+    DATA = {
+        "date": datetime.date(2023, 8, 14),
+        "datetime": datetime.datetime(2023, 8, 14, 15, 30, 0, 123456, tzinfo=datetime.timezone.utc),
+        "naive": datetime.datetime(2023, 8, 14, 15, 30),
+        "time": datetime.time(9, 30),
+        "timedelta": datetime.timedelta(minutes=1),
+        "decimal": decimal.Decimal("1.25"),
+        "uuid": uuid.UUID(int=1),
+        "lazy": gettext_lazy("Stock"),
+        1: ["text   é", (1, 2.5), None, True],
+    }
+
+    def test_matches_drf(self):
+        self.assertEquals(FastJSONRenderer().render(self.DATA), JSONRenderer().render(self.DATA))
+        self.assertEquals(FastJSONRenderer().render(None), b"")
+
+    def test_microseconds_match_drf(self):
+        data = {"at": datetime.datetime(2023, 8, 14, 15, 30, 0, 1, tzinfo=datetime.timezone.utc)}
+        self.assertEquals(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEquals(FastJSONRenderer().render(data), b'{"at":"2023-08-14T15:30:00.000001Z"}')
+
+    def test_large_integers_match_drf(self):
+        data = {"big": 2**70, "small": -(2**64)}
+        self.assertEquals(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_non_finite_match_drf(self):
+        for value in [float("nan"), float("inf"), -float("inf"), decimal.Decimal("NaN")]:
+            data = {"bars": [{"close": value}], "latest": None}
+            with self.assertRaises(ValueError):
+                JSONRenderer().render(data)
+            with self.assertRaises(ValueError):
+                FastJSONRenderer().render(data)
+        # STRICT_JSON off, read when the renderer classes are defined
+        data = {"close": float("nan"), "latest": None}
+        with mock.patch.object(JSONRenderer, "strict", False):
+            self.assertEquals(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEquals(FastJSONRenderer().render({"latest": None}), b'{"latest":null}')
+
+    def test_indent(self):
+        rendered = FastJSONRenderer().render({"a": 1}, "application/json; indent=4")
+        self.assertEquals(rendered, b'{\n  "a": 1\n}')
+
+    def test_parser(self):
+        parsed = FastJSONParser().parse(io.BytesIO('{"symbol": "AAAA", "é": [1.5]}'.encode()))
+        self.assertEquals(parsed, {"symbol": "AAAA", "é": [1.5]})
+        parsed = FastJSONParser().parse(io.BytesIO('{"é": 1}'.encode("latin-1")), None, {"encoding": "latin-1"})
+        self.assertEquals(parsed, {"é": 1})
+        for body in [b"", b"{", b"[NaN]"]:
+            with self.assertRaises(ParseError):
+                FastJSONParser().parse(io.BytesIO(body))
+
+    def test_api(self):
+        resp = self.client.post(
+            "/users/",
+            json.dumps({"email": "a@example.com", "first_name": "A", "last_name": "B", "password": "secret"}),
+            content_type="application/json",
+        )
+        self.assertEquals(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEquals(resp["Content-Type"], "application/json")
+        self.assertEquals(resp.json()["email"], "a@example.com")
+
+        resp = self.client.post("/users/", "{", content_type="application/json")
+        self.assertEquals(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_websocket_encoding(self):
+        event = {"type": "send.stock.update", "message": {"last_update_date": datetime.date(2023, 8, 14)}}
+        self.assertEquals(json.loads(consumers.encode(event))["message"]["last_update_date"], "2023-08-14")
+        renderers = ["rest_framework.renderers.BrowsableAPIRenderer", "rest_framework.renderers.JSONRenderer"]
+        with override_settings(REST_FRAMEWORK={"DEFAULT_RENDERER_CLASSES": renderers}):
+            self.assertEquals(consumers.encode({"a": 1}), '{"a":1}')
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        setup_test_environment()
+        self.user = UserFactory()
+        self.user.save()
+        self.bearer_header = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+        self.stocks = [StockFactory() for _ in range(2)]
+        for stock in self.stocks:
+            stock.save()
+        self.days = fake_twelvedata.trading_days(datetime.date(2023, 8, 14), 5)
+        ingest.store_bars(ingest.parse_bars(self.stocks[0], fake_twelvedata.bars("AAAA", self.days[:4])))
+
+    def test_prices(self):
+        resp = self.client.get("/stock/prices/", headers=self.bearer_header)
+        self.assertEquals(resp.status_code, status.HTTP_200_OK)
+        self.assertIn("no-cache", resp["Cache-Control"])
+        etag, last_modified = resp["ETag"], resp["Last-Modified"]
+
+        # Only the user is loaded for authentication
+        with self.assertNumQueries(1):
+            resp = self.client.get("/stock/prices/", headers={**self.bearer_header, "If-None-Match": etag})
+        self.assertEquals(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        resp = self.client.get("/stock/prices/", headers={**self.bearer_header, "If-Modified-Since": last_modified})
+        self.assertEquals(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        resp = self.client.get(
+            "/stock/prices/", headers={**self.bearer_header, "If-None-Match": etag, "Accept": "text/html"}
+        )
+        self.assertEquals(resp.status_code, status.HTTP_200_OK)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest.store_bars(ingest.parse_bars(self.stocks[0], fake_twelvedata.bars("AAAA", self.days[4:])))
+        resp = self.client.get("/stock/prices/", headers={**self.bearer_header, "If-None-Match": etag})
+        self.assertEquals(resp.status_code, status.HTTP_200_OK)
+        self.assertNotEquals(resp["ETag"], etag)
+        self.assertEquals(resp.json()["results"][0]["last_update_date"], "2023-08-14")
+
+    def test_home(self):
+        # The first visit stores the user of the WebSocket in the session
+        resp = self.client.get("/home/", headers=self.bearer_header)
+        self.assertEquals(resp.status_code, status.HTTP_200_OK)
+        resp = self.client.get("/home/", headers=self.bearer_header)
+        etag = resp["ETag"]
+
+        resp = self.client.get("/home/", headers={**self.bearer_header, "If-None-Match": etag})
+        self.assertEquals(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.follow(self.user, [self.stocks[0].pk])
+        resp = self.client.get("/home/", headers={**self.bearer_header, "If-None-Match": etag})
+        self.assertEquals(resp.status_code, status.HTTP_200_OK)
+        self.assertContains(resp, self.stocks[0].symbol)
+        etag = resp["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stocks[0].name = "Renamed"
+            self.stocks[0].save()
+        resp = self.client.get("/home/", headers={**self.bearer_header, "If-None-Match": etag})
+        self.assertContains(resp, "Renamed")
+
+        # Another user's follows leave this one's page alone
+        other = UserFactory()
+        other.save()
+        etag = resp["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            other.follows.add(self.stocks[1])
+        resp = self.client.get("/home/", headers={**self.bearer_header, "If-None-Match": etag})
+        self.assertEquals(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class CompressionTest(TestCase):
+    def setUp(self):
+        setup_test_environment()
+        self.user = UserFactory()
+        self.user.save()
+        self.bearer_header = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+        self.stock = StockFactory(last_update_date=datetime.date(2023, 8, 14))
+        self.stock.save()
+        days = fake_twelvedata.trading_days(datetime.date(2023, 8, 14), 100)
+        StockTimeSeries.objects.bulk_create(ingest.parse_bars(self.stock, fake_twelvedata.bars("AAAA", days)))
+
+    def _history(self, accept_encoding, **headers):
+        return self.client.get(
+            "/stock/history/",
+            {"symbol": self.stock.symbol},
+            headers={**self.bearer_header, "Accept-Encoding": accept_encoding, **headers},
+        )
+
+    def test_negotiation(self):
+        plain = self._history("identity")
+        self.assertFalse(plain.has_header("Content-Encoding"))
+
+        resp = self._history("gzip, deflate, br")
+        self.assertEquals(resp["Content-Encoding"], "br")
+        self.assertIn("Accept-Encoding", resp["Vary"])
+        self.assertEquals(brotli.decompress(resp.content), plain.content)
+        self.assertEquals(int(resp["Content-Length"]), len(resp.content))
+
+        resp = self._history("gzip, br;q=0")
+        self.assertEquals(resp["Content-Encoding"], "gzip")
+        self.assertEquals(gzip.decompress(resp.content), plain.content)
+
+    def test_small_responses_are_left_alone(self):
+        resp = self.client.get(
+            "/stock/history/",
+            {"symbol": self.stock.symbol, "start": "2023-08-14"},
+            headers={**self.bearer_header, "Accept-Encoding": "br"},
+        )
+        self.assertLess(len(resp.content), settings.RESPONSE_COMPRESSION_MIN_SIZE)
+        self.assertFalse(resp.has_header("Content-Encoding"))
+
+    @override_settings(RESPONSE_COMPRESSION_MIN_SIZE=0)
+    def test_conditional_get(self):
+        resp = self.client.get("/stock/prices/", headers={**self.bearer_header, "Accept-Encoding": "br"})
+        self.assertTrue(resp["ETag"].startswith('W/"'))
+        resp = self.client.get(
+            "/stock/prices/", headers={**self.bearer_header, "Accept-Encoding": "br", "If-None-Match": resp["ETag"]}
+        )
+        self.assertEquals(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_streaming(self):
+        chunks = [json.dumps({"n": n}).encode() * 50 for n in range(10)]
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING="br")
+        middleware = CompressionMiddleware(lambda request: StreamingHttpResponse(iter(chunks)))
+
+        resp = middleware(request)
+
+        self.assertEquals(resp["Content-Encoding"], "br")
+        self.assertEquals(brotli.decompress(b"".join(resp.streaming_content)), b"".join(chunks))
+
+        async def content():
+            for chunk in chunks:
+                yield chunk
+
+        middleware = CompressionMiddleware(lambda request: StreamingHttpResponse(content()))
+        resp = middleware(request)
+
+        async def consume():
+            return b"".join([chunk async for chunk in resp.streaming_content])
+
+        self.assertEquals(brotli.decompress(async_to_sync(consume)()), b"".join(chunks))
+
+    def test_permessage_deflate(self):
+        offer = PerMessageDeflateOffer()
+        self.assertIsInstance(server.accept_permessage_deflate([offer]), PerMessageDeflateOfferAccept)
+        with override_settings(WEBSOCKET_PERMESSAGE_DEFLATE=False):
+            self.assertIsNone(server.accept_permessage_deflate([offer]))
+
+    def test_permessage_deflate_smaller_window_requested(self):
+        offer = PerMessageDeflateOffer.parse({"server_max_window_bits": ["10"]})
+        accept = server.accept_permessage_deflate([offer])
+        self.assertEquals(accept.window_bits, 10)
+        self.assertIn("server_max_window_bits=10", accept.get_extension_string())
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        setup_test_environment()
+        self.user = UserFactory()
+        self.user.save()
+        self.bearer_header = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+        self.stock = StockFactory()
+        self.stock.save()
+        Follow.objects.follow(self.user, [self.stock.pk])
+
+    def _value(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def _fake_get(self, url, params, timeout):
+        response = mock.Mock()
+        response.status_code = 200
+        body = fake_twelvedata.time_series_response(params)
+        response.json = lambda: body
+        return response
+
+    @mock.patch("requests.get")
+    def test_update_time_series(self, mock_get):
+        mock_get.side_effect = self._fake_get
+        task = update_time_series.name
+        before = {
+            "runs": self._value("djangostock_task_runs_total", task=task, state="SUCCESS"),
+            "bars": self._value("djangostock_bars_written_total", source="update_time_series"),
+            "calls": self._value("djangostock_upstream_requests_total", endpoint="time_series", outcome="ok"),
+            "fan_out": self._value("djangostock_fan_out_messages_total"),
+        }
+
+        update_time_series.delay(self.stock.symbol)
+
+        self.assertEquals(self._value("djangostock_task_runs_total", task=task, state="SUCCESS"), before["runs"] + 1)
+        self.assertEquals(
+            self._value("djangostock_bars_written_total", source="update_time_series"),
+            before["bars"] + fake_twelvedata.DEFAULT_OUTPUTSIZE,
+        )
+        self.assertEquals(
+            self._value("djangostock_upstream_requests_total", endpoint="time_series", outcome="ok"),
+            before["calls"] + 1,
+        )
+        self.assertEquals(self._value("djangostock_fan_out_messages_total"), before["fan_out"] + 1)
+        self.assertGreater(self._value("djangostock_task_duration_seconds_count", task=task), 0)
+
+    def test_http(self):
+        before = self._value("djangostock_http_requests_total", route="stock/prices/", method="GET", status="200")
+        self.client.get("/stock/prices/", headers=self.bearer_header)
+        self.assertEquals(
+            self._value("djangostock_http_requests_total", route="stock/prices/", method="GET", status="200"),
+            before + 1,
+        )
+
+        resp = self.client.get("/metrics")
+        self.assertEquals(resp.status_code, status.HTTP_200_OK)
+        self.assertIn(
+            b'djangostock_http_requests_total{method="GET",route="stock/prices/",status="200"}', resp.content
+        )
+
+    def test_websocket_connections(self):
+        async def connect_and_receive():
+            communicator = WebsocketCommunicator(HomeConsumer.as_asgi(), "/ws/home/")
+            communicator.scope["session"] = {"ws_user": self.user.id}
+            await communicator.connect()
+            connected = self._value("djangostock_websocket_connections")
+            await get_channel_layer().group_send(
+                f"user_{self.user.id}", {"type": "send.stock.update", "message": {"symbol": "AAAA"}}
+            )
+            message = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return connected, message
+
+        before = self._value("djangostock_websocket_connections")
+        sent = self._value("djangostock_websocket_messages_total", type="send.stock.update")
+
+        connected, message = async_to_sync(connect_and_receive)()
+
+        self.assertEquals(message["message"]["symbol"], "AAAA")
+        self.assertEquals(connected, before + 1)
+        self.assertEquals(self._value("djangostock_websocket_connections"), before)
+        self.assertEquals(self._value("djangostock_websocket_messages_total", type="send.stock.update"), sent + 1)
+
+    def test_multiprocess(self):
+        with tempfile.TemporaryDirectory() as directory, mock.patch.dict(
+            os.environ, {"PROMETHEUS_MULTIPROC_DIR": directory}
+        ), mock.patch.object(metrics, "MULTIPROCESS", True):
+            # Two processes, e.g. Daphne and a Celery worker, each with its own file
+            for identifier in ["web-1", "worker-1"]:
+                with mock.patch.object(values, "ValueClass", values.MultiProcessValue(lambda: identifier)):
+                    Counter("djangostock_test_total", "Test.", registry=None).inc()
+
+            resp = self.client.get("/metrics")
+
+        self.assertIn(b"djangostock_test_total 2.0", resp.content)
+
+    def test_multiprocess_directory_per_container(self):
+        with tempfile.TemporaryDirectory() as root, mock.patch.object(metrics, "MULTIPROCESS", True):
+            for container in ["web", "worker"]:
+                directory = os.path.join(root, container)
+                os.mkdir(directory)
+                with mock.patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": directory}), mock.patch.object(
+                    values, "ValueClass", values.MultiProcessValue(lambda: "1")
+                ):
+                    Counter("djangostock_test_total", "Test.", registry=None).inc()
+
+            with mock.patch.dict(
+                os.environ, {"PROMETHEUS_MULTIPROC_DIR": directory, "PROMETHEUS_MULTIPROC_ROOT": root}
+            ):
+                resp = self.client.get("/metrics")
+
+        self.assertIn(b"djangostock_test_total 2.0", resp.content)
+
+
+class QueryProfilingTest(TestCase):
+    def setUp(self):
+        setup_test_environment()
+        self.user = UserFactory()
+        self.user.save()
+        self.bearer_header = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+        for _ in range(3):
+            stock = StockFactory(last_update_date=datetime.date(2023, 8, 14))
+            stock.save()
+            StockTimeSeriesFactory(stock=stock, recorded_date=datetime.date(2023, 8, 14)).save()
+
+    def _profiling(self, sample_rate=1.0, **budget):
+        return override_settings(
+            QUERY_PROFILING={
+                "SAMPLE_RATE": sample_rate,
+                "BUDGETS": {"default": {"queries": 100, "db_ms": 10_000, "total_ms": 10_000}, "stock/prices/": budget},
+            }
+        )
+
+    def test_server_timing(self):
+        with self._profiling(), self.assertNoLogs("djangostock.application.profiling"):
+            resp = self.client.get("/stock/prices/", headers=self.bearer_header)
+        self.assertRegex(resp["Server-Timing"], r'^db;dur=[\d.]+;desc="\d+ queries", total;dur=[\d.]+$')
+
+        with self._profiling(sample_rate=0):
+            resp = self.client.get("/stock/prices/", headers=self.bearer_header)
+        self.assertFalse(resp.has_header("Server-Timing"))
+
+    def test_over_budget(self):
+        before = REGISTRY.get_sample_value(
+            "djangostock_query_budget_exceeded_total", {"route": "stock/prices/", "limit": "queries"}
+        )
+        with self._profiling(queries=2), self.assertLogs("djangostock.application.profiling", "WARNING") as logs:
+            self.client.get("/stock/prices/", headers=self.bearer_header)
+
+        self.assertEquals(len(logs.output), 1)
+        self.assertIn("GET /stock/prices/ over budget (queries): ", logs.output[0])
+        self.assertIn("SELECT", logs.output[0])
+        self.assertEquals(
+            REGISTRY.get_sample_value(
+                "djangostock_query_budget_exceeded_total", {"route": "stock/prices/", "limit": "queries"}
+            ),
+            (before or 0) + 1,
+        )
+        with self._profiling(queries=2):
+            self.assertEquals(profiling.budget("stock/prices/"), {"queries": 2, "db_ms": 10_000, "total_ms": 10_000})
+            self.assertEquals(profiling.budget("home/")["queries"], 100)
+
+
+class QueryCountTest(QueryCountMixin, TestCase):
+    def setUp(self):
+        setup_test_environment()
+        self.user = UserFactory()
+        self.user.save()
+        self.bearer_header = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def test_prices(self):
+        self.assertConstantQueries(
+            lambda size: seed_universe(size, bars=3),
+            lambda _: self.client.get("/stock/prices/", headers=self.bearer_header),
+        )
+
+    def test_popular(self):
+        self.assertConstantQueries(
+            lambda size: seed_universe(size, bars=3, followers=1),
+            lambda _: self.client.get("/stock/popular/", headers=self.bearer_header),
+        )
+
+    def test_home(self):
+        def seed(size):
+            stocks, users = seed_universe(size, bars=3, followers=1)
+            return {"Authorization": f"Bearer {AccessToken.for_user(users[0])}"}
+
+        def run(headers):
+            resp = self.client.get("/home/", headers=headers)
+            self.assertEquals(resp.status_code, status.HTTP_200_OK)
+
+        self.assertConstantQueries(seed, run)
+
+    def test_follow(self):
+        def seed(size):
+            stocks, _ = seed_universe(size + 1)
+            Follow.objects.follow(self.user, [stock.pk for stock in stocks[:-1]])
+            return stocks[-1]
+
+        def run(stock):
+            resp = self.client.post(
+                "/stock/follow/",
+                json.dumps({"stock": stock.pk}),
+                content_type="application/json",
+                headers=self.bearer_header,
+            )
+            self.assertEquals(resp.status_code, status.HTTP_201_CREATED)
+
+        self.assertConstantQueries(seed, run)
+
+    def test_bulk_follow(self):
+        def run(stocks):
+            resp = self.client.put(
+                "/stock/follow/bulk/",
+                json.dumps({"symbols": [stock.symbol for stock in stocks]}),
+                content_type="application/json",
+                headers=self.bearer_header,
+            )
+            self.assertEquals(resp.status_code, status.HTTP_200_OK)
+
+        self.assertConstantQueries(lambda size: seed_universe(size)[0], run)
+
+    @mock.patch("requests.get")
+    def test_update_time_series(self, mock_get):
+        def seed(size):
+            # As many new bars from upstream as followers to send them to
+            def fake_get(url, params, timeout):
+                response = mock.Mock()
+                response.status_code = 200
+                body = fake_twelvedata.time_series_response({**params, "outputsize": size})
+                response.json = lambda: body
+                return response
+
+            mock_get.side_effect = fake_get
+            stocks, _ = seed_universe(1, followers=size, last_date=datetime.date(2000, 1, 3))
+            return stocks[0]
+
+        def run(stock):
+            update_time_series.delay(stock.symbol)
+
+        self.assertConstantQueries(seed, run)
+        stock = Stock.objects.order_by("pk").last()
+        self.assertEquals(StockTimeSeries.objects.filter(stock=stock).count(), 1 + 50)
+
+
+class BenchmarkTest(TestCase):
+    def test_run(self):
+        universe = benchmarks.Universe.seed(stocks=30, bars=5, followers=3, follows=10)
+
+        results = benchmarks.run(universe, repeat=2)
+
+        self.assertEquals(
+            set(results),
+            {"prices", "prices_last_page", "home", "ingest", "fan_out", "serialize_stocks", "serialize_bars"},
+        )
+        for result in results.values():
+            self.assertLessEqual(result["min_ms"], result["median_ms"])
+            self.assertLessEqual(result["median_ms"], result["max_ms"])
+        self.assertGreater(results["prices"]["queries"], 0)
+        # The ingest runs are rolled back
+        self.assertEquals(StockTimeSeries.objects.count(), 30 * 5)
+
+
+class WebSocketBenchmarkTest(TestCase):
+    def test_seed_and_cleanup(self):
+        stock, session_keys = websocket_benchmark.seed(3)
+
+        self.assertEquals(Follow.objects.filter(stock=stock).count(), 3)
+        self.assertEquals(Stock.objects.get(pk=stock.pk).follower_count, 3)
+        users = {SessionStore(session_key=key).load()["ws_user"] for key in session_keys}
+        self.assertEquals(users, set(Follow.objects.filter(stock=stock).values_list("user_id", flat=True)))
+
+        websocket_benchmark.cleanup()
+        self.assertFalse(Stock.objects.filter(symbol=websocket_benchmark.SYMBOL).exists())
+        self.assertFalse(User.objects.filter(email__startswith=websocket_benchmark.EMAIL_PREFIX).exists())
+        self.assertFalse(Session.objects.filter(session_key__in=session_keys).exists())
+
+    def test_push_update(self):
+        stock, session_keys = websocket_benchmark.seed(1)
+        user_id = SessionStore(session_key=session_keys[0]).load()["ws_user"]
+
+        async def receive_update():
+            communicator = WebsocketCommunicator(HomeConsumer.as_asgi(), "/ws/home/")
+            communicator.scope["session"] = {"ws_user": user_id}
+            await communicator.connect()
+            await sync_to_async(websocket_benchmark.push_update)(stock.pk)
+            message = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return message
+
+        message = async_to_sync(receive_update)()
+
+        self.assertEquals(message["message"]["symbol"], websocket_benchmark.SYMBOL)
+        self.assertEquals(message["message"]["last_update_date"], "2023-08-15")
+        self.assertEquals(StockTimeSeries.objects.filter(stock=stock).count(), 2)
+
+
+class ConcurrencyBenchmarkTest(TestCase):
+    def test_requests_for(self):
+        self.assertEquals(
+            concurrency_benchmark.requests_for(["prices", "follow"], 7),
+            [
+                ("GET", "/stock/prices/", None),
+                ("DELETE", "/stock/follow/", {"stock": 7}),
+                ("POST", "/stock/follow/", {"stock": 7}),
+            ],
+        )
+
+    def test_process_stats(self):
+        self.assertGreater(websocket_benchmark.threads(os.getpid()), 0)
+        self.assertGreater(websocket_benchmark.cpu_seconds(os.getpid()), 0)
+        self.assertIsNone(websocket_benchmark.cpu_seconds(0))
+
+
+class TracingTest(TestCase):
+    TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+    TRACEPARENT = f"00-{TRACE_ID}-00f067aa0ba902b7-01"
+
+    def setUp(self):
+        setup_test_environment()
+        self.user = UserFactory()
+        self.user.save()
+        self.bearer_header = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+        self.exporter = tracing.get_exporter()
+        self.exporter.clear()
+
+    def _fake_get(self, url, params, timeout):
+        response = mock.Mock()
+        response.status_code = 200
+        body = fake_twelvedata.time_series_response(params)
+        response.json = lambda: body
+        return response
+
+    def _spans(self):
+        return {span.name: span for span in self.exporter.spans}
+
+    @mock.patch("requests.get")
+    def test_onboarding(self, mock_get):
+        mock_get.side_effect = self._fake_get
+        entry = CatalogEntryFactory()
+        entry.save()
+
+        async def onboard():
+            communicator = WebsocketCommunicator(HomeConsumer.as_asgi(), "/ws/home/")
+            communicator.scope["session"] = {"ws_user": self.user.id}
+            await communicator.connect()
+            resp = await sync_to_async(self.client.post)(
+                "/stock/request/",
+                json.dumps({"symbol": entry.symbol}),
+                content_type="application/json",
+                headers={**self.bearer_header, "traceparent": self.TRACEPARENT},
+            )
+            message = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return resp, message
+
+        resp, message = async_to_sync(onboard)()
+
+        self.assertEquals(resp.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn("traceparent", message)
+        spans = self._spans()
+        self.assertEquals({span.trace_id for span in spans.values()}, {self.TRACE_ID})
+        request = spans["POST stock/request/"]
+        update = spans[f"task {update_time_series.name}"]
+        fan_out_task = spans[f"task {fan_out_stock_update.name}"]
+        self.assertEquals(request.parent_id, "00f067aa0ba902b7")
+        self.assertEquals(request.attributes["status"], 201)
+        self.assertEquals(spans["StockSerializer.is_valid"].parent_id, request.span_id)
+        self.assertEquals(spans["FollowSerializer.save"].parent_id, request.span_id)
+        self.assertEquals(update.parent_id, request.span_id)
+        self.assertEquals(spans["twelvedata time_series"].parent_id, update.span_id)
+        self.assertEquals(spans["twelvedata time_series"].attributes["status_code"], 200)
+        self.assertEquals(spans["store_bars"].parent_id, update.span_id)
+        self.assertEquals(spans["store_bars"].attributes["rows"], fake_twelvedata.DEFAULT_OUTPUTSIZE)
+        self.assertEquals(fan_out_task.parent_id, update.span_id)
+        self.assertEquals(spans["fan_out"].parent_id, fan_out_task.span_id)
+        self.assertEquals(spans["HomeConsumer.send_stock_update"].parent_id, spans["fan_out"].span_id)
+
+    def test_task_headers(self):
+        headers = {}
+        tracing.inject_task_headers(headers=headers)
+        self.assertEquals(headers, {})
+
+        with tracing.span("publisher") as publisher:
+            tracing.inject_task_headers(headers=headers)
+        self.assertEquals(headers["traceparent"], publisher.traceparent)
+
+        # In a worker, the headers of the message end up on the task's request
+        update_time_series.push_request(id="task-id", traceparent=headers["traceparent"])
+        try:
+            tracing.start_task_span(task_id="task-id", task=update_time_series)
+            tracing.finish_task_span(task_id="task-id", task=update_time_series, state="SUCCESS")
+        finally:
+            update_time_series.pop_request()
+
+        task = self._spans()[f"task {update_time_series.name}"]
+        self.assertEquals((task.trace_id, task.parent_id), (publisher.trace_id, publisher.span_id))
+        self.assertEquals(task.attributes["state"], "SUCCESS")
+        self.assertIsNone(tracing.current_span())
+
+    def test_errors_and_malformed_parents(self):
+        with self.assertRaises(ValueError), tracing.span("failing", parent="00-not-a-trace-01") as failing:
+            raise ValueError("boom")
+
+        self.assertIsNone(failing.parent_id)
+        self.assertRegex(failing.trace_id, r"^[0-9a-f]{32}$")
+        self.assertEquals(failing.error, "ValueError: boom")
+        self.assertIsNone(tracing.parse_traceparent(f"00-{'0' * 32}-00f067aa0ba902b7-01"))
+
+    def test_file_exporter(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "traces.jsonl")
+            exporter = tracing.FileExporter(path)
+            with mock.patch.object(tracing, "get_exporter", return_value=exporter):
+                with tracing.span("outer", parent=self.TRACEPARENT):
+                    with tracing.span("inner", rows=3):
+                        pass
+
+            with open(path) as f:
+                inner, outer = [json.loads(line) for line in f]
+
+        self.assertEquals(inner["name"], "inner")
+        self.assertEquals(inner["attributes"], {"rows": 3})
+        self.assertEquals(inner["parent_id"], outer["span_id"])
+        self.assertEquals(outer["trace_id"], self.TRACE_ID)
+        self.assertGreaterEqual(outer["duration_ms"], inner["duration_ms"])
+
+
+class ReplicaRouterTest(TestCase):
+    def setUp(self):
+        setup_test_environment()
+        self.user = UserFactory()
+        self.user.save()
+        self.bearer_header = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+        self.stock = StockFactory()
+        self.stock.save()
+
+    @override_settings(DATABASE_REPLICAS=["replica0", "replica1"])
+    def test_router(self):
+        router = routers.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Stock))
+
+        with routers.read_from_replicas():
+            self.assertIn(router.db_for_read(Stock), ["replica0", "replica1"])
+            self.assertIsNone(router.db_for_read(Session))
+            self.assertIsNone(router.db_for_write(Stock))
+
+        self.assertIsNone(router.db_for_read(Stock))
+        self.assertFalse(router.allow_migrate("replica0", "application"))
+        self.assertIsNone(router.allow_migrate("default", "application"))
+
+    def _read_databases(self, method, path, **kwargs):
+        """The databases the router picked for the stock reads of a request, None standing for the primary."""
+        picked = set()
+        db_for_read = routers.ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            database = db_for_read(router, model, **hints)
+            if model in (Stock, StockTimeSeries, Follow):
+                picked.add(database)
+            return database
+
+        with mock.patch.object(routers.ReplicaRouter, "db_for_read", record):
+            resp = getattr(self.client, method)(path, headers=self.bearer_header, **kwargs)
+        self.assertLess(resp.status_code, 300)
+        return picked
+
+    # The test database stands in for the replica
+    @override_settings(DATABASE_REPLICAS=["default"], DATABASE_REPLICA_STICKINESS=5)
+    def test_read_your_writes(self):
+        with mock.patch.object(versions, "modified", return_value=time.time() - 60):
+            self.assertEquals(self._read_databases("get", "/stock/prices/"), {"default"})
+            self.assertEquals(self._read_databases("get", "/home/"), {"default"})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEquals(
+                self._read_databases(
+                    "post", "/stock/follow/", data={"stock": self.stock.pk}, content_type="application/json"
+                ),
+                {None},
+            )
+
+        # Right after following, the user's reads stay on the primary
+        self.assertEquals(self._read_databases("get", "/stock/prices/"), {None})
+        self.assertEquals(self._read_databases("get", "/home/"), {None})
+
+    @override_settings(DATABASE_REPLICAS=["default"], DATABASE_REPLICA_STICKINESS=5)
+    def test_data_bump_pins_everyone(self):
+        # A replica lagging behind the bars stored below would give a stale body under their new ETag
+        versions.modified(self.user.pk)
+        with mock.patch("time.time", return_value=time.time() + 60):
+            self.assertEquals(self._read_databases("get", "/stock/prices/"), {"default"})
+            etag = self.client.get("/stock/prices/", headers=self.bearer_header)["ETag"]
+
+            with self.captureOnCommitCallbacks(execute=True):
+                ingest.store_bars(
+                    ingest.parse_bars(self.stock, fake_twelvedata.bars("AAAA", [datetime.date(2023, 8, 14)]))
+                )
+
+            # Every user, not only the ones who wrote, reads the new bars from the primary
+            self.assertEquals(self._read_databases("get", "/stock/prices/"), {None})
+            self.assertEquals(self._read_databases("get", "/home/"), {None})
+            resp = self.client.get("/stock/prices/", headers={**self.bearer_header, "If-None-Match": etag})
+            self.assertEquals(resp.status_code, status.HTTP_200_OK)
+            self.assertEquals(resp.data["results"][0]["latest_data"]["datetime"], "2023-08-14")
+
+    def test_no_replicas(self):
+        self.assertEquals(self._read_databases("get", "/stock/prices/"), {None})
+
+
+@override_settings(ROOT_URLCONF="djangostock.application.tests.urls")
+class AsyncViewsTest(TestCase):
+    def setUp(self):
+        setup_test_environment()
+        stocks, users = seed_universe(25, bars=30, followers=1, follows=3)
+        self.stock = stocks[0]
+        self.user = users[0]
+        self.bearer_header = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def _both(self, method, path, **kwargs):
+        """The responses of the sync and the async variant, each in a new session."""
+        responses = []
+        for prefix in ["", "/async"]:
+            self.client.cookies.clear()
+            responses.append(getattr(self.client, method)(f"{prefix}{path}", headers=self.bearer_header, **kwargs))
+        return responses
+
+    def test_routes(self):
+        sync_routes = {str(pattern.pattern) for pattern in urls.sync_urlpatterns}
+        for pattern in urls.async_urlpatterns:
+            self.assertIn(str(pattern.pattern), sync_routes)
+            self.assertTrue(asyncio.iscoroutinefunction(pattern.callback))
+
+    def test_same_responses(self):
+        for path in [
+            "/stock/prices/",
+            "/stock/prices/?page=2",
+            "/stock/prices/?page=3",
+            "/stock/history/",
+            f"/stock/history/?symbol={self.stock.symbol}",
+            f"/stock/history/?symbol={self.stock.symbol}&interval=1week&start=2023-08-01",
+            "/stock/history/?symbol=NOPE",
+            "/home/",
+        ]:
+            with self.subTest(path=path):
+                sync, async_ = self._both("get", path)
+                self.assertEquals(async_.status_code, sync.status_code)
+                self.assertEquals(async_.content.replace(b"/async", b""), sync.content)
+                self.assertEquals(async_.get("ETag"), sync.get("ETag"))
+                self.assertEquals(async_.get("Last-Modified"), sync.get("Last-Modified"))
+                self.assertEquals(async_.get("Cache-Control"), sync.get("Cache-Control"))
+
+        self.assertEquals(self.client.get("/async/stock/prices/").status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_not_modified(self):
+        for path in ["/async/stock/prices/", "/async/home/"]:
+            with self.subTest(path=path):
+                self.client.get(path, headers=self.bearer_header)
+                resp = self.client.get(path, headers=self.bearer_header)
+                resp = self.client.get(path, headers={**self.bearer_header, "If-None-Match": resp["ETag"]})
+                self.assertEquals(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+                self.assertEquals(resp["Cache-Control"], "private, no-cache")
+
+    def test_follow(self):
+        stock = Stock.objects.exclude(follow__user=self.user).first()
+        resp = self.client.post(
+            "/async/stock/follow/", {"stock": stock.pk}, headers=self.bearer_header, content_type="application/json"
+        )
+        self.assertEquals(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEquals(resp.json()["stock"], stock.pk)
+        stock.refresh_from_db()
+        self.assertEquals(stock.follower_count, 1)
+
+        resp = self.client.post(
+            "/async/stock/follow/", {"stock": 0}, headers=self.bearer_header, content_type="application/json"
+        )
+        self.assertEquals(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+        for expected in [status.HTTP_204_NO_CONTENT, status.HTTP_404_NOT_FOUND]:
+            resp = self.client.delete(
+                "/async/stock/follow/",
+                {"stock": stock.pk},
+                headers=self.bearer_header,
+                content_type="application/json",
+            )
+            self.assertEquals(resp.status_code, expected)
+        stock.refresh_from_db()
+        self.assertEquals(stock.follower_count, 0)
+
+    @override_settings(
+        QUERY_PROFILING={"SAMPLE_RATE": 1.0, "BUDGETS": {"default": {"queries": 100, "db_ms": 1000, "total_ms": 1000}}}
+    )
+    async def test_async_middleware(self):
+        # The async client runs the middleware in async mode, as under Daphne
+        tracing.get_exporter().clear()
+        resp = await self.async_client.get("/async/stock/prices/", headers=self.bearer_header)
+        self.assertEquals(resp.status_code, status.HTTP_200_OK)
+        self.assertEquals(len(resp.json()["results"]), 20)
+        self.assertRegex(resp["Server-Timing"], r'desc="[1-9]\d* queries"')
+        self.assertEquals([span.name for span in tracing.get_exporter().spans], ["GET async/stock/prices/"])
+
+        self.assertEquals((await self.async_client.get("/health/")).content, b"ok")
@@ -0,0 +1,9 @@
+"""Both variants of the views in async_views: the sync ones at their URLs, the async ones under async/."""
+from django.urls import include, path
+
+from .. import urls
+
+urlpatterns = [
+    path("async/", include(urls.async_urlpatterns)),
+    path("", include(urls.sync_urlpatterns)),
+]
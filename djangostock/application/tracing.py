@@ -0,0 +1,205 @@
+"""
+Tracing of a request through its Celery tasks and WebSocket pushes, e.g. an onboarding from StockRequest
+through update_time_series, the TwelveData call, store_bars and the fan-out to HomeConsumer.
+
+Spans carry a W3C ``traceparent`` across processes: from the HTTP header, in the headers of the Celery
+tasks queued under a span, and in the channel layer messages sent under one. Finished spans go to the
+exporter of the TRACING setting, chosen like SINGLE_FLIGHT_LOCKS chooses a lock backend.
+"""
+import contextvars
+import json
+import re
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from celery.signals import before_task_publish, task_postrun, task_prerun
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+TRACEPARENT_RE = re.compile(r"00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}")
+
+_current = contextvars.ContextVar("djangostock_span", default=None)
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self.end = None
+        self.error = None
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration_ms": round((self.end - self.start) * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class NullExporter:
+    """Drops the spans; context still propagates, so a process that does export links up."""
+
+    def export(self, span):
+        pass
+
+
+class InMemoryExporter:
+    """Keeps the last ``size`` spans in ``spans``, for tests and the shell."""
+
+    def __init__(self, size=10_000):
+        self.spans = deque(maxlen=size)
+
+    def export(self, span):
+        self.spans.append(span)
+
+    def clear(self):
+        self.spans.clear()
+
+
+class FileExporter:
+    """Appends a JSON line per span to ``path``; processes can share the file."""
+
+    def __init__(self, path="traces.jsonl"):
+        self.path = path
+        self._mutex = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.as_dict(), default=str) + "\n"
+        with self._mutex, open(self.path, "a") as f:
+            f.write(line)
+
+
+@lru_cache(maxsize=None)
+def get_exporter():
+    exporter = settings.TRACING
+    return import_string(exporter["BACKEND"])(**exporter.get("CONFIG", {}))
+
+
+def parse_traceparent(value):
+    """(trace id, parent span id) of a ``traceparent`` value, None when it is missing or malformed."""
+    match = TRACEPARENT_RE.fullmatch(value or "")
+    if not match or match[1] == "0" * 32 or match[2] == "0" * 16:
+        return None
+    return match[1], match[2]
+
+
+def current_span():
+    return _current.get()
+
+
+def start_span(name, parent=None, **attributes):
+    """
+    Start a span and make it the current one: a child of the ``parent`` traceparent if valid, else of the
+    current span, else the root of a new trace. Returns (span, token) for finish_span.
+    """
+    remote = parse_traceparent(parent)
+    current = _current.get()
+    if remote:
+        trace_id, parent_id = remote
+    elif current:
+        trace_id, parent_id = current.trace_id, current.span_id
+    else:
+        trace_id, parent_id = secrets.token_hex(16), None
+    span = Span(name, trace_id, parent_id, attributes)
+    return span, _current.set(span)
+
+
+def finish_span(span, token, error=None):
+    span.end = time.time()
+    if error is not None:
+        span.error = f"{type(error).__name__}: {error}"
+    _current.reset(token)
+    get_exporter().export(span)
+
+
+@contextmanager
+def span(name, parent=None, **attributes):
+    started, token = start_span(name, parent, **attributes)
+    try:
+        yield started
+    except BaseException as e:
+        finish_span(started, token, e)
+        raise
+    finish_span(started, token)
+
+
+def with_trace_context(event):
+    """``event`` with the current span's traceparent, for a channel layer message."""
+    current = _current.get()
+    return {**event, "traceparent": current.traceparent} if current else event
+
+
+class TracingMiddleware:
+    """A span per request, continuing the trace of the request's ``traceparent`` header."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with span(request.method, parent=request.headers.get("traceparent"), path=request.path) as current:
+            response = self.get_response(request)
+            self.name(current, request, response)
+            return response
+
+    async def __acall__(self, request):
+        with span(request.method, parent=request.headers.get("traceparent"), path=request.path) as current:
+            response = await self.get_response(request)
+            self.name(current, request, response)
+            return response
+
+    def name(self, current, request, response):
+        match = request.resolver_match
+        current.name = f"{request.method} {match.route if match else 'unmatched'}"
+        current.set(status=response.status_code)
+
+
+@before_task_publish.connect
+def inject_task_headers(headers=None, **kwargs):
+    current = _current.get()
+    if current and headers is not None:
+        headers.setdefault("traceparent", current.traceparent)
+
+
+_task_spans = {}
+
+
+@task_prerun.connect
+def start_task_span(task_id, task, **kwargs):
+    # Eager tasks have no headers, they run under the current span
+    _task_spans[task_id] = start_span(f"task {task.name}", parent=task.request.get("traceparent"), task_id=task_id)
+
+
+@task_postrun.connect
+def finish_task_span(task_id, task, state=None, **kwargs):
+    started = _task_spans.pop(task_id, None)
+    if started is not None:
+        started[0].set(state=state)
+        finish_span(*started)
@@ -0,0 +1,86 @@
+"""
+Every TwelveData call goes through ``get`` (or ``aget`` from async code), so that all of them share
+one circuit breaker and one per-minute request budget.
+"""
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import tracing
+from .circuit_breaker import CircuitBreaker
+from .metrics import UPSTREAM_DURATION, UPSTREAM_REQUESTS
+from .rate_limit import RateLimiter
+
+breaker = CircuitBreaker("twelvedata", **settings.TWELVEDATA_CIRCUIT_BREAKER)
+limiter = RateLimiter("twelvedata", settings.TWELVEDATA_REQUESTS_PER_MINUTE)
+
+
+class UpstreamUnavailable(Exception):
+    """TwelveData failed or is rate limiting us; the call should be retried later."""
+
+
+def _rate_limited(r):
+    if r.status_code == 429:
+        return True
+    # TwelveData also reports exhausted credits in a 200 response body
+    try:
+        return r.json().get("code") == 429
+    except ValueError:
+        return False
+
+
+def _before_call(endpoint):
+    if not breaker.allow_request():
+        UPSTREAM_REQUESTS.labels(endpoint, "rejected").inc()
+        raise UpstreamUnavailable(f"Circuit {breaker.name} is {breaker.state()}")
+
+
+def _after_call(endpoint, r):
+    if _rate_limited(r):
+        UPSTREAM_REQUESTS.labels(endpoint, "rate_limited").inc()
+        breaker.record_failure(rate_limited=True)
+        raise UpstreamUnavailable("Rate limited")
+    if r.status_code >= 500:
+        UPSTREAM_REQUESTS.labels(endpoint, "error").inc()
+        breaker.record_failure()
+        raise UpstreamUnavailable(f"HTTP {r.status_code}")
+    UPSTREAM_REQUESTS.labels(endpoint, "ok").inc()
+    breaker.record_success()
+    return r
+
+
+def get(endpoint, params):
+    with tracing.span(f"twelvedata {endpoint}", endpoint=endpoint, symbol=params.get("symbol")) as current:
+        _before_call(endpoint)
+        limiter.wait()
+        try:
+            with UPSTREAM_DURATION.labels(endpoint).time():
+                r = requests.get(
+                    f"{settings.TWELVEDATA_BASE_URL}/{endpoint}",
+                    params=params,
+                    timeout=settings.TWELVEDATA_TIMEOUT,
+                )
+        except requests.RequestException as e:
+            UPSTREAM_REQUESTS.labels(endpoint, "error").inc()
+            breaker.record_failure()
+            raise UpstreamUnavailable(str(e)) from e
+        current.set(status_code=r.status_code)
+        return _after_call(endpoint, r)
+
+
+async def aget(client, endpoint, params):
+    """``get`` for an ``httpx.AsyncClient`` whose base_url is TwelveData's."""
+    with tracing.span(f"twelvedata {endpoint}", endpoint=endpoint, symbol=params.get("symbol")) as current:
+        # The circuit breaker reads and writes the cache
+        await sync_to_async(_before_call, thread_sensitive=False)(endpoint)
+        await limiter.await_turn()
+        try:
+            with UPSTREAM_DURATION.labels(endpoint).time():
+                r = await client.get(f"/{endpoint}", params=params, timeout=settings.TWELVEDATA_TIMEOUT)
+        except httpx.HTTPError as e:
+            UPSTREAM_REQUESTS.labels(endpoint, "error").inc()
+            await sync_to_async(breaker.record_failure, thread_sensitive=False)()
+            raise UpstreamUnavailable(str(e)) from e
+        current.set(status_code=r.status_code)
+        return await sync_to_async(_after_call, thread_sensitive=False)(endpoint, r)
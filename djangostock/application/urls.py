@@ -1,12 +1,43 @@
+from django.conf import settings
 from django.urls import path
 
-from .views import UserList, UserDetail, StockPrices, StockFollow, Home, StockRequest
+from .async_views import AsyncHome, AsyncStockFollow, AsyncStockHistory, AsyncStockPrices
+from .views import (
+    UserList,
+    UserDetail,
+    StockPrices,
+    StockFollow,
+    Home,
+    StockRequest,
+    StockSearch,
+    StockHistory,
+    StockFollowBulk,
+    PopularStocks,
+    UpstreamHealth,
+)
 
 urlpatterns = [
     path("users/", UserList.as_view()),
     path("users/<int:pk>/", UserDetail.as_view()),
     path("stock/prices/", StockPrices.as_view()),
+    path("stock/popular/", PopularStocks.as_view()),
     path("stock/follow/", StockFollow.as_view()),
+    path("stock/follow/bulk/", StockFollowBulk.as_view()),
     path("stock/request/", StockRequest.as_view()),
+    path("stock/search/", StockSearch.as_view()),
+    path("stock/history/", StockHistory.as_view()),
     path("home/", Home.as_view()),
+    path("health/twelvedata/", UpstreamHealth.as_view()),
 ]
+
+async_urlpatterns = [
+    path("stock/prices/", AsyncStockPrices.as_view()),
+    path("stock/follow/", AsyncStockFollow.as_view()),
+    path("stock/history/", AsyncStockHistory.as_view()),
+    path("home/", AsyncHome.as_view()),
+]
+
+sync_urlpatterns = urlpatterns
+if settings.ASYNC_VIEWS:
+    # The first match wins
+    urlpatterns = async_urlpatterns + sync_urlpatterns
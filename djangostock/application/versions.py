@@ -0,0 +1,106 @@
+"""
+Data versions for conditional GETs. The data version moves whenever bars land or stocks change, and each
+user's follows version whenever they follow or unfollow, after the change commits. Versions live in the
+default cache, so checking an ETag or Last-Modified against them costs no query.
+
+A version missing from the cache, e.g. evicted, starts again from the clock, above any value it held.
+"""
+import datetime
+import time
+import zlib
+
+from django.core.cache import cache
+from django.db import transaction
+
+DATA = "data"
+
+
+def _follows(user_id):
+    return f"follows:{user_id}"
+
+
+def _keys(scope):
+    return f"version:{scope}", f"version_modified:{scope}"
+
+
+def _bump(scope):
+    key, modified_key = _keys(scope)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns() // 1000, timeout=None)
+    cache.set(modified_key, time.time(), timeout=None)
+
+
+def bump(scope):
+    """Move the version of ``scope`` once the current transaction commits."""
+    transaction.on_commit(lambda: _bump(scope))
+
+
+def bump_data_version():
+    bump(DATA)
+
+
+def bump_follows_version(user_id):
+    bump(_follows(user_id))
+
+
+def versions(*scopes):
+    """[(version, modified timestamp)] of ``scopes``."""
+    keys = [key for scope in scopes for key in _keys(scope)]
+    values = cache.get_many(keys)
+    missing = {}
+    for scope in scopes:
+        key, modified_key = _keys(scope)
+        if key not in values or modified_key not in values:
+            missing[key] = time.time_ns() // 1000
+            missing[modified_key] = time.time()
+    if missing:
+        for key, value in missing.items():
+            cache.add(key, value, timeout=None)
+        values = cache.get_many(keys)
+    return [(values.get(key), values.get(modified_key)) for key, modified_key in map(_keys, scopes)]
+
+
+def modified(user_id=None):
+    """
+    Timestamp of the last change of the data, or of the follows of ``user_id`` if later, or of the first call
+    if the cache lost them.
+    """
+    scopes = [DATA] if user_id is None else [DATA, _follows(user_id)]
+    return max(modified for _, modified in versions(*scopes))
+
+
+def _etag(request, scopes):
+    # The browsable API and the JSON share a URL, but not an ETag
+    accept = zlib.crc32(request.META.get("HTTP_ACCEPT", "").encode())
+    return '"{}-{:x}"'.format("-".join(str(version) for version, _ in versions(*scopes)), accept)
+
+
+def _last_modified(scopes):
+    return datetime.datetime.fromtimestamp(max(modified for _, modified in versions(*scopes)), datetime.timezone.utc)
+
+
+def prices_etag(request, *args, **kwargs):
+    return _etag(request, [DATA])
+
+
+def prices_last_modified(request, *args, **kwargs):
+    return _last_modified([DATA])
+
+
+def _home_scopes(request):
+    # Until Home stored the user for the WebSocket in this session, it has to render
+    if request.session.get("ws_user") != request.user.id:
+        return None
+    return [DATA, _follows(request.user.id)]
+
+
+def home_etag(request, *args, **kwargs):
+    scopes = _home_scopes(request)
+    return _etag(request, scopes) if scopes else None
+
+
+def home_last_modified(request, *args, **kwargs):
+    scopes = _home_scopes(request)
+    return _last_modified(scopes) if scopes else None
@@ -1,18 +1,35 @@
-import requests
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
 from django.db.models import OuterRef, Subquery, Max
 from django.http import Http404
 from django.shortcuts import render
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from rest_framework import status
 from rest_framework.generics import get_object_or_404, ListAPIView
 from rest_framework.pagination import PageNumberPagination
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from . import archive, fast_serializers, tracing, twelvedata, versions
 from .auth import UnauthenticatedPost, IsHimself, IsAdmin
-from .models import User, Stock, StockTimeSeries, Follow
-from .serializers import UserSerializer, StockSerializer, FollowSerializer, StockRequestSerializer
-from .tasks import update_time_series
+from .metrics import CHANNEL_LAYER_SEND_DURATION
+from .models import User, Stock, StockTimeSeries, Follow, CatalogEntry
+from .routers import replica_reads
+from .serializers import (
+    UserSerializer,
+    StockSerializer,
+    FollowSerializer,
+    StockRequestSerializer,
+    CatalogEntrySerializer,
+    BulkFollowSerializer,
+    PopularStockSerializer,
+    StockHistoryQuerySerializer,
+)
+from .tasks import enqueue_update_time_series, PRIORITY_INTERACTIVE
 
 
 class UserList(APIView):
@@ -74,38 +91,62 @@ class StockPricePagination(PageNumberPagination):
     page_size = 20
 
 
+def stocks_by_latest_volume(queryset):
+    """STOCK_VALUES rows of ``queryset``'s stocks, by the volume of their latest bar, highest first."""
+    # The newest bar is on last_update_date, which also prunes a partitioned table to one partition
+    latest_volume_subquery = StockTimeSeries.objects.filter(
+        stock=OuterRef("pk"), recorded_date=OuterRef("last_update_date")
+    ).values("volume")[:1]
+
+    return (
+        queryset.annotate(latest_volume=Subquery(latest_volume_subquery))
+        .order_by("-latest_volume")
+        .values(*fast_serializers.STOCK_VALUES)
+    )
+
+
 class StockPrices(ListAPIView):
     permission_classes = [IsAuthenticated]
     queryset = Stock.objects.filter(last_update_date__isnull=False)
     serializer_class = StockSerializer
     pagination_class = StockPricePagination
 
+    # Unchanged data is answered with a 304 before the query; clients revalidate before reusing a response
+    @method_decorator(cache_control(private=True, no_cache=True))
+    @method_decorator(condition(etag_func=versions.prices_etag, last_modified_func=versions.prices_last_modified))
+    @method_decorator(replica_reads)
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
+        stocks_ordered_by_latest_volume = stocks_by_latest_volume(self.get_queryset())
 
-        latest_volume_subquery = (
-            StockTimeSeries.objects.filter(stock=OuterRef("pk")).order_by("-recorded_date").values("volume")[:1]
-        )
+        # Read-only, so the rows skip the model instances and StockSerializer for the same JSON
+        page = self.paginate_queryset(stocks_ordered_by_latest_volume)
+        if page is not None:
+            return self.get_paginated_response(fast_serializers.stocks(page))
 
-        # TODO THIS SHOULD ALSO WORK
-        # latest_volume_subquery = (
-        #     StockTimeSeries.objects.filter(stock=OuterRef("pk"))
-        #     .get(recorded_date="stock__last_update_date")
-        #     .values("volume")[:1]
-        # )
+        return Response(fast_serializers.stocks(stocks_ordered_by_latest_volume))
 
-        # Query to retrieve stocks along with the latest volume and order by volume
-        stocks_ordered_by_latest_volume = queryset.annotate(latest_volume=Subquery(latest_volume_subquery)).order_by(
-            "-latest_volume"
-        )
 
-        page = self.paginate_queryset(stocks_ordered_by_latest_volume)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+class PopularStockPagination(PageNumberPagination):
+    page_size = 20
 
-        serializer = self.get_serializer(stocks_ordered_by_latest_volume, many=True)
-        return Response(serializer.data)
+
+class PopularStocks(ListAPIView):
+    """
+    Stocks ordered by number of followers, served from the stock_popularity_idx index.
+    """
+
+    permission_classes = [IsAuthenticated]
+    queryset = Stock.objects.filter(follower_count__gt=0).order_by("-follower_count", "symbol")
+    serializer_class = PopularStockSerializer
+    pagination_class = PopularStockPagination
+
+    @method_decorator(replica_reads)
+    def list(self, request, *args, **kwargs):
+        stocks = self.get_queryset().values(*fast_serializers.STOCK_VALUES, "follower_count")
+        page = self.paginate_queryset(stocks)
+        if page is not None:
+            return self.get_paginated_response(fast_serializers.stocks(page, extra=["follower_count"]))
+        return Response(fast_serializers.stocks(stocks, extra=["follower_count"]))
 
 
 class StockFollow(APIView):
@@ -121,14 +162,51 @@ class StockFollow(APIView):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, format=None):
-        try:
-            follow = Follow.objects.get(user=request.user, stock_id=request.data["stock"])
-        except Follow.DoesNotExist as e:
+        if not Follow.objects.unfollow(request.user, [request.data["stock"]]):
             return Response({"error": "Not following."}, status=status.HTTP_404_NOT_FOUND)
-        follow.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class StockFollowBulk(APIView):
+    """
+    Replace the set of stocks the user follows in one request.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def put(self, request, format=None):
+        serializer = BulkFollowSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        wanted = serializer.validated_data["stocks_by_id"]
+
+        current = dict(Follow.objects.filter(user=request.user).values_list("stock_id", "stock__symbol"))
+        to_follow = wanted.keys() - current.keys()
+        to_unfollow = current.keys() - wanted.keys()
+
+        with transaction.atomic():
+            to_follow = Follow.objects.follow(request.user, to_follow)
+            to_unfollow = Follow.objects.unfollow(request.user, to_unfollow)
+
+        data = {
+            "symbols": sorted(wanted.values()),
+            "followed": sorted(wanted[stock_id] for stock_id in to_follow),
+            "unfollowed": sorted(current[stock_id] for stock_id in to_unfollow),
+        }
+        if to_follow or to_unfollow:
+            with CHANNEL_LAYER_SEND_DURATION.labels("send.follows.update").time():
+                async_to_sync(get_channel_layer().group_send)(
+                    f"user_{request.user.id}",
+                    tracing.with_trace_context(
+                        {
+                            "type": "send.follows.update",
+                            "message": data,
+                        }
+                    ),
+                )
+        return Response(data)
+
+
 class StockRequest(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -137,30 +215,27 @@ class StockRequest(APIView):
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         symbol = serializer.data["symbol"]
-        query_params = {
-            "currency": "USD",
-            "country": "United States",
-            "exchange": "NASDAQ",
-            "type": "Common Stock",
-            "symbol": symbol,
-        }
 
-        r = requests.get(
-            "https://api.twelvedata.com/stocks",
-            params=query_params,
-        )
-        if not r.json()["data"]:
+        try:
+            entry = CatalogEntry.objects.get(symbol=symbol)
+        except CatalogEntry.DoesNotExist:
             return Response({"error": "Not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = StockSerializer(data=r.json()["data"][0])
-        if serializer.is_valid():
-            serializer.save()
+        serializer = StockSerializer(data=CatalogEntrySerializer(entry).data)
+        with tracing.span("StockSerializer.is_valid"):
+            valid = serializer.is_valid()
+        if valid:
+            with tracing.span("StockSerializer.save"):
+                serializer.save()
 
         follow = FollowSerializer(data={"user": request.user.pk, "stock": Stock.objects.get(symbol=symbol).pk})
-        follow.is_valid(raise_exception=True)
-        follow.save()
+        with tracing.span("FollowSerializer.is_valid"):
+            follow.is_valid(raise_exception=True)
+        with tracing.span("FollowSerializer.save"):
+            follow.save()
 
-        update_time_series.delay(symbol=symbol)
+        # Onboarding skips the ingest backlog, a user is waiting for it
+        enqueue_update_time_series(symbol, take_over=True, queue="interactive", priority=PRIORITY_INTERACTIVE)
 
         return Response(
             serializer.data,
@@ -168,12 +243,61 @@ class StockRequest(APIView):
         )
 
 
+class StockSearch(APIView):
+    """
+    Autocomplete over the local symbol catalog.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    @method_decorator(replica_reads)
+    def get(self, request, format=None):
+        entries = CatalogEntry.objects.search(request.query_params.get("q", ""))
+        serializer = CatalogEntrySerializer(entries, many=True)
+        return Response(serializer.data)
+
+
+class StockHistory(APIView):
+    """
+    Daily, weekly or monthly bars of a stock over a date range, from live and archived storage alike.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    @method_decorator(replica_reads)
+    def get(self, request, format=None):
+        query = StockHistoryQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        stock = get_object_or_404(Stock, symbol=query.validated_data["symbol"])
+        bars = archive.history(stock, query.validated_data.get("start"), query.validated_data.get("end"))
+        return Response(fast_serializers.bars(archive.resample(bars, query.validated_data["interval"])))
+
+
+class UpstreamHealth(APIView):
+    """
+    State of the TwelveData circuit breaker; 503 while the circuit is open.
+    """
+
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request, format=None):
+        health = twelvedata.breaker.health()
+        code = status.HTTP_503_SERVICE_UNAVAILABLE if health["state"] == "open" else status.HTTP_200_OK
+        return Response(health, status=code)
+
+
 class Home(APIView):
     """This view would need some proper js that adds header with Bearer token"""
 
     permission_classes = [IsAuthenticated]
 
+    @method_decorator(cache_control(private=True, no_cache=True))
+    @method_decorator(condition(etag_func=versions.home_etag, last_modified_func=versions.home_last_modified))
+    @method_decorator(replica_reads)
     def get(self, request):
-        context = {"stocks": request.user.follows.all()}
+        # The serialized stocks, so the latest bars and currencies don't cost a query per stock
+        context = {"stocks": fast_serializers.stocks(request.user.follows.values(*fast_serializers.STOCK_VALUES))}
         request.session["ws_user"] = request.user.id
         return render(request, "home.html", context)
@@ -1,11 +1,24 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.http import HttpResponse
 
 
 class HealthCheckMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        if request.path == '/health/':
-            return HttpResponse('ok')
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.path == "/health/":
+            return HttpResponse("ok")
         return self.get_response(request)
+
+    async def __acall__(self, request):
+        if request.path == "/health/":
+            return HttpResponse("ok")
+        return await self.get_response(request)
@@ -14,6 +14,7 @@ from pathlib import Path
 import dj_database_url
 from decouple import Csv, config
 from datetime import timedelta
+from kombu import Queue
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
@@ -71,6 +72,10 @@ ASGI_APPLICATION = "djangostock.asgi.application"
 
 MIDDLEWARE = [
     "djangostock.HealthCheckMiddleware",
+    "djangostock.application.metrics.MetricsMiddleware",
+    "djangostock.application.tracing.TracingMiddleware",
+    "djangostock.application.profiling.QueryProfilingMiddleware",
+    "djangostock.application.compression.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -107,8 +112,23 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    # orjson-backed, set back to rest_framework's JSONRenderer and JSONParser to use the stdlib json
+    "DEFAULT_RENDERER_CLASSES": [
+        "djangostock.application.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "djangostock.application.renderers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
 }
 
+# Serve the async variants of the hot endpoints, djangostock.application.async_views, in place of their sync
+# views. Only for ASGI servers, a WSGI server would run an event loop for every request to them. Off until
+# ``manage.py benchmark_concurrency`` shows a gain: on Django 4.2 a request holds a thread either way.
+ASYNC_VIEWS = config("ASYNC_VIEWS", default=False, cast=bool)
+
 
 # ==============================================================================
 # SIMPLE JWT SETTINGS
@@ -131,6 +151,30 @@ CHANNEL_LAYERS = {
         # "BACKEND": "channels.layers.InMemoryChannelLayer",
     },
 }
+# ==============================================================================
+# CACHE SETTINGS
+# ==============================================================================
+# Shared by every web and worker process (circuit breaker state)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": config("CACHE_REDIS_URL", default="redis://127.0.0.1:6379/2"),
+    }
+}
+
+# ==============================================================================
+# SINGLE-FLIGHT LOCK SETTINGS
+# ==============================================================================
+SINGLE_FLIGHT_LOCKS = {
+    "BACKEND": "djangostock.application.locks.RedisLockBackend",
+    "CONFIG": {
+        "url": config("LOCK_REDIS_URL", default="redis://127.0.0.1:6379/1"),
+    },
+    # "BACKEND": "djangostock.application.locks.InMemoryLockBackend",
+}
+# Seconds an update_time_series run may take before its lock expires on its own
+UPDATE_TIME_SERIES_LOCK_TTL = 10 * 60
+
 # ==============================================================================
 # SESSION SETTINGS
 # ==============================================================================
@@ -148,6 +192,16 @@ DATABASES = {
     )
 }
 
+# Read replicas, for the views that djangostock.application.routers lets read from them. A user reads from the
+# primary for DATABASE_REPLICA_STICKINESS seconds after changing their follows, to see their own writes, and
+# everyone does after the data changed; it should cover the replicas' lag.
+_replica_urls = config("DATABASE_REPLICA_URLS", default="", cast=Csv())
+DATABASE_REPLICAS = [f"replica{n}" for n in range(len(_replica_urls))]
+for alias, url in zip(DATABASE_REPLICAS, _replica_urls):
+    DATABASES[alias] = {**dj_database_url.parse(url, conn_max_age=600), "TEST": {"MIRROR": "default"}}
+DATABASE_REPLICA_STICKINESS = config("DATABASE_REPLICA_STICKINESS", default=5, cast=float)
+DATABASE_ROUTERS = ["djangostock.application.routers.ReplicaRouter"]
+
 
 # ==============================================================================
 # AUTHENTICATION AND AUTHORIZATION SETTINGS
@@ -179,6 +233,28 @@ CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_ACCEPT_CONTENT = ["json"]
 
+# Bulk refreshes (ingest), WebSocket pushes (fanout) and user-triggered work (interactive) get their own
+# queues so that each can have its own workers; see docker-start/celery_worker.sh.
+CELERY_TASK_QUEUES = (
+    Queue("interactive", routing_key="interactive"),
+    Queue("fanout", routing_key="fanout"),
+    Queue("ingest", routing_key="ingest"),
+)
+CELERY_TASK_DEFAULT_QUEUE = "interactive"
+CELERY_TASK_ROUTES = {
+    "djangostock.application.tasks.update_time_series": {"queue": "ingest"},
+    "djangostock.application.tasks.periodic_update_time_series": {"queue": "ingest"},
+    "djangostock.application.tasks.sync_stock_catalog": {"queue": "ingest"},
+    "djangostock.application.tasks.ingest_time_series": {"queue": "ingest"},
+    "djangostock.application.tasks.create_time_series_partitions": {"queue": "ingest"},
+    "djangostock.application.tasks.archive_time_series": {"queue": "ingest"},
+    "djangostock.application.tasks.fan_out_stock_update": {"queue": "fanout"},
+}
+# RabbitMQ priorities, 0 (lowest) to 9; they only take effect with a low prefetch multiplier.
+CELERY_TASK_QUEUE_MAX_PRIORITY = 10
+CELERY_TASK_DEFAULT_PRIORITY = 5
+CELERY_WORKER_PREFETCH_MULTIPLIER = config("CELERY_WORKER_PREFETCH_MULTIPLIER", default=1, cast=int)
+
 # ==============================================================================
 # I18N AND L10N SETTINGS
 # ==============================================================================
@@ -234,3 +310,62 @@ MEDIA_ROOT = BASE_DIR.parent / "media"
 # ==============================================================================
 
 DJANGOSTOCK_ENVIRONMENT = config("DJANGOSTOCK_ENVIRONMENT", default="local")
+
+TWELVEDATA_BASE_URL = config("TWELVEDATA_BASE_URL", default="https://api.twelvedata.com")
+TWELVEDATA_TIMEOUT = config("TWELVEDATA_TIMEOUT", default=10, cast=int)
+# Shared by every process through the cache; the free plan allows 8 requests per minute
+TWELVEDATA_REQUESTS_PER_MINUTE = config("TWELVEDATA_REQUESTS_PER_MINUTE", default=8, cast=int)
+# See djangostock.application.circuit_breaker.CircuitBreaker
+TWELVEDATA_CIRCUIT_BREAKER = {
+    "failure_rate": 0.5,
+    "min_calls": 10,
+    "window": 60,
+    "open_seconds": 30,
+    "max_open_seconds": 30 * 60,
+}
+# How many times update_time_series is deferred while TwelveData is unavailable before giving up
+TWELVEDATA_MAX_DEFERRALS = 10
+
+# "celery" refreshes each stale stock in its own update_time_series task,
+# "asyncio" refreshes all of them in one ingest_time_series task (see djangostock.application.ingest)
+TIME_SERIES_REFRESH_ENGINE = config("TIME_SERIES_REFRESH_ENGINE", default="celery")
+INGEST_CONCURRENCY = config("INGEST_CONCURRENCY", default=32, cast=int)
+INGEST_BATCH_SIZE = config("INGEST_BATCH_SIZE", default=200, cast=int)
+
+# Range partitioning of StockTimeSeries by year, PostgreSQL only (see djangostock.application.partitions).
+# Applied by migration 0012, or later by `manage.py time_series_partitions --convert`.
+STOCK_TIME_SERIES_PARTITIONED = config("STOCK_TIME_SERIES_PARTITIONED", default=False, cast=bool)
+
+# Bars older than this many days are compacted into ArchivedTimeSeries (see djangostock.application.archive);
+# 0 keeps every bar in StockTimeSeries
+TIME_SERIES_ARCHIVE_AFTER_DAYS = config("TIME_SERIES_ARCHIVE_AFTER_DAYS", default=0, cast=int)
+
+# How long periodic_update_time_series waits before queueing a stock whose latest bar is still missing again
+STOCK_REFRESH_RETRY_INTERVAL = timedelta(hours=config("STOCK_REFRESH_RETRY_HOURS", default=6, cast=int))
+
+# Responses of at least this many bytes, and streaming ones, are compressed with brotli or gzip
+# (see djangostock.application.compression). Brotli's quality goes up to 11, 4 suits dynamic responses.
+RESPONSE_COMPRESSION_MIN_SIZE = config("RESPONSE_COMPRESSION_MIN_SIZE", default=1024, cast=int)
+RESPONSE_COMPRESSION_BROTLI_QUALITY = config("RESPONSE_COMPRESSION_BROTLI_QUALITY", default=4, cast=int)
+# Negotiate permessage-deflate on WebSockets when served by djangostock.server
+WEBSOCKET_PERMESSAGE_DEFLATE = config("WEBSOCKET_PERMESSAGE_DEFLATE", default=True, cast=bool)
+
+# Sampled query profiling of requests (see djangostock.application.profiling): the share of requests profiled,
+# and the query count, database and total time per request over which they are logged. A route's budget
+# (e.g. "stock/prices/") overrides the default one.
+QUERY_PROFILING = {
+    "SAMPLE_RATE": config("QUERY_PROFILING_SAMPLE_RATE", default=0.01, cast=float),
+    "BUDGETS": {
+        "default": {"queries": 20, "db_ms": 100, "total_ms": 500},
+        "stock/prices/": {"queries": 5, "db_ms": 50, "total_ms": 200},
+        "home/": {"queries": 10, "db_ms": 50, "total_ms": 200},
+    },
+}
+
+# Where finished spans go (see djangostock.application.tracing). FileExporter appends JSON lines to CONFIG's
+# "path", InMemoryExporter keeps them in the process.
+TRACING = {
+    "BACKEND": config("TRACING_BACKEND", default="djangostock.application.tracing.NullExporter"),
+    # "BACKEND": "djangostock.application.tracing.FileExporter",
+    # "CONFIG": {"path": "traces.jsonl"},
+}
@@ -8,3 +8,11 @@ PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
 CELERY_TASK_ALWAYS_EAGER = True
 
 CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+SINGLE_FLIGHT_LOCKS = {"BACKEND": "djangostock.application.locks.InMemoryLockBackend"}
+
+TRACING = {"BACKEND": "djangostock.application.tracing.InMemoryExporter"}
+
+CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+TWELVEDATA_REQUESTS_PER_MINUTE = 1_000_000
@@ -20,6 +20,7 @@ from django.conf import settings
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView, TokenVerifyView
 
 from .application import urls
+from .application.metrics import metrics_view
 
 
 urlpatterns = [
@@ -28,6 +29,7 @@ urlpatterns = [
     path("api/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("api/token/verify/", TokenVerifyView.as_view(), name="token_verify"),
+    path("metrics", metrics_view, name="metrics"),
 ]
 
 if settings.DEBUG:
@@ -1,3 +1,15 @@
 #!/bin/bash
 
-celery -A djangostock worker --loglevel=INFO
+# prometheus_client needs its directory emptied between runs: files of the processes of the previous run
+# would otherwise be added up with the new ones. The directory is this container's own.
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
+# One worker per queue group, e.g. CELERY_WORKER_QUEUES=ingest CELERY_WORKER_CONCURRENCY=8
+celery -A djangostock worker --loglevel=INFO \
+    --queues="${CELERY_WORKER_QUEUES:-interactive,fanout,ingest}" \
+    --hostname="${CELERY_WORKER_QUEUES:-all}@%h" \
+    --concurrency="${CELERY_WORKER_CONCURRENCY:-4}" \
+    --prefetch-multiplier="${CELERY_WORKER_PREFETCH_MULTIPLIER:-1}"
@@ -5,5 +5,11 @@ python manage.py collectstatic --no-input
 python manage.py migrate
 python djangostock/application/scripts/40_stocks_twelvedata.py
 python djangostock/application/scripts/start_periodic_tasks.py
-# Run daphne server
-daphne djangostock.asgi:application -b 0.0.0.0 -p 8000
+# prometheus_client needs its directory emptied between runs: files of the processes of the previous run, and
+# of the commands above, would otherwise be added up with the new ones. The directory is this container's own.
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+# Run daphne server, with permessage-deflate on WebSockets
+python -m djangostock.server djangostock.asgi:application -b 0.0.0.0 -p 8000